@@ -86,6 +86,8 @@ setup(
     entry_points={
         'console_scripts': [
             'sipplauncher = sipplauncher.main:my_main_fun',
+            'sipplauncher-archive = sipplauncher.Archiver:main',
+            'sipplauncher-pcap = sipplauncher.PcapWriter:main',
         ],
     },
 
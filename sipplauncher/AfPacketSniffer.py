@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import logging
+import time
+import mmap
+import select
+import socket
+import struct
+import multiprocessing
+from scapy.arch.common import compile_filter
+from scapy.data import SO_ATTACH_FILTER
+from .PcapWriter import (PcapWriter,
+                         DLT_EN10MB,
+                         PROFILE_FULL)
+
+logger = logging.getLogger(__name__)
+
+# <linux/if_packet.h>
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+PACKET_OUTGOING = 4
+ETH_P_ALL = 0x0003
+# <linux/if_arp.h>: link types, which have an Ethernet header. Loopback frames have it as well.
+ARPHRD_ETHER = 1
+ARPHRD_LOOPBACK = 772
+ETHERNET_HATYPES = (ARPHRD_ETHER, ARPHRD_LOOPBACK)
+
+# Ring geometry. A block is handed to us, when it's full or when it's been open for BLOCK_TIMEOUT_MS.
+BLOCK_SIZE = 1 << 20
+BLOCK_COUNT = 8
+FRAME_SIZE = 1 << 11
+BLOCK_TIMEOUT_MS = 100
+
+# struct tpacket_block_desc: version, offset_to_priv, then struct tpacket_hdr_v1
+BLOCK_STATUS_OFFSET = 8
+block_hdr = struct.Struct("<III")  # block_status, num_pkts, offset_to_first_pkt
+# struct tpacket3_hdr: tp_next_offset, tp_sec, tp_nsec, tp_snaplen, tp_len, tp_status, tp_mac
+pkt_hdr = struct.Struct("<IIIIIIH")
+# struct sockaddr_ll follows TPACKET_ALIGN(sizeof(struct tpacket3_hdr)): sll_ifindex, sll_hatype, sll_pkttype
+SLL_OFFSET = 48 + 4
+sll_hdr = struct.Struct("<iHB")
+# struct tpacket_stats_v3: tp_packets, tp_drops, tp_freeze_q_cnt
+stats_hdr = struct.Struct("<III")
+
+
+def wait_retired(since=None):
+    """
+    Waits until the kernel hands over the blocks, which hold the frames captured before the given time.
+    A block is retired within BLOCK_TIMEOUT_MS, so there is nothing to wait for,
+    if the caller has already waited long enough, for ex. for a whole group of tests at once.
+
+    :param since: time.monotonic() of the last frame to wait for, or None if it's now
+    :type since: float
+    """
+    now = time.monotonic()
+    delay = (now if since is None else since) + 2 * BLOCK_TIMEOUT_MS / 1000 - now
+    if delay > 0:
+        time.sleep(delay)
+
+
+class Ring(object):
+    """
+    Memory-mapped TPACKET_V3 ring of an AF_PACKET socket, which receives frames of all the interfaces.
+
+    The BPF filter is applied by the kernel, so only the matching frames are copied to the ring.
+    Frames are never turned into Python packet objects.
+
+    The filter is compiled for Ethernet and frames are written to pcap files labelled as Ethernet.
+    So frames of interfaces without an Ethernet header (tun, wireguard, ppp, etc.) are skipped:
+    the filter has been applied at wrong offsets to them, and they can't be written as is.
+    """
+    def __init__(self, filter):
+        """
+        :param filter: BPF filter in tcpdump syntax
+        :type filter: str
+        """
+        self.__sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        try:
+            # The filter is attached before the ring is set up, so the ring never holds unfiltered frames
+            self.__sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+            self.__sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, compile_filter(filter, linktype=DLT_EN10MB))
+            self.__sock.setsockopt(SOL_PACKET, PACKET_RX_RING, struct.pack("<IIIIIII",
+                                                                            BLOCK_SIZE,
+                                                                            BLOCK_COUNT,
+                                                                            FRAME_SIZE,
+                                                                            BLOCK_SIZE // FRAME_SIZE * BLOCK_COUNT,
+                                                                            BLOCK_TIMEOUT_MS,
+                                                                            0,
+                                                                            0))
+            self.__ring = mmap.mmap(self.__sock.fileno(), BLOCK_SIZE * BLOCK_COUNT,
+                                    mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        except:
+            self.__sock.close()
+            raise
+        self.__view = memoryview(self.__ring)
+        self.__block = 0
+        self.__drops = 0
+        # Loopback frames are seen twice: as outgoing and as incoming
+        self.__lo = socket.if_nametoindex("lo")
+
+    def fileno(self):
+        return self.__sock.fileno()
+
+    def read(self, callback):
+        """
+        Passes the frames of all the blocks, which the kernel has handed to us, to the callback.
+
+        :param callback: called with capture timestamp seconds, microseconds, copy of the frame bytes and original frame length
+        :type callback: callable(int, int, bytes, int)
+
+        :returns: whether any block has been read
+        :rtype: bool
+        """
+        ret = False
+        view = self.__view
+        while True:
+            offset = self.__block * BLOCK_SIZE
+            status, num_pkts, pkt_offset = block_hdr.unpack_from(view, offset + BLOCK_STATUS_OFFSET)
+            if not status & TP_STATUS_USER:
+                return ret
+            pkt_offset += offset
+            for i in range(num_pkts):
+                next_offset, sec, nsec, snaplen, length, status, mac = pkt_hdr.unpack_from(view, pkt_offset)
+                ifindex, hatype, pkttype = sll_hdr.unpack_from(view, pkt_offset + SLL_OFFSET)
+                # Frames without an Ethernet header are skipped, see above
+                if hatype in ETHERNET_HATYPES and not (ifindex == self.__lo and pkttype == PACKET_OUTGOING):
+                    # The block is handed back to the kernel, so the frame is copied
+                    callback(sec, nsec // 1000, bytes(view[pkt_offset + mac:pkt_offset + mac + snaplen]), length)
+                pkt_offset += next_offset
+            # Hand the block back to the kernel
+            struct.pack_into("<I", view, offset + BLOCK_STATUS_OFFSET, TP_STATUS_KERNEL)
+            self.__block = (self.__block + 1) % BLOCK_COUNT
+            ret = True
+
+    def get_drops(self):
+        """
+        :returns: number of frames, dropped by the kernel, because the ring was full
+        :rtype: int
+        """
+        # The kernel resets the counters on every read
+        self.__drops += stats_hdr.unpack(self.__sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, stats_hdr.size))[1]
+        return self.__drops
+
+    def close(self):
+        self.__view.release()
+        self.__ring.close()
+        self.__sock.close()
+
+
+class CaptureProcess(multiprocessing.Process):
+    """
+    Reads frames from a Ring and writes them to a pcap file as is.
+    The capture doesn't share the GIL with the orchestrator.
+    """
+    def __init__(self, filter, folder, name, rotate_bytes, rotate_seconds, profile, signaling_ports, stop_event, conn):
+        """
+        :param filter: BPF filter in tcpdump syntax
+        :type filter: str
+
+        :param folder: folder to write pcap files to
+        :type folder: str
+
+        :param name: pcap file name without extension
+        :type name: str
+
+        :param rotate_bytes: pcap file rotation size, or None
+        :type rotate_bytes: int
+
+        :param rotate_seconds: pcap file rotation period, or None
+        :type rotate_seconds: int
+
+        :param profile: capture profile, one of PcapWriter.PROFILES
+        :type profile: str
+
+        :param signaling_ports: SIP and DNS ports
+        :type signaling_ports: list(int)
+
+        :param stop_event: set by the parent to stop capturing
+        :type stop_event: multiprocessing.Event
+
+        :param conn: the process sends None or an error message once it's capturing, and (packets, drops) once it's finished
+        :type conn: multiprocessing.connection.Connection
+        """
+        super().__init__()
+        self.__filter = filter
+        self.__folder = folder
+        self.__name = name
+        self.__rotate_bytes = rotate_bytes
+        self.__rotate_seconds = rotate_seconds
+        self.__profile = profile
+        self.__signaling_ports = signaling_ports
+        self.__stop_event = stop_event
+        self.__conn = conn
+
+    def run(self):
+        try:
+            ring = Ring(self.__filter)
+            writer = PcapWriter(self.__folder, self.__name, self.__rotate_bytes, self.__rotate_seconds,
+                                self.__profile, self.__signaling_ports)
+        except Exception as e:
+            self.__conn.send(str(e))
+            return
+        self.__conn.send(None)
+
+        try:
+            poller = select.poll()
+            poller.register(ring, select.POLLIN | select.POLLERR)
+            while True:
+                # The parent sets the event once the blocks with the last frames have been retired.
+                # So they are read before stopping.
+                stopping = self.__stop_event.is_set()
+                if ring.read(writer.write):
+                    continue
+                if stopping:
+                    break
+                poller.poll(BLOCK_TIMEOUT_MS)
+        finally:
+            writer.close()
+        drops = ring.get_drops()
+        ring.close()
+        self.__conn.send((writer.packets, drops))
+
+
+class AfPacketSniffer(object):
+    """
+    Has the same interface as SIPpSniffer, but captures in a separate process from an AF_PACKET ring.
+    """
+    def __init__(self, interface, rotate_bytes=None, rotate_seconds=None, profile=PROFILE_FULL):
+        self.__interface = interface
+        self.__rotate_bytes = rotate_bytes
+        self.__rotate_seconds = rotate_seconds
+        self.__profile = profile
+        self.__process = None
+        self.__stop_event = None
+        self.__conn = None
+        logger.debug('Created AF_PACKET sniffer for interface {0}'.format(interface))
+
+    def start(self, filter, folder, signaling_ports=()):
+        logger.debug('Starting AF_PACKET sniffer for interface {0} and filter {1}'.format(self.__interface, filter))
+        assert(not self.__process)
+        self.__stop_event = multiprocessing.Event()
+        self.__conn, child_conn = multiprocessing.Pipe(duplex=False)
+        self.__process = CaptureProcess(filter,
+                                        folder,
+                                        self.__interface,
+                                        self.__rotate_bytes,
+                                        self.__rotate_seconds,
+                                        self.__profile,
+                                        list(signaling_ports),
+                                        self.__stop_event,
+                                        child_conn)
+        # Same reasoning as for SIPpTest threads in Run.run()
+        self.__process.daemon = True
+        self.__process.start()
+        child_conn.close()
+        # Need to wait for the ring to be set up.
+        # Otherwise we might start SIP dialogs before capturing, and miss some initial messages.
+        error = self.__recv()
+        if error:
+            self.__process.join()
+            self.__reset()
+            raise Exception('Unable to start AF_PACKET sniffer: {0}'.format(error))
+        logger.debug('Started AF_PACKET sniffer for interface {0}'.format(self.__interface))
+
+    def __recv(self):
+        # Issue #35: Busy-loop wait.
+        # Otherwise we could wait forever if the process terminates without sending anything.
+        while not self.__conn.poll(1):
+            if not self.__process.is_alive():
+                raise Exception("Capture process has terminated unexpectedly")
+        return self.__conn.recv()
+
+    def stop(self, since=None):
+        """
+        :param since: time.monotonic(), after which there are no more frames to capture, or None if it's now
+        :type since: float
+
+        :returns: number of captured frames and number of frames, dropped by the kernel, or None if the sniffer hasn't been started
+        :rtype: (int, int)
+        """
+        if not self.__process:
+            return None
+        logger.debug('Stopping AF_PACKET sniffer for interface {0}'.format(self.__interface))
+        wait_retired(since)
+        self.__stop_event.set()
+        try:
+            packets, drops = self.__recv()
+        finally:
+            self.__process.join()
+            self.__reset()
+        if drops:
+            logger.warning('Captured {0} packets for interface {1}, {2} packets dropped by the kernel'.format(packets, self.__interface, drops))
+        else:
+            logger.debug('Captured {0} packets for interface {1}'.format(packets, self.__interface))
+        return packets, drops
+
+    def __reset(self):
+        # restore defaults to be able to start() again
+        self.__conn.close()
+        self.__process = None
+        self.__stop_event = None
+        self.__conn = None
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import argparse
+import logging
+import os
+import sys
+import shutil
+import threading
+import queue
+import time
+import json
+import gzip
+import tarfile
+import tempfile
+
+# zstd compression is optional.
+# It's enabled only if `zstandard` package is installed.
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from .utils.Defaults import (DEFAULT_WORK_FOLDER_HIGH_WATERMARK,
+                             DEFAULT_ARCHIVE_FORMAT,
+                             DEFAULT_ARCHIVE_WORKERS)
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_PERIOD = 0.1 # sec
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+COPY_BUFSIZE = 1024 * 1024
+
+# Supported values of `--archive-format`
+ARCHIVE_FORMAT_DIR = "dir"
+ARCHIVE_FORMAT_GZ = "tar.gz"
+ARCHIVE_FORMAT_ZST = "tar.zst"
+ARCHIVE_FORMATS = [ARCHIVE_FORMAT_DIR, ARCHIVE_FORMAT_GZ, ARCHIVE_FORMAT_ZST]
+
+INDEX_EXT = "index"
+
+# Suffix of a test run folder, which is being moved to the archive folder
+PARTIAL_SUFFIX = ".partial"
+
+
+class ArchiveException(Exception):
+    pass
+
+
+class _Slice(object):
+    """
+    Read-only file-like view on a part of a file.
+    It allows to decompress a single archive member without reading the whole archive.
+    """
+    def __init__(self, f, offset, length):
+        self.__f = f
+        self.__remaining = length
+        self.__f.seek(offset)
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.__remaining:
+            size = self.__remaining
+        data = self.__f.read(size)
+        self.__remaining -= len(data)
+        return data
+
+
+class Archiver(object):
+    """
+    Moves finished test run folders from the work folder to persistent storage.
+
+    Archiving is done by background worker threads, so the scheduler doesn't wait for disk I/O.
+    This is useful when the work folder is backed by tmpfs:
+    tests write their logs and pcaps to memory, and the archiver drains them to disk.
+
+    Depending on the archive format, a test run folder is either moved as is,
+    or is streamed into a compressed tar member, which is appended to a single archive file.
+    Every member is an independent compressed stream,
+    so its offset and length, recorded in the index file, are enough to extract a single test run.
+    """
+    def __init__(self, work_folder, archive_folder, archive_format=DEFAULT_ARCHIVE_FORMAT, workers=DEFAULT_ARCHIVE_WORKERS,
+                 instance_id=None):
+        """
+        :param work_folder: root folder, where test run folders are created
+        :type work_folder: str
+
+        :param archive_folder: root folder, to which test run folders are archived
+        :type archive_folder: str
+
+        :param archive_format: one of ARCHIVE_FORMATS
+        :type archive_format: str
+
+        :param workers: number of background worker threads
+        :type workers: int
+
+        :param instance_id: ID of this instance to tell its archives from the archives of other instances, or None to use the PID
+        :type instance_id: str
+        """
+        assert(archive_format in ARCHIVE_FORMATS)
+        if archive_format == ARCHIVE_FORMAT_ZST and not zstandard:
+            raise ArchiveException("Please install zstandard package to use {0} archive format".format(archive_format))
+
+        self.__work_folder = os.path.abspath(work_folder)
+        self.__archive_folder = os.path.abspath(archive_folder)
+        self.__format = archive_format
+        self.__archive = None
+        self.__index = None
+        self.__lock = threading.Lock()
+
+        if self.__format != ARCHIVE_FORMAT_DIR:
+            os.makedirs(self.__archive_folder, exist_ok=True)
+            # Several instances, or a restart within the same second, shouldn't write to the same archive.
+            # Otherwise offsets in the index would point into somebody else's data.
+            name = "sipplauncher-{0}-{1}.{2}".format(time.strftime("%Y%m%d-%H%M%S"),
+                                                     instance_id if instance_id else os.getpid(),
+                                                     self.__format)
+            self.archive_path = os.path.join(self.__archive_folder, name)
+            self.__archive = open(self.archive_path, "xb")
+            try:
+                self.__index = open("{0}.{1}".format(self.archive_path, INDEX_EXT), "x")
+            except:
+                self.__archive.close()
+                raise
+
+        self.__queue = queue.Queue()
+        self.__threads = []
+        for i in range(max(1, workers)):
+            thread = threading.Thread(target=self.__run)
+            # Same reasoning as for SIPpTest threads in Run.run():
+            # we want the thread to exit when main thread ends.
+            thread.setDaemon(True)
+            thread.start()
+            self.__threads.append(thread)
+        logger.debug('Started archiver from "{0}" to "{1}" ({2})'.format(self.__work_folder, self.__archive_folder, self.__format))
+
+    def submit(self, folder):
+        """
+        Schedules a test run folder to be archived.
+        The folder shouldn't be modified after it has been submitted.
+
+        :param folder: test run folder inside the work folder
+        :type folder: str
+        """
+        self.__queue.put(os.path.abspath(folder))
+
+    def throttle(self):
+        """
+        Blocks while the work folder is too full and there is pending archiving, which will free it.
+        """
+        while self.__queue.unfinished_tasks and self.__is_work_folder_full():
+            time.sleep(THROTTLE_PERIOD)
+
+    def stop(self):
+        """
+        Waits for all the submitted folders to be archived and stops the background threads.
+        """
+        for thread in self.__threads:
+            self.__queue.put(None)
+        for thread in self.__threads:
+            thread.join()
+        if self.__archive:
+            self.__archive.close()
+            self.__index.close()
+        logger.debug('Stopped archiver from "{0}" to "{1}"'.format(self.__work_folder, self.__archive_folder))
+
+    def __is_work_folder_full(self):
+        st = os.statvfs(self.__work_folder)
+        if not st.f_blocks:
+            return False
+        used = 1.0 - float(st.f_bavail) / st.f_blocks
+        return used > DEFAULT_WORK_FOLDER_HIGH_WATERMARK
+
+    def __run(self):
+        while True:
+            folder = self.__queue.get()
+            try:
+                if folder is None:
+                    break
+                self._archive(folder)
+            except BaseException as e:
+                # Archiving of a single folder has failed.
+                # This shouldn't stop archiving of other folders.
+                logger.error('Unable to archive "{0}": {1}'.format(folder, e))
+                logger.debug(e, exc_info = True)
+            finally:
+                self.__queue.task_done()
+
+    def _get_relpath(self, folder):
+        """
+        :returns: path of a test run folder relative to the work folder, i.e. "<test_name>/<test_run_id>"
+        :rtype: str
+        """
+        return os.path.relpath(folder, self.__work_folder)
+
+    def _remove_from_work_folder(self, folder):
+        shutil.rmtree(folder, ignore_errors=True)
+        try:
+            # Remove <test_name> folder, if this was its last test run
+            os.rmdir(os.path.dirname(folder))
+        except OSError:
+            pass
+
+    def _archive(self, folder):
+        if self.__format == ARCHIVE_FORMAT_DIR:
+            self.__move(folder)
+        else:
+            self.__compress(folder)
+        self._remove_from_work_folder(folder)
+
+    def __move(self, folder):
+        dst = os.path.join(self.__archive_folder, self._get_relpath(folder))
+        logger.debug('Moving "{0}" to "{1}"'.format(folder, dst))
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        # Moving across filesystems is copying.
+        # Don't expose a half-copied folder under its final name.
+        shutil.move(folder, dst + PARTIAL_SUFFIX)
+        os.rename(dst + PARTIAL_SUFFIX, dst)
+
+    def __compress(self, folder):
+        relpath = self._get_relpath(folder)
+        logger.debug('Compressing "{0}" to "{1}"'.format(folder, self.archive_path))
+
+        # Compress outside of the lock, so workers compress concurrently.
+        # Compressors release the GIL while crunching data.
+        # Links are stored as the files they point to,
+        # so an archived test run doesn't depend on the test suite and is extracted safely.
+        with tempfile.TemporaryFile(dir=self.__archive_folder) as tmp:
+            if self.__format == ARCHIVE_FORMAT_GZ:
+                with gzip.GzipFile(fileobj=tmp, mode="wb", compresslevel=GZIP_LEVEL) as stream:
+                    with tarfile.open(fileobj=stream, mode="w|", dereference=True) as tar:
+                        tar.add(folder, arcname=relpath)
+            else:
+                stream = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(tmp)
+                with tarfile.open(fileobj=stream, mode="w|", dereference=True) as tar:
+                    tar.add(folder, arcname=relpath)
+                # Don't close the stream: it closes the underlying file
+                stream.flush(zstandard.FLUSH_FRAME)
+
+            tmp.seek(0)
+            with self.__lock:
+                offset = self.__archive.tell()
+                shutil.copyfileobj(tmp, self.__archive, COPY_BUFSIZE)
+                self.__archive.flush()
+                test_name, run_id = os.path.split(relpath)
+                entry = {
+                    "test": test_name,
+                    "run_id": run_id,
+                    "offset": offset,
+                    "length": self.__archive.tell() - offset,
+                }
+                self.__index.write(json.dumps(entry) + "\n")
+                self.__index.flush()
+
+
+def read_index(archive_path):
+    """
+    :param archive_path: path to the archive file
+    :type archive_path: str
+
+    :returns: index entries of the archive
+    :rtype: list(dict)
+    """
+    entries = []
+    with open("{0}.{1}".format(archive_path, INDEX_EXT), "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return entries
+
+
+def _get_safe_members(tar, folder):
+    """
+    Yields members of the tar stream, which are extracted inside the folder.
+    This is what filter="data" of tarfile.extractall() does on Python versions, which have it.
+
+    :raises: ArchiveException on a member with an absolute path, a path outside the folder, or a special file
+    """
+    folder = os.path.realpath(folder)
+
+    def check(name):
+        path = os.path.realpath(os.path.join(folder, name))
+        if os.path.isabs(name) or os.path.commonpath([folder, path]) != folder:
+            raise ArchiveException('Refusing to extract "{0}" outside of "{1}"'.format(name, folder))
+
+    for member in tar:
+        check(member.name)
+        if member.issym():
+            check(os.path.join(os.path.dirname(member.name), member.linkname))
+        elif member.islnk():
+            check(member.linkname)
+        elif not (member.isfile() or member.isdir()):
+            raise ArchiveException('Refusing to extract special file "{0}"'.format(member.name))
+        yield member
+
+
+def extract(archive_path, test_name, run_id, folder):
+    """
+    Extracts test run folders from the archive without decompressing the rest of the archive.
+
+    :param archive_path: path to the archive file
+    :type archive_path: str
+
+    :param test_name: name of a test to extract
+    :type test_name: str
+
+    :param run_id: test run ID to extract, or None to extract all runs of the test
+    :type run_id: str
+
+    :param folder: folder to extract to
+    :type folder: str
+
+    :returns: number of extracted test runs
+    :rtype: int
+    """
+    entries = [e for e in read_index(archive_path)
+               if e["test"] == test_name and (run_id is None or e["run_id"] == run_id)]
+    with open(archive_path, "rb") as f:
+        for e in entries:
+            member = _Slice(f, e["offset"], e["length"])
+            if archive_path.endswith(ARCHIVE_FORMAT_ZST):
+                if not zstandard:
+                    raise ArchiveException("Please install zstandard package to extract {0}".format(archive_path))
+                stream = zstandard.ZstdDecompressor().stream_reader(member)
+            else:
+                stream = gzip.GzipFile(fileobj=member, mode="rb")
+            with tarfile.open(fileobj=stream, mode="r|") as tar:
+                # Archives could come from elsewhere, so members shouldn't escape the folder
+                if hasattr(tarfile, "data_filter"):
+                    tar.extractall(folder, filter="data")
+                else:
+                    tar.extractall(folder, members=_get_safe_members(tar, folder))
+    return len(entries)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="sipplauncher-archive",
+                                     description="List or extract test runs from a Sipplauncher archive")
+    parser.add_argument("archive", help="path to the archive file")
+    parser.add_argument("--test", help="name of a test to extract. If not specified, test runs are listed")
+    parser.add_argument("--run-id", help="test run ID to extract. Default: all runs of the test")
+    parser.add_argument("--output", default=".", help="folder to extract to. Default: current working directory")
+    args = parser.parse_args()
+
+    if not args.test:
+        for e in read_index(args.archive):
+            print("{0}/{1}".format(e["test"], e["run_id"]))
+        return
+
+    count = extract(args.archive, args.test, args.run_id, args.output)
+    if not count:
+        sys.stderr.write("No test runs found for {0}\n".format(args.test))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
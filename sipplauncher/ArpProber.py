@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import logging
+import threading
+import time
+from scapy.sendrecv import srp
+from scapy.layers.l2 import Ether, ARP
+from .Topology import topology
+
+logger = logging.getLogger(__name__)
+
+RECEIVE_WINDOW = 0.2 # sec
+RESULT_TTL = 30 # sec
+CACHE_CLEANUP_SIZE = 4096
+
+
+class ArpProber(object):
+    """
+    Checks whether IP addresses are used by other machines in the LAN.
+
+    All the addresses of a batch are ARP-probed with a single broadcast burst,
+    and replies are collected in a single receive window.
+    The burst is sent only on the interface, which routes to the probed addresses.
+    Results are cached for RESULT_TTL seconds and are shared by all the tests.
+    """
+    def __init__(self, is_excluded_iface):
+        """
+        :param is_excluded_iface: callback, which returns True for interfaces, which shouldn't be used for probing
+        :type is_excluded_iface: callable(str)
+        """
+        self.__is_excluded_iface = is_excluded_iface
+        # ip -> (in_use, timestamp)
+        self.__cache = {}
+        self.__lock = threading.Lock()
+
+    def probe(self, ips):
+        """
+        :param ips: addresses to probe
+        :type ips: list(str)
+
+        :returns: addresses, which are used by other machines
+        :rtype: set(str)
+        """
+        with self.__lock:
+            now = time.monotonic()
+            in_use = set()
+            by_iface = {}
+            for ip in ips:
+                cached = self.__cache.get(ip)
+                if cached and now - cached[1] < RESULT_TTL:
+                    if cached[0]:
+                        in_use.add(ip)
+                    continue
+                iface = topology.get_route_interface(ip, self.__is_excluded_iface)
+                if iface:
+                    by_iface.setdefault(iface, []).append(ip)
+                else:
+                    # Nothing to ARP on: the address isn't reachable on L2
+                    logger.debug('No route to IP "{0}", skipping ARP probing'.format(ip))
+                    self.__cache[ip] = (False, now)
+
+            for iface, batch in by_iface.items():
+                answered = self.__probe_on_iface(iface, batch)
+                now = time.monotonic()
+                for ip in batch:
+                    self.__cache[ip] = (ip in answered, now)
+                in_use |= answered
+
+            self.__expire(now)
+            return in_use
+
+    @staticmethod
+    def __probe_on_iface(iface, ips):
+        """ Performs ARP-ping on L2.
+        http://www.aviran.org/arp-ping-with-python-and-scapy/
+        """
+        logger.debug('ARP-probing {0} addresses on interface "{1}"'.format(len(ips), iface))
+        # Scapy generates a packet for every pdst element
+        answered, unanswered = srp(Ether(dst="ff:ff:ff:ff:ff:ff") / ARP(pdst=ips),
+                                   timeout=RECEIVE_WINDOW,
+                                   verbose=False,
+                                   iface=iface)
+        return set(received[ARP].psrc for sent, received in answered)
+
+    def __expire(self, now):
+        # Keep the cache bounded by dropping stale results
+        if len(self.__cache) > CACHE_CLEANUP_SIZE:
+            self.__cache = dict((ip, v) for ip, v in self.__cache.items() if now - v[1] < RESULT_TTL)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import logging
+import select
+import threading
+import ipaddress
+import multiprocessing
+from .AfPacketSniffer import (Ring,
+                              BLOCK_TIMEOUT_MS,
+                              wait_retired)
+from .PcapWriter import (PcapWriter,
+                         PROFILE_FULL,
+                         classify)
+
+logger = logging.getLogger(__name__)
+
+CMD_REGISTER = "register"
+CMD_UNREGISTER = "unregister"
+CMD_STOP = "stop"
+
+
+class EngineProcess(multiprocessing.Process):
+    """
+    Captures the traffic of all the tests from a single Ring,
+    and appends every frame to the pcap files of the tests, which own its source or destination endpoint.
+    """
+    def __init__(self, filter, rotate_bytes, rotate_seconds, profile, conn):
+        """
+        :param filter: BPF filter in tcpdump syntax, which matches the traffic of all the tests
+        :type filter: str
+
+        :param rotate_bytes: pcap file rotation size, or None
+        :type rotate_bytes: int
+
+        :param rotate_seconds: pcap file rotation period, or None
+        :type rotate_seconds: int
+
+        :param profile: capture profile, one of PcapWriter.PROFILES
+        :type profile: str
+
+        :param conn: connection to receive commands and send replies through
+        :type conn: multiprocessing.connection.Connection
+        """
+        super().__init__()
+        self.__filter = filter
+        self.__rotate_bytes = rotate_bytes
+        self.__rotate_seconds = rotate_seconds
+        self.__profile = profile
+        self.__conn = conn
+        # packed IP -> [(name, first port, last port)], ports are None if the IP isn't shared
+        self.__table = {}
+        # name -> PcapWriter
+        self.__writers = {}
+
+    def run(self):
+        try:
+            ring = Ring(self.__filter)
+        except Exception as e:
+            self.__conn.send(str(e))
+            return
+        self.__conn.send(None)
+
+        poller = select.poll()
+        poller.register(ring, select.POLLIN | select.POLLERR)
+        poller.register(self.__conn, select.POLLIN)
+        try:
+            while True:
+                busy = ring.read(self.__write)
+                while self.__conn.poll():
+                    busy = True
+                    cmd = self.__conn.recv()
+                    # The caller has waited for the blocks with the last frames of the test to be retired.
+                    # Read them before handling the command.
+                    ring.read(self.__write)
+                    if cmd[0] == CMD_STOP:
+                        return
+                    self.__conn.send(self.__handle(*cmd))
+                if not busy:
+                    poller.poll(BLOCK_TIMEOUT_MS)
+        finally:
+            for writer in self.__writers.values():
+                writer.close()
+            drops = ring.get_drops()
+            ring.close()
+            self.__conn.send(drops)
+
+    def __handle(self, cmd, name, *params):
+        if cmd == CMD_REGISTER:
+            folder, endpoints, signaling_ports = params
+            try:
+                self.__writers[name] = PcapWriter(folder, name, self.__rotate_bytes, self.__rotate_seconds,
+                                                  self.__profile, signaling_ports)
+            except Exception as e:
+                return str(e)
+            for ip, first_port, last_port in endpoints:
+                self.__table.setdefault(ipaddress.ip_address(ip).packed, []).append((name, first_port, last_port))
+            return None
+        if cmd == CMD_UNREGISTER:
+            for ip in list(self.__table):
+                entries = [e for e in self.__table[ip] if e[0] != name]
+                if entries:
+                    self.__table[ip] = entries
+                else:
+                    del self.__table[ip]
+            writer = self.__writers.pop(name, None)
+            if writer is None:
+                return 0
+            writer.close()
+            return writer.packets
+
+    def __write(self, sec, usec, frame, length):
+        fields = classify(frame)
+        if not fields:
+            return
+        src, dst, sport, dport = fields
+        names = set()
+        for ip, port in ((src, sport), (dst, dport)):
+            for name, first_port, last_port in self.__table.get(ip, ()):
+                if first_port is None or (port is not None and first_port <= port <= last_port):
+                    names.add(name)
+        for name in names:
+            self.__writers[name].write(sec, usec, frame, length)
+
+
+class CaptureEngine(object):
+    """
+    Host-wide capture, shared by all the tests of this instance.
+    Tests register their endpoints instead of starting their own sniffers,
+    so capture cost depends on the number of packets, not on the number of running tests.
+    """
+    def __init__(self, filter, rotate_bytes=None, rotate_seconds=None, profile=PROFILE_FULL):
+        """
+        :param filter: BPF filter in tcpdump syntax, which matches the traffic of all the tests
+        :type filter: str
+
+        :param rotate_bytes: pcap file rotation size, or None
+        :type rotate_bytes: int
+
+        :param rotate_seconds: pcap file rotation period, or None
+        :type rotate_seconds: int
+
+        :param profile: capture profile, one of PcapWriter.PROFILES
+        :type profile: str
+        """
+        self.__conn, child_conn = multiprocessing.Pipe()
+        self.__process = EngineProcess(filter, rotate_bytes, rotate_seconds, profile, child_conn)
+        # Same reasoning as for SIPpTest threads in Run.run()
+        self.__process.daemon = True
+        self.__lock = threading.Lock()
+        logger.debug('Starting capture engine with filter {0}'.format(filter))
+        self.__process.start()
+        child_conn.close()
+        error = self.__recv()
+        if error:
+            self.__process.join()
+            raise Exception('Unable to start capture engine: {0}'.format(error))
+
+    def __recv(self):
+        # Issue #35: Busy-loop wait.
+        # Otherwise we could wait forever if the process terminates without sending anything.
+        while not self.__conn.poll(1):
+            if not self.__process.is_alive():
+                raise Exception("Capture engine has terminated unexpectedly")
+        return self.__conn.recv()
+
+    def __call(self, *cmd):
+        with self.__lock:
+            self.__conn.send(cmd)
+            return self.__recv()
+
+    def register(self, name, folder, endpoints, signaling_ports=()):
+        """
+        Starts capturing the traffic of the endpoints to "<folder>/<name>.pcap".
+
+        :param name: pcap file name without extension, unique among running tests
+        :type name: str
+
+        :param folder: folder to write pcap files to
+        :type folder: str
+
+        :param endpoints: IP, first and last port of every endpoint. Ports are None, if the IP isn't shared with other tests
+        :type endpoints: list((str, int, int))
+
+        :param signaling_ports: SIP and DNS ports
+        :type signaling_ports: iterable(int)
+        """
+        error = self.__call(CMD_REGISTER, name, folder, endpoints, list(signaling_ports))
+        if error:
+            raise Exception('Unable to start capturing to {0}: {1}'.format(name, error))
+        logger.debug('Started capturing to {0}'.format(name))
+
+    def unregister(self, name, since=None):
+        """
+        :param since: time.monotonic(), after which the endpoints have no more traffic to capture, or None if it's now.
+                      Run.run() waits once for all the tests of a group, so usually there is nothing left to wait for.
+        :type since: float
+
+        :returns: number of captured packets
+        :rtype: int
+        """
+        # Let the kernel hand over the block, which holds the last captured frames
+        wait_retired(since)
+        packets = self.__call(CMD_UNREGISTER, name)
+        logger.debug('Captured {0} packets to {1}'.format(packets, name))
+        return packets
+
+    def stop(self):
+        with self.__lock:
+            self.__conn.send((CMD_STOP,))
+            drops = self.__recv()
+        self.__process.join()
+        self.__conn.close()
+        if drops:
+            logger.warning('Capture engine: {0} packets dropped by the kernel'.format(drops))
@@ -282,7 +282,13 @@ class DnsServer(DNSServer):
             cls.instance = super().__new__(cls)
             # Issue #44: perform initialization here and not in __init__().
             # See the comment below, which explains this in detail.
-            super(DnsServer, cls.instance).__init__(resolver=Resolver(), logger=Logger())
+            try:
+                # Dual-stack socket serves both IPv4 and IPv6 DUTs
+                super(DnsServer, cls.instance).__init__(resolver=Resolver(), logger=Logger(), address="::")
+            except OSError as e:
+                # IPv6 is disabled on the host
+                logging.debug("Unable to listen on IPv6, falling back to IPv4: {0}".format(e))
+                super(DnsServer, cls.instance).__init__(resolver=Resolver(), logger=Logger())
             cls.instance.start_thread()
         return cls.instance
 
@@ -46,7 +46,7 @@ class GlobalTest(SIPpTest):
         self.run_id_number = sipplauncher.utils.Utils.generate_id(n=12, just_digits=True)
         self._set_state(SIPpTest.State.PREPARING)
         self._print_run_state(run_id_prefix)
-        self._create_temp_folder()
+        self._create_temp_folder(args)
         self._init_logger()
         try:
             self._replace_keywords(args)
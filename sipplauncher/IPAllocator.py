@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import logging
+import time
+import random
+import threading
+import ipaddress
+import collections
+from math import gcd
+
+logger = logging.getLogger(__name__)
+
+PROBE_BATCH = 32
+# Random allocation gives up, if it keeps hitting used addresses
+RANDOM_ATTEMPTS = 64
+# Used and excluded addresses are checked again after this period, in seconds.
+# It's the same as ArpProber.RESULT_TTL: probing an address earlier would just hit the prober cache.
+RETRY_INTERVAL = 30
+
+# How ranges are chosen for allocation
+STRATEGY_ORDERED = "ordered"           # the first range, which has available addresses
+STRATEGY_ROUND_ROBIN = "round-robin"   # every range in turn
+STRATEGY_LEAST_LOADED = "least-loaded" # the range with the least number of leased addresses
+STRATEGIES = [STRATEGY_ORDERED, STRATEGY_ROUND_ROBIN, STRATEGY_LEAST_LOADED]
+
+
+class IPNotAvailable(Exception):
+    pass
+
+
+# Address states
+UNPROBED = 0 # not known yet whether somebody else uses the address
+FREE = 1     # nobody uses the address
+LEASED = 2   # the address is assigned to one of our UAs
+TAKEN = 3    # somebody else uses the address, or it's excluded. It's checked again after RETRY_INTERVAL
+
+
+class IPRange(object):
+    """
+    Contiguous range of IPv4 addresses, from which UA addresses are allocated.
+
+    Every address has a one-byte state, so even a /16 takes only 64KB.
+    Fresh addresses are visited in a pseudo-random order: from a random start with a random stride,
+    which is coprime to the range size. Thus every address is visited exactly once without materializing a shuffled list.
+    Fresh addresses are probed in batches of PROBE_BATCH.
+    Released addresses are put to a free-list and are reused without probing.
+    Used and excluded addresses are put to a retry queue, and are checked again after RETRY_INTERVAL,
+    as another instance or another machine might have released them meanwhile.
+    """
+    version = 4
+
+    def __init__(self, first, last, prefixlen, trusted=False):
+        """
+        :param first: first address of the range
+        :type first: ipaddress.IPv4Address
+
+        :param last: last address of the range
+        :type last: ipaddress.IPv4Address
+
+        :param prefixlen: network mask to assign allocated addresses with
+        :type prefixlen: int
+
+        :param trusted: whether the range is reserved for us, so addresses don't need to be probed
+        :type trusted: bool
+        """
+        self.first = int(first)
+        self.size = int(last) - self.first + 1
+        assert(self.size > 0)
+        self.prefixlen = prefixlen
+        self.trusted = trusted
+        self.__state = bytearray([FREE if trusted else UNPROBED]) * self.size
+        self.__free = collections.deque()
+        self.__probed = collections.deque()
+        # (time, offset) of TAKEN addresses, from the oldest to the newest
+        self.__retry = collections.deque()
+        self.__start = random.randrange(self.size)
+        self.__stride = 1
+        if self.size > 2:
+            while True:
+                self.__stride = random.randrange(1, self.size)
+                if gcd(self.__stride, self.size) == 1:
+                    break
+        self.__visited = 0
+
+    def __str__(self):
+        return '{0}-{1}'.format(ipaddress.IPv4Address(self.first), ipaddress.IPv4Address(self.first + self.size - 1))
+
+    def __contains__(self, ip):
+        return ip.version == self.version and 0 <= int(ip) - self.first < self.size
+
+    def __defer(self, offset):
+        self.__state[offset] = TAKEN
+        self.__retry.append((time.monotonic(), offset))
+
+    def __next_offset(self, now):
+        """
+        :returns: offset of the next address to check: a TAKEN address, which is due for retry, or a fresh address.
+                  None if there are none
+        :rtype: int
+        """
+        if self.__retry and now - self.__retry[0][0] >= RETRY_INTERVAL:
+            _, offset = self.__retry.popleft()
+            if self.__state[offset] == TAKEN:
+                self.__state[offset] = FREE if self.trusted else UNPROBED
+            return offset
+        if self.__visited < self.size:
+            offset = (self.__start + self.__visited * self.__stride) % self.size
+            self.__visited += 1
+            return offset
+        return None
+
+    def allocate(self, is_excluded, probe):
+        """
+        :param is_excluded: callback, which returns True if an address shouldn't be used
+        :type is_excluded: callable(str)
+
+        :param probe: callback, which returns addresses used by somebody else out of the given ones
+        :type probe: callable(list(str))
+
+        :returns: leased address or None if no address is available now
+        :rtype: ipaddress.IPv4Address
+        """
+        while True:
+            # Addresses, released by our tests, are safe to reuse without probing
+            while self.__free:
+                offset = self.__free.popleft()
+                if self.__state[offset] == FREE:
+                    ip = ipaddress.IPv4Address(self.first + offset)
+                    if is_excluded(str(ip)):
+                        self.__defer(offset)
+                        continue
+                    self.__state[offset] = LEASED
+                    return ip
+            # Addresses, which were free when probed.
+            # Somebody might have taken them since then, so they are checked again.
+            # The check is cheap, as the prober caches its results for a while.
+            while self.__probed:
+                offset = self.__probed.popleft()
+                if self.__state[offset] != FREE:
+                    continue
+                ip = ipaddress.IPv4Address(self.first + offset)
+                if is_excluded(str(ip)):
+                    self.__defer(offset)
+                    continue
+                if probe([str(ip)]):
+                    logger.debug('IP "{0}" is up, continue searching'.format(ip))
+                    self.__defer(offset)
+                    continue
+                self.__state[offset] = LEASED
+                return ip
+            # Probe a batch of fresh addresses at once
+            candidates = []
+            now = time.monotonic()
+            while len(candidates) < PROBE_BATCH:
+                offset = self.__next_offset(now)
+                if offset is None:
+                    break
+                state = self.__state[offset]
+                if state in (LEASED, TAKEN):
+                    continue
+                ip = ipaddress.IPv4Address(self.first + offset)
+                if is_excluded(str(ip)):
+                    logger.debug('IP "{0}" is already assigned'.format(ip))
+                    self.__defer(offset)
+                    continue
+                if state == FREE:
+                    # Trusted range
+                    self.__state[offset] = LEASED
+                    return ip
+                candidates.append(offset)
+            if not candidates:
+                return None
+            in_use = probe([str(ipaddress.IPv4Address(self.first + offset)) for offset in candidates])
+            for offset in candidates:
+                ip = str(ipaddress.IPv4Address(self.first + offset))
+                if ip in in_use:
+                    logger.debug('IP "{0}" is up, continue searching'.format(ip))
+                    self.__defer(offset)
+                else:
+                    logger.debug('IP "{0}" is down, we can use it'.format(ip))
+                    self.__state[offset] = FREE
+                    self.__probed.append(offset)
+
+    def release(self, ip):
+        """
+        :returns: whether the address has been leased
+        :rtype: bool
+        """
+        offset = int(ip) - self.first
+        if self.__state[offset] != LEASED:
+            return False
+        self.__state[offset] = FREE
+        self.__free.append(offset)
+        return True
+
+    def discard(self, ip):
+        """
+        :returns: whether the address has been leased
+        :rtype: bool
+        """
+        offset = int(ip) - self.first
+        ret = self.__state[offset] == LEASED
+        if self.__state[offset] != TAKEN:
+            self.__defer(offset)
+        return ret
+
+
+class IPv6Range(object):
+    """
+    Range of IPv6 addresses, from which UA addresses are allocated.
+
+    A /64 has 2^64 addresses, so per-address state isn't feasible, and isn't needed:
+    a random address collides with an address of another machine with negligible probability.
+    Therefore addresses are picked at random and are never probed.
+    Only leased and discarded addresses are remembered. Discarded addresses are forgotten after RETRY_INTERVAL.
+    """
+    version = 6
+
+    def __init__(self, first, last, prefixlen):
+        """
+        :param first: first address of the range
+        :type first: ipaddress.IPv6Address
+
+        :param last: last address of the range
+        :type last: ipaddress.IPv6Address
+
+        :param prefixlen: network mask to assign allocated addresses with
+        :type prefixlen: int
+        """
+        self.first = int(first)
+        self.size = int(last) - self.first + 1
+        assert(self.size > 0)
+        self.prefixlen = prefixlen
+        self.trusted = True
+        self.__leased = set()
+        # offset -> time of discarding
+        self.__taken = {}
+
+    def __str__(self):
+        return '{0}-{1}'.format(ipaddress.IPv6Address(self.first), ipaddress.IPv6Address(self.first + self.size - 1))
+
+    def __contains__(self, ip):
+        return ip.version == self.version and 0 <= int(ip) - self.first < self.size
+
+    def allocate(self, is_excluded, probe):
+        """
+        :param is_excluded: callback, which returns True if an address shouldn't be used
+        :type is_excluded: callable(str)
+
+        :param probe: not used, IPv6 addresses are not probed
+        :type probe: callable(list(str))
+
+        :returns: leased address or None if the range is exhausted
+        :rtype: ipaddress.IPv6Address
+        """
+        now = time.monotonic()
+        for offset in [o for o, t in self.__taken.items() if now - t >= RETRY_INTERVAL]:
+            del self.__taken[offset]
+        if len(self.__leased) + len(self.__taken) < self.size:
+            for attempt in range(RANDOM_ATTEMPTS):
+                offset = random.randrange(self.size)
+                if offset in self.__leased or offset in self.__taken:
+                    continue
+                ip = ipaddress.IPv6Address(self.first + offset)
+                if is_excluded(str(ip)):
+                    continue
+                self.__leased.add(offset)
+                return ip
+        return None
+
+    def release(self, ip):
+        """
+        :returns: whether the address has been leased
+        :rtype: bool
+        """
+        offset = int(ip) - self.first
+        if offset not in self.__leased:
+            return False
+        self.__leased.remove(offset)
+        return True
+
+    def discard(self, ip):
+        """
+        :returns: whether the address has been leased
+        :rtype: bool
+        """
+        offset = int(ip) - self.first
+        self.__taken[offset] = time.monotonic()
+        if offset not in self.__leased:
+            return False
+        self.__leased.remove(offset)
+        return True
+
+
+class IPAllocator(object):
+    """
+    Process-wide allocator of UA addresses.
+    All the ranges are of the same IP version.
+
+    An address, which has been released by a finished test, goes back to the pool and is reused without probing.
+    """
+    def __init__(self, ranges, strategy=STRATEGY_ORDERED):
+        """
+        :param ranges: ranges to allocate from, in order of preference
+        :type ranges: list(IPRange)
+
+        :param strategy: how ranges are chosen for allocation, one of STRATEGIES
+        :type strategy: str
+        """
+        self.__ranges = ranges
+        self.__strategy = strategy
+        # Number of currently leased and ever leased addresses per range
+        self.__load = [0] * len(ranges)
+        self.__total = [0] * len(ranges)
+        self.__next = 0
+        self.__lock = threading.Lock()
+
+    @property
+    def version(self):
+        """
+        :returns: IP version of the addresses
+        :rtype: int
+        """
+        return self.__ranges[0].version
+
+    @staticmethod
+    def parse_range(value, default_prefixlen, trusted=False):
+        """
+        Parses either a network in CIDR notation, or a range of addresses "<first>-<last>".
+        Network and broadcast addresses of an IPv4 network are not used.
+        IPv6 subnet-router anycast address is not used.
+
+        :param value: range specification
+        :type value: str
+
+        :param default_prefixlen: network mask to assign addresses of "<first>-<last>" range with
+        :type default_prefixlen: int
+
+        :raises: ValueError
+        :rtype: IPRange or IPv6Range
+        """
+        if '-' in value:
+            first, last = (ipaddress.ip_address(v.strip()) for v in value.split('-', 1))
+            if first.version != last.version:
+                raise ValueError('Mixed IP versions in range "{0}"'.format(value))
+            if last < first:
+                raise ValueError('Empty range "{0}"'.format(value))
+            if first.version == 6:
+                return IPv6Range(first, last, default_prefixlen)
+            return IPRange(first, last, default_prefixlen, trusted)
+        network = ipaddress.ip_network(value, strict=False)
+        if network.version == 6:
+            if network.num_addresses > 1:
+                return IPv6Range(network.network_address + 1, network.broadcast_address, network.prefixlen)
+            return IPv6Range(network.network_address, network.broadcast_address, network.prefixlen)
+        if network.num_addresses > 2:
+            return IPRange(network.network_address + 1, network.broadcast_address - 1, network.prefixlen, trusted)
+        return IPRange(network.network_address, network.broadcast_address, network.prefixlen, trusted)
+
+    @staticmethod
+    def parse_networks(value):
+        """
+        :param value: range specification, as accepted by parse_range()
+        :type value: str
+
+        :returns: networks, which cover the range
+        :rtype: list(ipaddress.IPv4Network or ipaddress.IPv6Network)
+        """
+        if '-' in value:
+            first, last = (ipaddress.ip_address(v.strip()) for v in value.split('-', 1))
+            return list(ipaddress.summarize_address_range(first, last))
+        return [ipaddress.ip_network(value, strict=False)]
+
+    def __get_order(self):
+        indexes = range(len(self.__ranges))
+        if self.__strategy == STRATEGY_ROUND_ROBIN:
+            return [(self.__next + i) % len(self.__ranges) for i in indexes]
+        if self.__strategy == STRATEGY_LEAST_LOADED:
+            return sorted(indexes, key=lambda i: self.__load[i])
+        return indexes
+
+    def __find(self, ip):
+        for i, r in enumerate(self.__ranges):
+            if ip in r:
+                return i
+        return None
+
+    def allocate(self, is_excluded, probe):
+        """
+        :param is_excluded: callback, which returns True if an address shouldn't be used
+        :type is_excluded: callable(str)
+
+        :param probe: callback, which returns addresses used by somebody else out of the given ones
+        :type probe: callable(list(str))
+
+        :returns: leased address and network mask to assign it with
+        :rtype: (ipaddress.IPv4Address or ipaddress.IPv6Address, int)
+        """
+        with self.__lock:
+            for i in self.__get_order():
+                r = self.__ranges[i]
+                ip = r.allocate(is_excluded, probe)
+                if ip:
+                    self.__load[i] += 1
+                    self.__total[i] += 1
+                    self.__next = (i + 1) % len(self.__ranges)
+                    return ip, r.prefixlen
+        raise IPNotAvailable('Unable to find an available ip')
+
+    def release(self, ip):
+        """
+        Returns a leased address to the pool.
+        """
+        with self.__lock:
+            i = self.__find(ip)
+            # Double release shouldn't skew the load of the range
+            if i is not None and self.__ranges[i].release(ip):
+                self.__load[i] -= 1
+
+    def discard(self, ip):
+        """
+        Marks a leased address as used by somebody else, so it's not handed out anymore.
+        """
+        with self.__lock:
+            i = self.__find(ip)
+            if i is not None and self.__ranges[i].discard(ip):
+                self.__load[i] -= 1
+
+    def get_stats(self):
+        """
+        :returns: number of currently leased and ever leased addresses per range, in order of ranges
+        :rtype: list((int, int))
+        """
+        with self.__lock:
+            return list(zip(self.__load, self.__total))
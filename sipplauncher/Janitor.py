@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import logging
+import os
+import shutil
+import threading
+
+from .utils.Defaults import (DEFAULT_RESULT_FILE,
+                             DEFAULT_JANITOR_PERIOD)
+from .Archiver import PARTIAL_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+RESULT_SUCCESS = "SUCCESS"
+RESULT_FAIL = "FAIL"
+
+
+def write_result_file(folder, failed, instance_id=None):
+    """
+    Marks a test run folder as finished.
+    Only marked folders are considered by the Janitor.
+
+    :param folder: test run folder
+    :type folder: str
+
+    :param failed: whether the test has failed
+    :type failed: bool
+
+    :param instance_id: ID of the Sipplauncher instance, which has run the test
+    :type instance_id: str
+    """
+    with open(os.path.join(folder, DEFAULT_RESULT_FILE), "w") as f:
+        f.write(RESULT_FAIL if failed else RESULT_SUCCESS)
+        if instance_id:
+            f.write("\n{0}".format(instance_id))
+
+
+def _get_folder_size(folder):
+    size = 0
+    for dirpath, _, filenames in os.walk(folder):
+        for f in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, f)).st_size
+            except OSError:
+                pass
+    return size
+
+
+class Janitor(object):
+    """
+    Keeps disk usage of retained test run folders bounded.
+
+    Periodically scans `<root>/<test_name>/<test_run_id>` folders, which have been marked as finished,
+    and removes the oldest passed ones when:
+    - there are more than `keep_last` passed test runs
+    - total size of all retained test runs exceeds `max_bytes`
+
+    Failed test runs are never removed, because they are the evidence of a failure.
+
+    Several Sipplauncher instances might share the same root.
+    If the instance ID is given, only test runs of this instance are considered,
+    so an instance doesn't evict test runs, which other instances retain.
+    """
+    def __init__(self, root, keep_last=None, max_bytes=None, period=DEFAULT_JANITOR_PERIOD, instance_id=None):
+        """
+        :param root: folder, where retained test run folders reside
+        :type root: str
+
+        :param keep_last: maximum number of passed test runs to retain, None for no limit
+        :type keep_last: int
+
+        :param max_bytes: maximum total size of retained test runs, None for no limit
+        :type max_bytes: int
+
+        :param period: period of scanning in seconds
+        :type period: float
+
+        :param instance_id: ID of this Sipplauncher instance, None to consider test runs of all instances
+        :type instance_id: str
+        """
+        self.__root = os.path.abspath(root)
+        self.__instance_id = instance_id
+        self.__keep_last = keep_last
+        self.__max_bytes = max_bytes
+        self.__period = period
+        # Finished test run folders are not modified anymore.
+        # Therefore we calculate the size of a folder only once.
+        self.__sizes = {}
+        self.__stop_event = threading.Event()
+        self.__thread = threading.Thread(target=self.__run)
+        # Same reasoning as for SIPpTest threads in Run.run():
+        # we want the thread to exit when main thread ends.
+        self.__thread.setDaemon(True)
+        self.__thread.start()
+        logger.debug('Started janitor at "{0}": keep last {1}, max bytes {2}'.format(self.__root, keep_last, max_bytes))
+
+    def stop(self):
+        """
+        Performs the last cleanup and stops the background thread.
+        """
+        self.__stop_event.set()
+        self.__thread.join()
+        logger.debug('Stopped janitor at "{0}"'.format(self.__root))
+
+    def __run(self):
+        while True:
+            stopping = self.__stop_event.wait(self.__period)
+            try:
+                self.cleanup()
+            except Exception as e:
+                logger.error('Janitor cleanup has failed: {0}'.format(e))
+                logger.debug(e, exc_info = True)
+            if stopping:
+                break
+
+    def _scan(self):
+        """
+        :returns: finished test runs, from the oldest to the newest
+        :rtype: list((str, bool, int))
+        """
+        runs = []
+        sizes = {}
+        if not os.path.isdir(self.__root):
+            return runs
+        for test_name in os.listdir(self.__root):
+            test_folder = os.path.join(self.__root, test_name)
+            if not os.path.isdir(test_folder):
+                continue
+            for run_id in os.listdir(test_folder):
+                if run_id.endswith(PARTIAL_SUFFIX):
+                    # The folder is being archived
+                    continue
+                folder = os.path.join(test_folder, run_id)
+                result_file = os.path.join(folder, DEFAULT_RESULT_FILE)
+                try:
+                    with open(result_file, "r") as f:
+                        fields = f.read().split()
+                    mtime = os.stat(result_file).st_mtime
+                except OSError:
+                    # The test is still running
+                    continue
+                failed = not fields or fields[0] != RESULT_SUCCESS
+                if self.__instance_id and fields[1:2] != [self.__instance_id]:
+                    # The test run belongs to another instance
+                    continue
+                sizes[folder] = self.__sizes[folder] if folder in self.__sizes else _get_folder_size(folder)
+                runs.append((mtime, folder, failed, sizes[folder]))
+        # Forget folders, which have disappeared
+        self.__sizes = sizes
+        runs.sort()
+        return [(folder, failed, size) for _, folder, failed, size in runs]
+
+    def cleanup(self):
+        """
+        Enforces the retention limits once.
+        """
+        runs = self._scan()
+        passed = [r for r in runs if not r[1]]
+        total_bytes = sum(size for _, _, size in runs)
+
+        evicted = []
+        if self.__keep_last is not None and len(passed) > self.__keep_last:
+            count = len(passed) - self.__keep_last
+            evicted, passed = passed[:count], passed[count:]
+            total_bytes -= sum(size for _, _, size in evicted)
+
+        if self.__max_bytes is not None:
+            while total_bytes > self.__max_bytes and passed:
+                run = passed.pop(0)
+                evicted.append(run)
+                total_bytes -= run[2]
+            if total_bytes > self.__max_bytes:
+                logger.warning('Failed test runs at "{0}" occupy {1} bytes, which exceeds the limit of {2} bytes'.format(self.__root,
+                                                                                                                       total_bytes,
+                                                                                                                       self.__max_bytes))
+
+        for folder, _, _ in evicted:
+            logger.debug('Evicting "{0}"'.format(folder))
+            shutil.rmtree(folder, ignore_errors=True)
+            try:
+                # Remove <test_name> folder, if this was its last test run
+                os.rmdir(os.path.dirname(folder))
+            except OSError:
+                pass
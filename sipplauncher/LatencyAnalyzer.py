@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import logging
+import os
+import csv
+import threading
+import queue
+import ipaddress
+import array
+
+# Latency analysis is optional.
+# It's enabled only if `numpy` package is installed.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .PcapWriter import (read_records,
+                         get_rotated_paths,
+                         classify,
+                         get_sip)
+from .utils.Defaults import DEFAULT_LATENCY_PERCENTILES
+
+logger = logging.getLogger(__name__)
+
+LATENCY_FILE = "latency.csv"
+
+# Status code column value of the requests
+REQUEST = -1
+# Transaction id and status code are combined into a single key as id * MAX_STATUS + status code
+MAX_STATUS = 1000
+
+# Latencies over all runs of a test are accumulated into a histogram of a fixed size,
+# so memory usage doesn't depend on the number of runs, for ex. with --loop arg.
+# 100 bins per decade give about 2.3% resolution from 10 us to 100 s.
+HISTOGRAM_MIN_SECONDS = 0.00001
+HISTOGRAM_MAX_SECONDS = 100
+HISTOGRAM_BINS_PER_DECADE = 100
+
+# Test run folders are kept until they have been analyzed.
+# So the number of pending test runs is limited: if the analysis lags behind, the tests wait on submit(),
+# instead of filling the work folder, which might be a small tmpfs.
+MAX_PENDING_PER_WORKER = 4
+
+
+class LatencyException(Exception):
+    pass
+
+
+def is_supported():
+    """
+    :returns: whether latency analysis is available, i.e. numpy package is installed
+    :rtype: bool
+    """
+    return numpy is not None
+
+
+def collect_latencies(pcap_paths, dut):
+    """
+    Pairs SIP requests, sent to the DUT, with the responses of the DUT.
+    Only the first transmission of a request and the first response with every status code are taken,
+    so retransmissions don't skew the latency.
+
+    Pcap files are read packet by packet into columns of timestamps, transaction ids and status codes.
+    Then requests and responses are paired with array operations over these columns,
+    so the pairing cost doesn't grow with the number of Python objects per packet.
+
+    :param pcap_paths: pcap files of a test run, in the order they have been written
+    :type pcap_paths: list(str)
+
+    :param dut: DUT address
+    :type dut: str
+
+    :returns: "<method> <status code>" -> latencies in seconds
+    :rtype: dict(str, numpy.ndarray)
+    """
+    dut = ipaddress.ip_address(dut).packed
+    # (Call-ID, CSeq, method) -> transaction id
+    transactions = {}
+    # method -> method id
+    methods = {}
+    # transaction id -> method id
+    transaction_methods = []
+    # Columns are kept in compact arrays of machine integers rather than lists of Python objects
+    tss = array.array("q")
+    ids = array.array("q")
+    statuses = array.array("q")
+    for pcap_path in pcap_paths:
+        for sec, usec, frame in read_records(pcap_path):
+            fields = classify(frame)
+            if not fields or dut not in fields[:2]:
+                continue
+            sip = get_sip(frame)
+            if not sip:
+                continue
+            call_id, cseq, method, status = sip
+            if status is None:
+                if fields[1] != dut:
+                    continue
+                status = REQUEST
+            elif fields[0] != dut:
+                continue
+            transaction_id = transactions.get((call_id, cseq, method))
+            if transaction_id is None:
+                transaction_id = transactions[(call_id, cseq, method)] = len(transaction_methods)
+                transaction_methods.append(methods.setdefault(method, len(methods)))
+            tss.append(sec * 1000000 + usec)
+            ids.append(transaction_id)
+            statuses.append(status)
+    if not tss:
+        return {}
+    tss = numpy.frombuffer(tss, dtype=numpy.int64)
+    ids = numpy.frombuffer(ids, dtype=numpy.int64)
+    statuses = numpy.frombuffer(statuses, dtype=numpy.int64)
+
+    # Timestamp of the first transmission of the request of every transaction
+    is_request = statuses == REQUEST
+    request_ids = ids[is_request]
+    request_tss = tss[is_request]
+    order = numpy.lexsort((request_tss, request_ids))
+    first_ids, first = numpy.unique(request_ids[order], return_index=True)
+    request_ts = numpy.full(len(transaction_methods), -1, dtype=numpy.int64)
+    request_ts[first_ids] = request_tss[order][first]
+
+    # The first response with every status code, which follows the request
+    response_ids = ids[~is_request]
+    response_tss = tss[~is_request]
+    response_statuses = statuses[~is_request]
+    matched = (request_ts[response_ids] >= 0) & (response_tss >= request_ts[response_ids])
+    response_ids = response_ids[matched]
+    response_tss = response_tss[matched]
+    response_statuses = response_statuses[matched]
+    order = numpy.lexsort((response_tss, response_statuses, response_ids))
+    response_ids = response_ids[order]
+    response_tss = response_tss[order]
+    response_statuses = response_statuses[order]
+    _, first = numpy.unique(response_ids * MAX_STATUS + response_statuses, return_index=True)
+    response_ids = response_ids[first]
+    latencies = (response_tss[first] - request_ts[response_ids]) / 1000000
+
+    # Group by method and status code
+    method_names = {method_id: method for method, method_id in methods.items()}
+    codes = numpy.array(transaction_methods, dtype=numpy.int64)[response_ids] * MAX_STATUS + response_statuses[first]
+    order = numpy.argsort(codes, kind="stable")
+    codes = codes[order]
+    groups, starts = numpy.unique(codes, return_index=True)
+    return {"{0} {1}".format(method_names[code // MAX_STATUS], code % MAX_STATUS): group
+            for code, group in zip(groups, numpy.split(latencies[order], starts[1:]))}
+
+
+def get_percentiles(latencies, percentiles=DEFAULT_LATENCY_PERCENTILES):
+    """
+    :param latencies: latencies in seconds
+    :type latencies: numpy.ndarray
+
+    :returns: latency percentiles in milliseconds
+    :rtype: list(float)
+    """
+    return [round(float(p), 3) for p in numpy.percentile(latencies * 1000, percentiles)]
+
+
+def get_histogram_edges():
+    """
+    :returns: edges of the latency histogram bins in seconds, spaced evenly on a log scale
+    :rtype: numpy.ndarray
+    """
+    decades = int(round(numpy.log10(HISTOGRAM_MAX_SECONDS / HISTOGRAM_MIN_SECONDS)))
+    return numpy.logspace(numpy.log10(HISTOGRAM_MIN_SECONDS), numpy.log10(HISTOGRAM_MAX_SECONDS),
+                          decades * HISTOGRAM_BINS_PER_DECADE + 1)
+
+
+def get_histogram(latencies, edges):
+    """
+    Latencies out of the histogram range are counted in the first or the last bin.
+
+    :param latencies: latencies in seconds
+    :type latencies: numpy.ndarray
+
+    :param edges: edges of the bins, see get_histogram_edges()
+    :type edges: numpy.ndarray
+
+    :returns: number of latencies in every bin
+    :rtype: numpy.ndarray
+    """
+    counts, _ = numpy.histogram(numpy.clip(latencies, edges[0], edges[-1]), bins=edges)
+    return counts
+
+
+def get_histogram_percentiles(counts, edges, percentiles=DEFAULT_LATENCY_PERCENTILES):
+    """
+    Estimates percentiles from a histogram by linear interpolation within a bin.
+    The error doesn't exceed the width of a bin, i.e. 10 ** (1 / HISTOGRAM_BINS_PER_DECADE) - 1 of the value.
+
+    :param counts: number of latencies in every bin, see get_histogram()
+    :type counts: numpy.ndarray
+
+    :param edges: edges of the bins, see get_histogram_edges()
+    :type edges: numpy.ndarray
+
+    :returns: latency percentiles in milliseconds
+    :rtype: list(float)
+    """
+    cumulative = numpy.cumsum(counts)
+    ranks = numpy.array(percentiles, dtype=float) / 100 * cumulative[-1]
+    bins = numpy.minimum(numpy.searchsorted(cumulative, ranks, side="left"), len(counts) - 1)
+    below = cumulative[bins] - counts[bins]
+    fractions = numpy.clip((ranks - below) / numpy.maximum(counts[bins], 1), 0, 1)
+    values = edges[bins] + fractions * (edges[bins + 1] - edges[bins])
+    return [round(float(v), 3) for v in values * 1000]
+
+
+class LatencyAnalyzer(object):
+    """
+    Measures the latency of the DUT from the pcap files of finished test runs in background threads.
+
+    The latency is measured on the wire: from the first request to the DUT to the first response of the DUT with a given status code.
+    So it doesn't depend on SIPp timers and on the load of the host.
+    The results of a test run are written to the "latency.csv" file in its folder,
+    and percentiles over all runs of every test are logged on stop().
+    The latter are estimated from histograms, see get_histogram_percentiles().
+    """
+    def __init__(self, dut, workers=1):
+        """
+        :param dut: DUT address
+        :type dut: str
+
+        :param workers: number of background worker threads
+        :type workers: int
+        """
+        if not is_supported():
+            raise LatencyException("Please install numpy package to analyze latency")
+        self.__dut = dut
+        self.__edges = get_histogram_edges()
+        # (test name, "<method> <status code>") -> histogram counts
+        self.__histograms = {}
+        self.__lock = threading.Lock()
+        self.__queue = queue.Queue(max(1, workers) * MAX_PENDING_PER_WORKER)
+        self.__threads = []
+        for i in range(max(1, workers)):
+            thread = threading.Thread(target=self.__run)
+            # Same reasoning as for SIPpTest threads in Run.run():
+            # we want the thread to exit when main thread ends.
+            thread.setDaemon(True)
+            thread.start()
+            self.__threads.append(thread)
+        logger.debug('Started latency analyzer for DUT {0}'.format(dut))
+
+    def submit(self, test_name, folder, pcap_name, callback=None):
+        """
+        Schedules the pcap files of a test run to be analyzed.
+        Blocks while there are too many test runs pending analysis.
+
+        :param test_name: name of the test
+        :type test_name: str
+
+        :param folder: test run folder
+        :type folder: str
+
+        :param pcap_name: name of the pcap files of the test run without extension
+        :type pcap_name: str
+
+        :param callback: called in a background thread once the folder has been analyzed, to release it
+        :type callback: callable()
+        """
+        self.__queue.put((test_name, folder, pcap_name, callback))
+
+    def stop(self):
+        """
+        Waits for all the submitted test runs to be analyzed, stops the background threads and logs the results.
+        """
+        for thread in self.__threads:
+            self.__queue.put(None)
+        for thread in self.__threads:
+            thread.join()
+        for (test_name, transaction), counts in sorted(self.__histograms.items()):
+            logger.info('Latency of {0} {1}: {2} transactions, {3} ms'.format(
+                test_name, transaction, int(counts.sum()),
+                self.__format(get_histogram_percentiles(counts, self.__edges))))
+        logger.debug('Stopped latency analyzer for DUT {0}'.format(self.__dut))
+
+    @staticmethod
+    def __format(percentiles):
+        return ", ".join("p{0}={1}".format(p, v) for p, v in zip(DEFAULT_LATENCY_PERCENTILES, percentiles))
+
+    def __run(self):
+        while True:
+            item = self.__queue.get()
+            try:
+                if item is None:
+                    break
+                test_name, folder, pcap_name, callback = item
+                try:
+                    self._analyze(test_name, folder, pcap_name)
+                except BaseException as e:
+                    # Analysis of a single test run has failed.
+                    # This shouldn't stop analysis of other test runs.
+                    logger.error('Unable to analyze latency of "{0}": {1}'.format(folder, e))
+                    logger.debug(e, exc_info = True)
+                finally:
+                    if callback:
+                        callback()
+            except BaseException as e:
+                logger.error('Unable to release "{0}": {1}'.format(item[1], e))
+                logger.debug(e, exc_info = True)
+            finally:
+                self.__queue.task_done()
+
+    def _analyze(self, test_name, folder, pcap_name):
+        transactions = collect_latencies(get_rotated_paths(folder, pcap_name), self.__dut)
+        with open(os.path.join(folder, LATENCY_FILE), "w", newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["transaction", "count"] + ["p{0}_ms".format(p) for p in DEFAULT_LATENCY_PERCENTILES])
+            for transaction, latencies in sorted(transactions.items()):
+                writer.writerow([transaction, len(latencies)] + get_percentiles(latencies))
+                counts = get_histogram(latencies, self.__edges)
+                with self.__lock:
+                    histogram = self.__histograms.get((test_name, transaction))
+                    if histogram is None:
+                        self.__histograms[(test_name, transaction)] = counts
+                    else:
+                        histogram += counts
+        logger.debug('Analyzed latency of "{0}": {1} transaction types'.format(folder, len(transactions)))
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import logging
+import re
+import shlex
+import subprocess
+import threading
+import collections
+import ipaddress
+from .Registry import KIND_INTERFACE
+
+logger = logging.getLogger(__name__)
+
+ROOT_HANDLE = "1:"
+# htb class minor numbers are 16-bit, 0 is not a valid class.
+# netem qdisc of class 1:<N> has handle <N + 1>:, as 1: is taken by the root.
+MAX_CLASSES = 0xfffe
+# htb class shouldn't limit the rate, netem does it if requested
+CLASS_RATE = "100gbit"
+
+ALL_UAS = None
+ua_regex = re.compile('^ua[0-9]+$')
+
+
+class NetemException(Exception):
+    """
+    Raised when tc rejects an impairment profile
+    """
+    pass
+
+
+def parse_profile(lines):
+    """
+    Parses an impairment profile.
+    Every line contains netem parameters, as accepted by tc-netem(8), for ex. "delay 100ms 20ms loss 1%".
+    A line could be prefixed with a UA name to apply the parameters to this UA only.
+    Otherwise, the parameters apply to all the UAs, which don't have their own line.
+    Lines, starting with '#', are comments.
+
+    :param lines: lines of the profile
+    :type lines: iterable(str)
+
+    :returns: UA name or ALL_UAS -> netem parameters
+    :rtype: dict
+    """
+    ret = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        tokens = shlex.split(line)
+        ua = ALL_UAS
+        if ua_regex.match(tokens[0]):
+            ua, tokens = tokens[0], tokens[1:]
+        if not tokens:
+            raise NetemException('No netem parameters in line "{0}"'.format(line))
+        ret[ua] = tokens
+    return ret
+
+
+def _tc(*argv):
+    p = subprocess.run(["tc"] + list(argv), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if p.returncode != 0:
+        raise NetemException('"tc {0}" failed: {1}'.format(" ".join(argv), p.stderr.decode("utf-8").strip()))
+
+
+class Shaper(object):
+    """
+    Applies netem impairments to the egress traffic of individual UA addresses.
+
+    Packets from UA addresses leave the host through a physical interface, not through the dummy interface, which holds the addresses.
+    Therefore, the impairment is applied at the egress interface:
+    - the root htb qdisc is installed once per interface, its default traffic is not shaped
+    - every impaired UA gets an htb class with a netem qdisc, and a u32 filter, which classifies packets by the UA source address
+
+    The filter priority equals the class minor number, so filter and class of a UA are removed together.
+    Ingress traffic is not impaired.
+
+    The root qdisc and its classes are owned by a single instance.
+    The interface is leased in the registry, so other running instances refuse to impair the traffic on it.
+    """
+    def __init__(self, registry=None):
+        """
+        :param registry: host-wide lease registry
+        :type registry: LeaseRegistry
+        """
+        self.__registry = registry
+        # ifname -> free class minor numbers
+        self.__free = {}
+        # ifname -> next never used class minor number
+        self.__next = {}
+        self.__lock = threading.Lock()
+
+    def __lease_minor(self, ifname):
+        if ifname not in self.__next:
+            if self.__registry and not self.__registry.claim(KIND_INTERFACE, ifname):
+                raise NetemException('Interface "{0}" is impaired by another running instance'.format(ifname))
+            # Replaces the current root qdisc of the interface until shutdown()
+            try:
+                _tc("qdisc", "replace", "dev", ifname, "root", "handle", ROOT_HANDLE, "htb")
+            except:
+                self.__release(ifname)
+                raise
+            logger.debug('Installed netem root qdisc on interface "{0}"'.format(ifname))
+            self.__free[ifname] = collections.deque()
+            self.__next[ifname] = 1
+        if self.__free[ifname]:
+            return self.__free[ifname].popleft()
+        minor = self.__next[ifname]
+        if minor > MAX_CLASSES:
+            raise NetemException('Too many impaired UAs on interface "{0}"'.format(ifname))
+        self.__next[ifname] += 1
+        return minor
+
+    def __release(self, ifname):
+        if self.__registry:
+            self.__registry.release(KIND_INTERFACE, ifname)
+
+    def add(self, ifname, ip, params):
+        """
+        :param ifname: egress interface
+        :type ifname: str
+
+        :param ip: UA address
+        :type ip: str
+
+        :param params: netem parameters
+        :type params: list(str)
+
+        :returns: token to pass to remove()
+        :rtype: (str, int)
+        """
+        with self.__lock:
+            minor = self.__lease_minor(ifname)
+            classid = "1:{0:x}".format(minor)
+            try:
+                _tc("class", "replace", "dev", ifname, "parent", ROOT_HANDLE, "classid", classid, "htb", "rate", CLASS_RATE)
+                _tc("qdisc", "replace", "dev", ifname, "parent", classid, "handle", "{0:x}:".format(minor + 1), "netem", *params)
+                if ipaddress.ip_address(ip).version == 6:
+                    match = ["protocol", "ipv6", "prio", str(minor), "u32", "match", "ip6", "src", "{0}/128".format(ip)]
+                else:
+                    match = ["protocol", "ip", "prio", str(minor), "u32", "match", "ip", "src", "{0}/32".format(ip)]
+                _tc("filter", "add", "dev", ifname, "parent", ROOT_HANDLE, *(match + ["flowid", classid]))
+            except:
+                self.__remove(ifname, minor)
+                raise
+            logger.debug('Impaired UA "{0}" on interface "{1}" with "{2}"'.format(ip, ifname, " ".join(params)))
+            return ifname, minor
+
+    def remove(self, token):
+        """
+        :param token: the value, returned by add()
+        :type token: (str, int)
+        """
+        with self.__lock:
+            self.__remove(*token)
+
+    def __remove(self, ifname, minor):
+        try:
+            _tc("filter", "del", "dev", ifname, "parent", ROOT_HANDLE, "prio", str(minor))
+        except NetemException as e:
+            # The filter hasn't been added
+            logger.debug(e)
+        try:
+            _tc("class", "del", "dev", ifname, "classid", "1:{0:x}".format(minor))
+        except NetemException as e:
+            logger.debug(e)
+        self.__free[ifname].append(minor)
+
+    def shutdown(self):
+        """
+        Restores the default root qdiscs of the egress interfaces.
+        """
+        with self.__lock:
+            for ifname in self.__next:
+                try:
+                    _tc("qdisc", "del", "dev", ifname, "root")
+                    logger.debug('Removed netem root qdisc from interface "{0}"'.format(ifname))
+                except NetemException as e:
+                    logger.warning(e)
+                self.__release(ifname)
+            self.__free.clear()
+            self.__next.clear()
@@ -2,24 +2,79 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import random
+import os
+import threading
 import ipaddress
-from scapy.sendrecv import srp
-from scapy.layers.l2 import Ether, ARP
+import collections
+from socket import AF_INET, AF_INET6
 from scapy.error import Scapy_Exception
 import pyroute2
-from socket import AF_INET
+from pyroute2.netlink.rtnl.ifaddrmsg import IFA_F_NODAD
 from . import Sniffer
-
-class IPNotAvailable(Exception):
-    pass
-
+from .PcapWriter import PROFILE_SIGNALING
+from .Topology import topology, RT_TABLE_MAIN
+from .IPAllocator import IPNotAvailable
+from .ArpProber import ArpProber
+from .Registry import KIND_IP
+from .utils.Defaults import (DEFAULT_UA_PORT_BLOCK,
+                             DEFAULT_SOURCE_ROUTING_TABLE,
+                             DEFAULT_SOURCE_ROUTING_PRIORITY,
+                             DEFAULT_CAPTURE_BACKEND,
+                             DEFAULT_CAPTURE_PROFILE,
+                             DEFAULT_DNS_PORT)
 
 logger = logging.getLogger("sipplaunchernetwork")
 
 
 IFACE_PREFIX = 'sipp'
 
+
+class NetlinkSession(object):
+    """ Shared netlink socket, guarded by a lock.
+
+    Opening a netlink socket per operation is a significant part of the test preparation time,
+    when many tests are prepared at once with --group.
+    Usage:
+
+        with netlink as ip_route:
+            ip_route.link_lookup(...)
+
+    The lock is reentrant, so a caller may hold the session across several operations.
+    """
+    def __init__(self):
+        self.__lock = threading.RLock()
+        self.__ip_route = None
+        self.__pid = None
+
+    def __enter__(self):
+        self.__lock.acquire()
+        try:
+            # A forked child shouldn't talk over the parent's socket:
+            # replies would be delivered to whoever reads first.
+            if self.__ip_route is None or self.__pid != os.getpid():
+                self.__ip_route = pyroute2.IPRoute()
+                self.__pid = os.getpid()
+        except:
+            self.__lock.release()
+            raise
+        return self.__ip_route
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__lock.release()
+
+    def close(self):
+        with self.__lock:
+            if self.__ip_route is not None:
+                if self.__pid == os.getpid():
+                    self.__ip_route.close()
+                self.__ip_route = None
+
+
+netlink = NetlinkSession()
+
+# Our own dummy interfaces have routes to the DUT network too, but probing them is pointless
+arp_prober = ArpProber(lambda ifname: IFACE_PREFIX in ifname)
+
 class DUT(ipaddress.IPv4Interface):
     """ The Device Under Test IP (likely not to be in this box -> no need to have the interface)
     """
@@ -29,52 +84,520 @@ class DUT(ipaddress.IPv4Interface):
         return ret
 
 
-def force_cleanup():
-    """ Removes all the interfaces with our configured prefix
+class DUTv6(ipaddress.IPv6Interface):
+    """ The Device Under Test IPv6
+    """
+
+    def __str__(self):
+        ret = '<ip:"{0}" network:"{1}"">'.format(self.ip, self.network)
+        return ret
+
+
+def get_dut(dut, mask):
     """
-    with pyroute2.IPRoute() as ip_route:
-        logger.debug('Deleting all interface named:"*{0}*"'.format(IFACE_PREFIX))
+    :returns: DUT of the matching IP version
+    :rtype: DUT or DUTv6
+    """
+    address = u'{0}/{1}'.format(dut, mask)
+    if ipaddress.ip_address(dut).version == 6:
+        return DUTv6(address)
+    return DUT(address)
+
+
+def get_iface_prefix(instance_id):
+    """ Interface names are limited to 15 characters.
+    Therefore, an instance ID is short: "sipp<instance_id>-<test_run_id>".
+    """
+    return '{0}{1}-'.format(IFACE_PREFIX, instance_id)
+
+
+def _get_iface_instance(ifname):
+    """
+    :returns: ID of the instance, which owns the interface, or None if it's not our interface
+    :rtype: str
+    """
+    if ifname.startswith(IFACE_PREFIX) and '-' in ifname:
+        return ifname[len(IFACE_PREFIX):].split('-', 1)[0]
+    return None
+
+
+def force_cleanup(registry=None):
+    """ Removes the interfaces with our configured prefix.
+    If the registry is given, only interfaces of this instance and of dead instances are removed,
+    so other running instances are not affected.
+    """
+    with netlink as ip_route:
+        logger.debug('Deleting all interface named:"{0}*"'.format(IFACE_PREFIX))
         for link in ip_route.get_links():
             ifname = link['attrs'][0][1]
-            if IFACE_PREFIX in ifname:
+            instance_id = _get_iface_instance(ifname)
+            if instance_id is not None:
+                if registry and registry.is_alive(instance_id) and instance_id != registry.instance_id:
+                    logger.debug('Keeping interface adapter:"{0}" of running instance "{1}"'.format(ifname, instance_id))
+                    continue
                 try:
                     logger.debug('Removed interface adapter:"{0}"'.format(ifname))
                     ip_route.link("del", index=link['index'])
+                    topology.remove_link(link['index'])
                 except:
                     raise
                 else:
                     logger.debug('Cleaning interface adapter:"{0}"'.format(ifname))
 
 
+def _allocate_ip(allocator, registry, assigned_ips):
+    """ Picks a random available IP, which isn't used by anybody else on this host or in the LAN.
+
+    :returns: IP and network mask to assign it with
+    :rtype: (ipaddress.IPv4Address or ipaddress.IPv6Address, int)
+    """
+    while True:
+        ip, prefixlen = allocator.allocate(lambda x: x in assigned_ips, arp_prober.probe)
+        if registry and not registry.claim(KIND_IP, str(ip)):
+            # Another instance on this host has just picked the same IP
+            logger.debug('IP "{0}" is leased by another instance'.format(ip))
+            allocator.discard(ip)
+            continue
+        logger.debug('Picked a random IP to generate the UA: "{0}"'.format(ip))
+        return ip, prefixlen
+
+
+def _release_ip(allocator, registry, ip):
+    allocator.release(ip)
+    if registry:
+        registry.release(KIND_IP, str(ip))
+
+
+def _allocate_ips(allocator, registry, dut, count):
+    """ Picks several random available IPs, see _allocate_ip().
+    It's done without the netlink session, because ARP probing takes a while,
+    and the netlink session shouldn't hold up address setup and teardown of other tests meanwhile.
+
+    :returns: IPs and network masks to assign them with
+    :rtype: list((ipaddress.IPv4Address or ipaddress.IPv6Address, int))
+    """
+    assigned_ips = _get_assigned_ips(dut)
+    ret = []
+    try:
+        while len(ret) < count:
+            ret.append(_allocate_ip(allocator, registry, assigned_ips))
+    except:
+        for ip, _ in ret:
+            _release_ip(allocator, registry, ip)
+        raise
+    return ret
+
+
+def _add_address(ip_route, index, ip, prefixlen):
+    if ip.version == 6:
+        # Duplicate address detection keeps the address tentative for a second or so, and it can't be bound meanwhile.
+        # Random IPv6 addresses don't collide, therefore detection is skipped.
+        ip_route.addr('add', index, address=str(ip), mask=prefixlen, flags=IFA_F_NODAD)
+    else:
+        ip_route.addr('add', index, address=str(ip), mask=prefixlen)
+    topology.add_address(index, str(ip), prefixlen)
+
+
+def _get_assigned_ips(dut):
+    return topology.get_gateways() | topology.get_local_ip_addresses() | {str(dut.ip)}
+
+
+class InterfacePool(object):
+    """ Dummy interfaces, which are created once and are leased to tests.
+
+    Tests only add and remove their addresses, instead of creating and deleting an interface per test.
+    This avoids link churn: udev events, neighbor table flushes, etc.
+    An interface could be leased to several tests at once, so the pool of 1 interface is the shared interface.
+    Interfaces are created on the first lease and are removed at exit by force_cleanup().
+    """
+    def __init__(self, size, instance_id=''):
+        """
+        :param size: number of interfaces
+        :type size: int
+
+        :param instance_id: ID of this instance
+        :type instance_id: str
+        """
+        self.__size = size
+        self.__instance_id = instance_id
+        # index -> (ifname, number of tests)
+        self.__leases = None
+        self.__lock = threading.Lock()
+
+    def __create(self):
+        leases = {}
+        with netlink as ip_route:
+            for i in range(self.__size):
+                ifname = '{0}pool{1}'.format(get_iface_prefix(self.__instance_id), i)
+                logger.debug('Creating interface adapter:"{0}"'.format(ifname))
+                ip_route.link("add", kind="dummy", ifname=ifname)
+                leases[ip_route.link_lookup(ifname=ifname)[0]] = [ifname, 0]
+        return leases
+
+    def lease(self):
+        """
+        :returns: index and name of the least loaded interface
+        :rtype: (int, str)
+        """
+        with self.__lock:
+            if self.__leases is None:
+                self.__leases = self.__create()
+            index = min(self.__leases, key=lambda i: self.__leases[i][1])
+            self.__leases[index][1] += 1
+            return index, self.__leases[index][0]
+
+    def release(self, index):
+        with self.__lock:
+            self.__leases[index][1] -= 1
+
+
+def _get_packet_counters(ifname):
+    """
+    :returns: number of transmitted and received packets of the interface
+    :rtype: (int, int)
+    """
+    ret = []
+    for name in ("tx_packets", "rx_packets"):
+        try:
+            with open(os.path.join("/sys/class/net", ifname, "statistics", name), "r") as f:
+                ret.append(int(f.read()))
+        except (OSError, ValueError):
+            ret.append(0)
+    return tuple(ret)
+
+
+class SourceRouting(object):
+    """ Policy routing, which makes the traffic of every source pool leave through the pool's interface.
+
+    Routes of the interface are copied from the main table to a dedicated table,
+    and rules make packets from the pool networks look up this table.
+    Thus the traffic of tests is spread over several NICs instead of the one, which routes to the DUT.
+    """
+    def __init__(self, pools, allocator):
+        """
+        :param pools: networks and egress interface of every source pool, in order of the allocator ranges
+        :type pools: list((list(ipaddress.IPv4Network or ipaddress.IPv6Network), str))
+
+        :param allocator: allocator of IPs, which allocates from the pools
+        :type allocator: IPAllocator
+        """
+        self.__pools = pools
+        self.__allocator = allocator
+        # All the pools are of the DUT IP version
+        self.__family = AF_INET6 if pools[0][0][0].version == 6 else AF_INET
+        # ifname -> routing table
+        self.__tables = collections.OrderedDict()
+        # keyword arguments of the added rules
+        self.__rules = []
+
+    def setup(self):
+        with netlink as ip_route:
+            try:
+                for networks, ifname in self.__pools:
+                    table = self.__tables.get(ifname)
+                    if table is None:
+                        table = DEFAULT_SOURCE_ROUTING_TABLE + len(self.__tables)
+                        self.__tables[ifname] = table
+                        SourceRouting.__copy_routes(ip_route, ifname, self.__family, table)
+                    for network in networks:
+                        rule = {"family": self.__family,
+                                "table": table,
+                                "priority": DEFAULT_SOURCE_ROUTING_PRIORITY,
+                                "src": str(network.network_address),
+                                "src_len": network.prefixlen}
+                        try:
+                            # Left by a previous run, which has been killed
+                            ip_route.rule('del', **rule)
+                        except pyroute2.NetlinkError:
+                            pass
+                        logger.debug('Routing traffic from "{0}" via interface "{1}"'.format(network, ifname))
+                        ip_route.rule('add', **rule)
+                        self.__rules.append(rule)
+            except:
+                logger.error('Problem found setting up source pools routing')
+                self.shutdown()
+                raise
+
+    @staticmethod
+    def __copy_routes(ip_route, ifname, family, table):
+        indexes = ip_route.link_lookup(ifname=ifname)
+        if not indexes:
+            raise Exception('Interface "{0}" of a source pool is not found'.format(ifname))
+        ip_route.flush_routes(table=table, family=family)
+        count = 0
+        for route in ip_route.get_routes(family=family, table=RT_TABLE_MAIN):
+            if route.get_attr('RTA_OIF') != indexes[0]:
+                continue
+            kwargs = {"family": family,
+                      "table": table,
+                      "oif": indexes[0],
+                      "dst_len": route['dst_len'],
+                      "scope": route['scope']}
+            if route.get_attr('RTA_DST'):
+                kwargs["dst"] = route.get_attr('RTA_DST')
+            if route.get_attr('RTA_GATEWAY'):
+                kwargs["gateway"] = route.get_attr('RTA_GATEWAY')
+            ip_route.route('add', **kwargs)
+            count += 1
+        if not count:
+            raise Exception('Interface "{0}" of a source pool has no routes'.format(ifname))
+        logger.debug('Copied {0} routes of interface "{1}" to table {2}'.format(count, ifname, table))
+
+    def shutdown(self):
+        with netlink as ip_route:
+            for rule in self.__rules:
+                try:
+                    ip_route.rule('del', **rule)
+                except pyroute2.NetlinkError as e:
+                    logger.warning('Unable to delete rule for "{0}/{1}": {2}'.format(rule["src"], rule["src_len"], e))
+            self.__rules = []
+            for ifname, table in self.__tables.items():
+                try:
+                    ip_route.flush_routes(table=table, family=self.__family)
+                except pyroute2.NetlinkError as e:
+                    logger.warning('Unable to flush table {0}: {1}'.format(table, e))
+            self.__tables.clear()
+
+    def snapshot(self):
+        """
+        :returns: packet counters of the pool interfaces and allocator statistics, to be passed to report()
+        """
+        return (dict((ifname, _get_packet_counters(ifname)) for _, ifname in self.__pools),
+                self.__allocator.get_stats())
+
+    def report(self, snapshot, elapsed):
+        """
+        :param snapshot: the value of snapshot() at the beginning of the period
+        :param elapsed: duration of the period in seconds
+        :type elapsed: float
+
+        :returns: human-readable throughput of every source pool during the period
+        :rtype: list(str)
+        """
+        counters, stats = snapshot
+        now_counters, now_stats = self.snapshot()
+        elapsed = max(elapsed, 1)
+        ret = []
+        for (networks, ifname), (_, total), (_, now_total) in zip(self.__pools, stats, now_stats):
+            tx = (now_counters[ifname][0] - counters[ifname][0]) / elapsed
+            rx = (now_counters[ifname][1] - counters[ifname][1]) / elapsed
+            ret.append('Source pool {0} via {1}: {2} UAs, {3:.0f} tx pps, {4:.0f} rx pps'.format(
+                ",".join(str(n) for n in networks), ifname, now_total - total, tx, rx))
+        return ret
+
+    def get_interface(self, ip):
+        """
+        :returns: egress interface of the source pool, which the address belongs to, or None
+        :rtype: str
+        """
+        ip = ipaddress.ip_address(ip)
+        for networks, ifname in self.__pools:
+            if any(ip in network for network in networks):
+                return ifname
+        return None
+
+
+def get_egress_interface(dut, ip, source_routing=None):
+    """
+    :param dut: DUT address
+    :type dut: str
+
+    :param ip: UA address
+    :type ip: str
+
+    :param source_routing: policy routing of source pools, if used
+    :type source_routing: SourceRouting
+
+    :returns: interface, through which the traffic from the UA address to the DUT leaves the host, or None
+    :rtype: str
+    """
+    if source_routing:
+        ifname = source_routing.get_interface(ip)
+        if ifname:
+            return ifname
+    return topology.get_route_interface(dut, lambda ifname: IFACE_PREFIX in ifname)
+
+
+def get_signaling_filter(sip_ports):
+    """
+    :param sip_ports: SIP ports of UAs and the DUT
+    :type sip_ports: iterable(int)
+
+    :returns: BPF filter, which matches SIP and DNS packets, and IP fragments, which don't carry ports
+    :rtype: str
+    """
+    ports = sorted(set(sip_ports) | {DEFAULT_DNS_PORT})
+    return "{0} or (ip[6:2] & 0x1fff != 0) or (ip6 and ip6[6] == 44)".format(
+        " or ".join("port {0}".format(port) for port in ports))
+
+
+class EndpointPool(object):
+    """ UA endpoints (IP, port), where an IP is shared by UAs of different tests.
+
+    An IP is added to a pool interface, when a new one is needed, and is removed, when its last endpoint is released.
+    Every endpoint takes a block of DEFAULT_UA_PORT_BLOCK ports, so SIP, 3PCC and media sockets of UAs don't clash.
+    UAs of the same test always get different IPs, so 3PCC configuration and pcap filters remain unambiguous.
+    """
+    def __init__(self, interface_pool, allocator, ports_per_ip, first_port, registry=None):
+        """
+        :param interface_pool: pool of interfaces to add IPs to
+        :type interface_pool: InterfacePool
+
+        :param allocator: allocator of IPs
+        :type allocator: IPAllocator
+
+        :param ports_per_ip: number of endpoints, which share an IP
+        :type ports_per_ip: int
+
+        :param first_port: SIP port of the first endpoint of an IP
+        :type first_port: int
+
+        :param registry: host-wide lease registry
+        :type registry: LeaseRegistry
+        """
+        self.__interface_pool = interface_pool
+        self.__allocator = allocator
+        self.__ports = [first_port + i * DEFAULT_UA_PORT_BLOCK for i in range(ports_per_ip)]
+        self.__registry = registry
+        # ip -> [interface index, prefixlen, free ports, number of leased ports]
+        self.__addrs = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+    def lease(self, count, dut):
+        """
+        :param count: number of endpoints
+        :type count: int
+
+        :param dut: DUT, which IP shouldn't be used
+        :type dut: DUT or DUTv6
+
+        :returns: endpoints on different IPs
+        :rtype: list((ipaddress.IPv4Address or ipaddress.IPv6Address, int))
+        """
+        ret = []
+        with self.__lock:
+            try:
+                # Fill up existing IPs first, so fewer IPs are needed
+                for ip, addr in self.__addrs.items():
+                    if len(ret) == count:
+                        break
+                    if addr[2]:
+                        ret.append((ip, self.__lease_port(addr)))
+                if len(ret) < count:
+                    picked = _allocate_ips(self.__allocator, self.__registry, dut, count - len(ret))
+                    with netlink as ip_route:
+                        for i, (ip, prefixlen) in enumerate(picked):
+                            index, ifname = self.__interface_pool.lease()
+                            try:
+                                logger.debug('Adding IP:"{0}" to interface:"{1}"'.format(ip, ifname))
+                                _add_address(ip_route, index, ip, prefixlen)
+                            except:
+                                logger.error('Problem found adding IP:"{0}" to interface:"{1}"'.format(ip, ifname))
+                                self.__interface_pool.release(index)
+                                for unused_ip, _ in picked[i:]:
+                                    _release_ip(self.__allocator, self.__registry, unused_ip)
+                                raise
+                            addr = [index, prefixlen, collections.deque(self.__ports), 0]
+                            self.__addrs[ip] = addr
+                            ret.append((ip, self.__lease_port(addr)))
+            except:
+                self.__release(ret)
+                raise
+        return ret
+
+    @staticmethod
+    def __lease_port(addr):
+        addr[3] += 1
+        return addr[2].popleft()
+
+    def release(self, endpoints):
+        """
+        :param endpoints: endpoints, returned by lease()
+        :type endpoints: list((ipaddress.IPv4Address or ipaddress.IPv6Address, int))
+        """
+        with self.__lock:
+            self.__release(endpoints)
+
+    def __release(self, endpoints):
+        for ip, port in endpoints:
+            addr = self.__addrs[ip]
+            addr[2].append(port)
+            addr[3] -= 1
+            if addr[3] == 0:
+                # The last UA on this IP is gone
+                del self.__addrs[ip]
+                index, prefixlen = addr[0], addr[1]
+                with netlink as ip_route:
+                    try:
+                        logger.debug('Deleting shared IP:"{0}"'.format(ip))
+                        ip_route.addr('del', index, address=str(ip), mask=prefixlen)
+                        topology.remove_address(index, str(ip), prefixlen)
+                    finally:
+                        self.__interface_pool.release(index)
+                        _release_ip(self.__allocator, self.__registry, ip)
+
+
 class SIPpNetwork():
     """ Represents a LAN Network where sipp scenario can be run
     """
-    def __init__(self, dut, mask, interface):
+    def __init__(self, dut, mask, interface, allocator, pool=None, registry=None, endpoint_pool=None,
+                 capture_backend=DEFAULT_CAPTURE_BACKEND, pcap_rotate_bytes=None, pcap_rotate_seconds=None,
+                 capture_engine=None, capture_profile=DEFAULT_CAPTURE_PROFILE):
+
+        self.dut = get_dut(dut, mask)
+        self.__allocator = allocator
+        self.__pool = pool
+        self.__registry = registry
+        self.__endpoint_pool = endpoint_pool
+        # (ip, prefixlen) of the added addresses
+        self.__addrs = []
+        self.ips = []
+        # (ip, port) of the shared endpoints
+        self.endpoints = []
+        # The pcap file is named after the test run, even if the interface is shared
+        self.capture_name = '{0}-{1}'.format(IFACE_PREFIX, interface)
+        self.__capture_engine = capture_engine
+        self.__capture_registered = False
+        self.__capture_profile = capture_profile
+        if capture_engine:
+            # The test registers its endpoints in the shared capture instead
+            self.__sniffer = None
+        else:
+            self.__sniffer = Sniffer.create_sniffer(capture_backend, self.capture_name,
+                                                    pcap_rotate_bytes, pcap_rotate_seconds, capture_profile)
 
-        self.dut = DUT(u'{0}/{1}'.format(dut, mask))
+        self.__leased = False
+        if endpoint_pool:
+            # Endpoints live on the pool interfaces
+            self.interface = None
+            return
+        if pool:
+            self.__index, self.interface = pool.lease()
+            self.__leased = True
+            logger.debug('Leased interface adapter:"{0}"'.format(self.interface))
+            return
 
         # Interface name always have our prefix
-        self.interface = '{0}-{1}'.format(IFACE_PREFIX, interface)
+        self.interface = '{0}{1}'.format(get_iface_prefix(registry.instance_id if registry else ''), interface)
         # Stop if exists
-        SIPpNetwork._check_available_interface(interface)
+        SIPpNetwork._check_available_interface(self.interface)
         # Creating interface adapter for real
-        with pyroute2.IPRoute() as ip_route:
+        with netlink as ip_route:
             try:
                 logger.debug('Creating interface adapter:"{0}"'.format(self.interface))
                 ip_route.link("add", kind="dummy", ifname=self.interface)
+                # Remember the index, so we don't need to look it up for every address
+                self.__index = ip_route.link_lookup(ifname=self.interface)[0]
             except:
                 logger.error('Problem found creating interface adapter:"{0}"'.format(self.interface))
                 raise
             else:
                 logger.debug('Created interface adapter:"{0}"'.format(self.interface))
 
-        self.ips = []
-        self.__sniffer = Sniffer.SIPpSniffer(self.interface)
-
     @staticmethod
     def _check_available_interface(interface):
         ret = None
-        with pyroute2.IPRoute() as ip_route:
+        with netlink as ip_route:
             if len(ip_route.link_lookup(ifname=interface)) == 0:
                 logger.debug('interface adapter name "{0}" is available'.format(interface))
                 ret = True
@@ -88,122 +611,160 @@ class SIPpNetwork():
         ret = '<dut:"{0}" interface:"{1}" ips:"{2}">'.format(self.dut, self.interface, self.ips)
         return ret                
 
+    def add_random_ips(self, count):
+        """ Assigns several random available IPs to the interface at once.
+        IPs are picked and probed first, then the netlink session is held for adding the whole batch.
+
+        :param count: number of IPs to add
+        :type count: int
+
+        :returns: added IPs
+        :rtype: list(str)
+        """
+        ret = []
+        picked = _allocate_ips(self.__allocator, self.__registry, self.dut, count)
+        with netlink as ip_route:
+            for i, (ip, prefixlen) in enumerate(picked):
+                try:
+                    logger.debug('Adding IP:"{0}" to interface:"{1}"'.format(ip, self.interface))
+                    _add_address(ip_route, self.__index, ip, prefixlen)
+                except:
+                    logger.error('Problem found adding IP:"{0}" to interface:"{1}"'.format(ip, self.interface))
+                    for unused_ip, _ in picked[i:]:
+                        self.__release_ip(unused_ip)
+                    raise
+                else:
+                    logger.debug('Created IP:"{0}" in interface adapter:"{1}"'.format(ip, self.interface))
+                    self.ips.append(ip)
+                    self.__addrs.append((ip, prefixlen))
+                    ret.append(str(ip))
+        return ret
+
     def add_random_ip(self):
-        # Find a random IP
-        ip = SIPpNetwork._get_random_available_ip(self.dut.network)
-        logger.debug('Picked a random IP to generate the UA: "{0}"'.format(ip))
-        # Creating interface adapter
-        with pyroute2.IPRoute() as ip_route:
-            try:
-                logger.debug('Adding IP:"{0}" to interface:"{1}"'.format(ip, self.interface))
-                index = ip_route.link_lookup(ifname=self.interface)[0]
-                ip_route.addr('add', index, address=str(ip), mask=self.dut.network.prefixlen)
-            except:
-                logger.error('Problem found adding IP:"{0}" to interface:"{1}"'.format(ip, self.interface))
-                raise
-            else:
-                logger.debug('Created IP:"{0}" in interface adapter:"{1}"'.format(ip, self.interface))
-                self.ips.append(ip)
-                return str(ip)
+        return self.add_random_ips(1)[0]
+
+    def add_random_endpoints(self, count):
+        """ Assigns random available endpoints to UAs.
+        Without the endpoint pool every UA gets a dedicated IP and the port is left to the caller.
+
+        :param count: number of endpoints
+        :type count: int
+
+        :returns: added endpoints
+        :rtype: list((str, int))
+        """
+        if not self.__endpoint_pool:
+            return [(ip, None) for ip in self.add_random_ips(count)]
+        endpoints = self.__endpoint_pool.lease(count, self.dut)
+        self.endpoints.extend(endpoints)
+        self.ips.extend(ip for ip, _ in endpoints)
+        return [(str(ip), port) for ip, port in endpoints]
 
     @staticmethod
     def get_interfaces():
         """
         :returns: Names of interfaces, which are currently UP
-        :rtype: set(str)
+        :rtype: frozenset(str)
         """
-        ifaces = set()
-        with pyroute2.IPRoute() as ip_route:
-            for link in ip_route.get_links():
-                if link["state"] == "up":
-                    for name, value in link["attrs"]:
-                        if name == "IFLA_IFNAME":
-                            ifaces.add(value)
-        return ifaces
-
-    @staticmethod
-    def __arp_ping(ip):
-        """ Performs ARP-ping on L2.
-        http://www.aviran.org/arp-ping-with-python-and-scapy/
-
-        :returns: True if ARP-ping succeeds, False if fails
-        :rtype: bool
-        """
-        ret = False
-        ifaces = SIPpNetwork.get_interfaces()
-        for iface in ifaces:
-            answered, unanswered = srp(Ether(dst="ff:ff:ff:ff:ff:ff") / ARP(pdst=ip),
-                                       timeout=0.1, # seconds
-                                       verbose=False,
-                                       iface=iface)
-            if answered:
-                ret = True
-                break
-        return ret
+        return topology.get_interfaces()
 
-    @staticmethod
-    def __get_gateways():
-        gateways = set()
-        with pyroute2.IPRoute() as ip_route:
-            for route in ip_route.get_routes(family=AF_INET):
-                for name, value in route["attrs"]:
-                    if name == "RTA_GATEWAY":
-                        gateways.add(value)
-        return gateways
-
-    @staticmethod
-    def __get_local_ip_addresses():
-        ips = set()
-        with pyroute2.IPRoute() as ip_route:
-            for addr in ip_route.get_addr(family=AF_INET):
-                 for name, value in addr["attrs"]:
-                    if name == "IFA_ADDRESS":
-                        ips.add(value)
-        return ips
+    def sniffer_start(self, folder, sip_ports=()):
+        """
+        :param folder: folder to write pcap files to
+        :type folder: str
 
-    @staticmethod
-    def _get_random_available_ip(network):
-        assigned_ips = SIPpNetwork.__get_gateways() | SIPpNetwork.__get_local_ip_addresses()
-        ret = None
-        hosts = list(ipaddress.IPv4Network(network).hosts())
-        random.shuffle(hosts)
-        for ip in hosts:
-            if str(ip) in assigned_ips:
-                logger.debug('IP "{0}" is already assigned'.format(ip))
+        :param sip_ports: SIP ports of UAs and the DUT, packets of other ports are media for the capture profile
+        :type sip_ports: iterable(int)
+        """
+        signaling_ports = set(sip_ports) | {DEFAULT_DNS_PORT}
+        if self.__capture_engine:
+            if self.endpoints:
+                endpoints = [(str(ip), port, port + DEFAULT_UA_PORT_BLOCK - 1) for ip, port in self.endpoints]
             else:
-                if not SIPpNetwork.__arp_ping(str(ip)):
-                    logger.debug('IP "{0}" is down, we can use it'.format(ip))
-                    ret = ip
-                    break
-                logger.debug('IP "{0}" is up, continue searching'.format(ip))
-        if not ret:
-            raise IPNotAvailable('Unable to find an available ip')
-        return ret
+                endpoints = [(str(ip), None, None) for ip in self.ips]
+            self.__capture_engine.register(self.capture_name, folder, endpoints, signaling_ports)
+            self.__capture_registered = True
+            return
+        if self.endpoints:
+            # The IPs are shared with other tests, so their traffic is told apart by ports
+            filter = " or ".join("(host {0} and portrange {1}-{2})".format(ip, port, port + DEFAULT_UA_PORT_BLOCK - 1)
+                                 for ip, port in self.endpoints)
+        else:
+            filter = "host ({0})".format(" or ".join(str(ip) for ip in self.ips))
+        if self.__capture_profile == PROFILE_SIGNALING:
+            # Media packets are dropped by the kernel, instead of being copied to us
+            filter = "({0}) and ({1})".format(filter, get_signaling_filter(sip_ports))
+        self.__sniffer.start(filter, folder, signaling_ports)
 
-    def sniffer_start(self, folder):
-        filter = "host ({0})".format(" or ".join(str(ip) for ip in self.ips))
-        self.__sniffer.start(filter, folder)
-
-    def sniffer_stop(self):
+    def sniffer_stop(self, since=None):
+        """
+        :param since: time.monotonic(), after which the test has no more traffic to capture, or None if it's now.
+                      Capturing is stopped without waiting, if the kernel has already handed the frames over by that time.
+        :type since: float
+        """
+        if self.__capture_engine:
+            if self.__capture_registered:
+                self.__capture_registered = False
+                self.__capture_engine.unregister(self.capture_name, since)
+            return
         try:
-            self.__sniffer.stop()
+            self.__sniffer.stop(since)
         except Scapy_Exception as e:
             logger.error('Error stopping Sniffer:"{0}"'.format(e))
             pass
 
     def shutdown(self):
+        if self.__endpoint_pool:
+            endpoints, self.endpoints, self.ips = self.endpoints, [], []
+            self.__endpoint_pool.release(endpoints)
+            return
+        if self.__pool:
+            if self.__leased:
+                self.__remove_ips()
+            return
         # Deleting interface adapter
-        with pyroute2.IPRoute() as ip_route:
+        with netlink as ip_route:
             try:
                 logger.debug('Deleting interface adapter:"{0}"'.format(self.interface))
                 index = ip_route.link_lookup(ifname=self.interface)[0]
                 ip_route.link("del", index=index)
+                topology.remove_link(index)
             except IndexError:
                 logger.warning('When removing, unable to find adapter:"{0}"'.format(self.interface))
-                pass
+                self.__release_ips()
             # raise
             except:
                 logger.error('Problem found deleting interface adapter:"{0}"'.format(self.interface))
                 raise
             else:
                 logger.debug('Deleted interface adapter:"{0}"'.format(self.interface))
+                self.__release_ips()
+
+    def __remove_ips(self):
+        """ Removes our addresses from the leased interface and returns the interface to the pool
+        """
+        with netlink as ip_route:
+            try:
+                for ip, prefixlen in list(self.__addrs):
+                    logger.debug('Deleting IP:"{0}" from interface:"{1}"'.format(ip, self.interface))
+                    ip_route.addr('del', self.__index, address=str(ip), mask=prefixlen)
+                    topology.remove_address(self.__index, str(ip), prefixlen)
+                    self.__addrs.remove((ip, prefixlen))
+                    self.__release_ip(ip)
+            except:
+                logger.error('Problem found deleting IP:"{0}" from interface adapter:"{1}"'.format(ip, self.interface))
+                raise
+            finally:
+                self.ips = [ip for ip, _ in self.__addrs]
+                self.__pool.release(self.__index)
+                self.__leased = False
+
+    def __release_ips(self):
+        # Addresses are gone together with the interface, so they could be reused by the next tests
+        for ip in self.ips:
+            self.__release_ip(ip)
+        self.ips = []
+        self.__addrs = []
+
+    def __release_ip(self, ip):
+        _release_ip(self.__allocator, self.__registry, ip)
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import logging
+import os
+import re
+import sys
+import heapq
+import json
+import struct
+import argparse
+
+logger = logging.getLogger(__name__)
+
+DLT_EN10MB = 1
+SNAPLEN = 65535
+# Packets are held back for this long (by capture timestamp) to be sorted
+REORDER_WINDOW_USEC = 500000
+# Upper bound of held back packets, so memory stays constant at any packet rate
+REORDER_MAX_PACKETS = 4096
+BUFFER_SIZE = 1 << 20
+
+pcap_hdr = struct.Struct("<IHHiIII")
+pcap_rec_hdr = struct.Struct("<IIII")
+# Call-ID index is written next to every pcap file
+INDEX_EXT = "index"
+# SIP headers are expected to fit into the first packet of a message
+MAX_SIP_HEADERS = 4096
+
+# What is written of the traffic of a test
+PROFILE_FULL = "full"           # all the packets as is
+PROFILE_SIGNALING = "signaling" # SIP and DNS packets only
+PROFILE_HEADERS = "headers"     # SIP and DNS packets, and headers of media packets
+PROFILES = [PROFILE_FULL, PROFILE_SIGNALING, PROFILE_HEADERS]
+# Ethernet, VLAN tag, IPv6, UDP and RTP headers
+HEADERS_SNAPLEN = 96
+
+ETH_HLEN = 14
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86dd
+ETH_P_8021Q = 0x8100
+# Protocols, which have source and destination ports at the beginning of their header
+PORT_PROTOCOLS = (6, 17, 132)  # TCP, UDP, SCTP
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+
+def _parse_frame(frame):
+    # Returns packed source and destination addresses, protocol and offset of the transport header,
+    # which is None if the transport header isn't in the frame
+    if len(frame) < ETH_HLEN:
+        return None
+    offset = ETH_HLEN
+    ethertype = frame[12] << 8 | frame[13]
+    if ethertype == ETH_P_8021Q and len(frame) >= ETH_HLEN + 4:
+        ethertype = frame[16] << 8 | frame[17]
+        offset += 4
+    if ethertype == ETH_P_IP and len(frame) >= offset + 20:
+        src, dst = frame[offset + 12:offset + 16], frame[offset + 16:offset + 20]
+        protocol = frame[offset + 9]
+        # Only the first fragment has the ports
+        is_first_fragment = not (frame[offset + 6] & 0x1f or frame[offset + 7])
+        l4 = offset + (frame[offset] & 0x0f) * 4 if is_first_fragment else None
+    elif ethertype == ETH_P_IPV6 and len(frame) >= offset + 40:
+        src, dst = frame[offset + 8:offset + 24], frame[offset + 24:offset + 40]
+        # Extension headers are not followed
+        protocol = frame[offset + 6]
+        l4 = offset + 40
+    else:
+        return None
+    return src, dst, protocol, l4
+
+
+def classify(frame):
+    """
+    Extracts addresses and ports of an Ethernet frame without building a packet object.
+
+    :param frame: captured frame
+    :type frame: bytes
+
+    :returns: packed source and destination addresses, source and destination ports or None, or None if it's not an IP frame
+    :rtype: (bytes, bytes, int, int)
+    """
+    fields = _parse_frame(frame)
+    if not fields:
+        return None
+    src, dst, protocol, l4 = fields
+    if l4 is not None and protocol in PORT_PROTOCOLS and len(frame) >= l4 + 4:
+        return src, dst, frame[l4] << 8 | frame[l4 + 1], frame[l4 + 2] << 8 | frame[l4 + 3]
+    return src, dst, None, None
+
+
+def parse_sip(payload):
+    """
+    Extracts the fields, which identify a SIP message, from its start line and headers.
+    Header values, folded over several lines, are not supported.
+
+    :param payload: UDP or TCP payload
+    :type payload: bytes
+
+    :returns: Call-ID, CSeq number, method and status code (None for requests), or None if it's not a SIP message
+    :rtype: (str, int, str, int)
+    """
+    end = payload.find(b"\r\n\r\n", 0, MAX_SIP_HEADERS)
+    lines = payload[:end if end >= 0 else MAX_SIP_HEADERS].split(b"\r\n")
+    if lines[0].startswith(b"SIP/2.0 ") and lines[0][8:11].isdigit():
+        method, status = None, int(lines[0][8:11])
+    elif lines[0].endswith(b" SIP/2.0"):
+        method, status = lines[0].split(b" ", 1)[0].decode("ascii", "replace"), None
+    else:
+        return None
+    call_id = None
+    cseq = None
+    for line in lines[1:]:
+        name, sep, value = line.partition(b":")
+        if not sep:
+            continue
+        name = name.strip().lower()
+        if name in (b"call-id", b"i"):
+            call_id = value.strip().decode("utf-8", "replace")
+        elif name == b"cseq":
+            tokens = value.split()
+            if len(tokens) == 2 and tokens[0].isdigit():
+                cseq = int(tokens[0])
+                if method is None:
+                    # Responses refer to the method of the request in CSeq
+                    method = tokens[1].decode("ascii", "replace")
+    if not call_id:
+        return None
+    return call_id, cseq, method, status
+
+
+def get_sip(frame):
+    """
+    :param frame: captured frame
+    :type frame: bytes
+
+    :returns: the same as parse_sip() for the UDP or TCP payload of the frame
+    :rtype: (str, int, str, int)
+    """
+    fields = _parse_frame(frame)
+    if not fields or fields[3] is None:
+        return None
+    protocol, l4 = fields[2:]
+    if protocol == IPPROTO_UDP:
+        payload = frame[l4 + 8:]
+    elif protocol == IPPROTO_TCP and len(frame) >= l4 + 13:
+        payload = frame[l4 + (frame[l4 + 12] >> 4) * 4:]
+    else:
+        return None
+    return parse_sip(payload) if payload else None
+
+
+class PcapWriter(object):
+    """
+    Writes packets to a pcap file as they are captured.
+
+    Packets, captured on different interfaces or by different CPUs, might arrive slightly out of order.
+    Therefore they are held back in a heap for up to REORDER_WINDOW_USEC to be written in timestamp order (issue #58).
+    A packet, which arrives later than that, is written as is.
+
+    The file could be rotated by size and by time: "<name>.pcap" is followed by "<name>_1.pcap", "<name>_2.pcap", etc.
+
+    Unless the profile is PROFILE_FULL, media packets are dropped or truncated.
+    A packet is a media packet, if neither of its ports is a signaling port.
+    Packets without ports, such as ICMP or IP fragments, are always written.
+
+    Every SIP message is recorded in the "<file>.index" file next to the pcap file,
+    so the packets of a single call could be extracted without reading the whole pcap file, see extract().
+    A SIP message, which starts in the middle of a TCP segment, isn't recorded.
+    """
+    def __init__(self, folder, name, rotate_bytes=None, rotate_seconds=None,
+                 profile=PROFILE_FULL, signaling_ports=(), linktype=DLT_EN10MB):
+        """
+        :param folder: folder to write files to
+        :type folder: str
+
+        :param name: file name without extension
+        :type name: str
+
+        :param rotate_bytes: start a new file, when the current one exceeds the size
+        :type rotate_bytes: int
+
+        :param rotate_seconds: start a new file, when the current one spans this period of capture time
+        :type rotate_seconds: int
+
+        :param profile: what is written, one of PROFILES
+        :type profile: str
+
+        :param signaling_ports: SIP and DNS ports
+        :type signaling_ports: iterable(int)
+        """
+        self.__folder = folder
+        self.__name = name
+        self.__rotate_bytes = rotate_bytes
+        self.__rotate_usec = rotate_seconds * 1000000 if rotate_seconds else None
+        self.__linktype = linktype
+        self.__profile = profile
+        self.__signaling_ports = frozenset(signaling_ports)
+        self.__heap = []
+        self.__seq = 0
+        self.__newest = 0
+        self.__file = None
+        self.__index = None
+        self.__file_index = 0
+        self.__file_bytes = 0
+        self.__file_start = None
+        self.packets = 0
+        self.__open()
+
+    def __get_path(self):
+        if self.__file_index:
+            return os.path.join(self.__folder, '{0}_{1}.pcap'.format(self.__name, self.__file_index))
+        return os.path.join(self.__folder, '{0}.pcap'.format(self.__name))
+
+    def __open(self):
+        self.__file = open(self.__get_path(), "wb", buffering=BUFFER_SIZE)
+        self.__index = open("{0}.{1}".format(self.__get_path(), INDEX_EXT), "w")
+        self.__file.write(pcap_hdr.pack(0xa1b2c3d4, 2, 4, 0, 0, SNAPLEN, self.__linktype))
+        self.__file_bytes = pcap_hdr.size
+        self.__file_start = None
+
+    def __rotate(self):
+        self.__file.close()
+        self.__index.close()
+        self.__file_index += 1
+        logger.debug('Rotating pcap file to "{0}"'.format(self.__get_path()))
+        self.__open()
+
+    def write(self, sec, usec, data, length=None):
+        """
+        :param sec: capture timestamp, seconds
+        :type sec: int
+
+        :param usec: capture timestamp, microseconds
+        :type usec: int
+
+        :param data: captured bytes of the packet
+        :type data: bytes
+
+        :param length: original length of the packet, if it has been truncated
+        :type length: int
+        """
+        if self.__profile != PROFILE_FULL and self.__is_media(data):
+            if self.__profile == PROFILE_SIGNALING:
+                return
+            if length is None:
+                length = len(data)
+            data = data[:HEADERS_SNAPLEN]
+        ts = sec * 1000000 + usec
+        heapq.heappush(self.__heap, (ts, self.__seq, data, length if length is not None else len(data)))
+        self.__seq += 1
+        self.__newest = max(self.__newest, ts)
+        while self.__heap and (self.__heap[0][0] <= self.__newest - REORDER_WINDOW_USEC or
+                               len(self.__heap) > REORDER_MAX_PACKETS):
+            self.__write_record(*heapq.heappop(self.__heap))
+
+    def __is_media(self, data):
+        fields = classify(data)
+        return (fields is not None and fields[2] is not None and
+                fields[2] not in self.__signaling_ports and fields[3] not in self.__signaling_ports)
+
+    def __write_record(self, ts, seq, data, length):
+        size = pcap_rec_hdr.size + len(data)
+        if self.__file_start is not None:
+            if (self.__rotate_bytes and self.__file_bytes + size > self.__rotate_bytes) or \
+               (self.__rotate_usec and ts - self.__file_start >= self.__rotate_usec):
+                self.__rotate()
+        if self.__file_start is None:
+            self.__file_start = ts
+        self.__index_record(ts, data)
+        self.__file.write(pcap_rec_hdr.pack(ts // 1000000, ts % 1000000, len(data), length))
+        self.__file.write(data)
+        self.__file_bytes += size
+        self.packets += 1
+
+    def __index_record(self, ts, data):
+        fields = classify(data)
+        if not fields or fields[2] is None:
+            return
+        if self.__signaling_ports and fields[2] not in self.__signaling_ports and fields[3] not in self.__signaling_ports:
+            return
+        sip = get_sip(data)
+        if sip:
+            call_id, cseq, method, status = sip
+            entry = {
+                "call_id": call_id,
+                "offset": self.__file_bytes,
+                "time": ts / 1000000,
+                "method": method,
+                "status": status,
+            }
+            self.__index.write(json.dumps(entry) + "\n")
+
+    def close(self):
+        """
+        Writes the held back packets and closes the current file.
+        """
+        if self.__file:
+            while self.__heap:
+                self.__write_record(*heapq.heappop(self.__heap))
+            self.__file.close()
+            self.__index.close()
+            self.__file = None
+            self.__index = None
+
+
+def read_records(pcap_path):
+    """
+    Reads records of a pcap file one by one, so memory usage doesn't depend on the file size.
+
+    :param pcap_path: path to the pcap file
+    :type pcap_path: str
+
+    :returns: capture timestamp seconds, microseconds and captured bytes of every packet
+    :rtype: generator((int, int, bytes))
+    """
+    with open(pcap_path, "rb", buffering=BUFFER_SIZE) as f:
+        f.read(pcap_hdr.size)
+        while True:
+            rec_hdr = f.read(pcap_rec_hdr.size)
+            if len(rec_hdr) < pcap_rec_hdr.size:
+                break
+            sec, usec, incl_len, orig_len = pcap_rec_hdr.unpack(rec_hdr)
+            yield sec, usec, f.read(incl_len)
+
+
+def get_rotated_paths(folder, name):
+    """
+    :param folder: folder, where a pcap file has been written
+    :type folder: str
+
+    :param name: file name without extension, as passed to PcapWriter
+    :type name: str
+
+    :returns: paths of the pcap files, written by PcapWriter, rotated files follow the file they've been rotated from.
+              Other pcap files in the folder, for ex. media files of the test, are not returned
+    :rtype: list(str)
+    """
+    rotated = re.compile(r'^{0}_([0-9]+)\.pcap$'.format(re.escape(name)))
+    indexes = []
+    for filename in os.listdir(folder):
+        if filename == "{0}.pcap".format(name):
+            indexes.append(0)
+            continue
+        m = rotated.match(filename)
+        if m:
+            indexes.append(int(m.group(1)))
+    return [os.path.join(folder, "{0}_{1}.pcap".format(name, i) if i else "{0}.pcap".format(name))
+            for i in sorted(indexes)]
+
+
+def read_index(pcap_path):
+    """
+    :param pcap_path: path to the pcap file
+    :type pcap_path: str
+
+    :returns: index entries of the pcap file
+    :rtype: list(dict)
+    """
+    entries = []
+    with open("{0}.{1}".format(pcap_path, INDEX_EXT), "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entries.append(json.loads(line))
+    return entries
+
+
+def extract(pcap_paths, call_id, output_path):
+    """
+    Copies the SIP packets of a call to a new pcap file, reading only these packets from the pcap files.
+
+    :param pcap_paths: pcap files of a test run, in the order they have been written
+    :type pcap_paths: list(str)
+
+    :param call_id: Call-ID of the call
+    :type call_id: str
+
+    :param output_path: path to the pcap file to create
+    :type output_path: str
+
+    :returns: number of extracted packets
+    :rtype: int
+    """
+    count = 0
+    with open(output_path, "wb") as out:
+        for i, pcap_path in enumerate(pcap_paths):
+            offsets = [e["offset"] for e in read_index(pcap_path) if e["call_id"] == call_id]
+            with open(pcap_path, "rb") as f:
+                if i == 0:
+                    out.write(f.read(pcap_hdr.size))
+                for offset in offsets:
+                    f.seek(offset)
+                    rec_hdr = f.read(pcap_rec_hdr.size)
+                    out.write(rec_hdr)
+                    out.write(f.read(pcap_rec_hdr.unpack(rec_hdr)[2]))
+                    count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="sipplauncher-pcap",
+                                     description="List or extract SIP calls from pcap files of a Sipplauncher test run")
+    parser.add_argument("pcap", nargs="+", help="pcap files of a test run, in the order they have been written")
+    parser.add_argument("--call-id", help="Call-ID of a call to extract. If not specified, calls are listed")
+    parser.add_argument("--output", help="pcap file to extract to. Default: \"<Call-ID>.pcap\"")
+    args = parser.parse_args()
+
+    if not args.call_id:
+        # Call-ID -> [first message time, number of messages, last status]
+        calls = {}
+        for pcap_path in args.pcap:
+            for e in read_index(pcap_path):
+                call = calls.setdefault(e["call_id"], [e["time"], 0, None])
+                call[1] += 1
+                if e["status"] is not None:
+                    call[2] = e["status"]
+        for call_id, (first_time, messages, status) in sorted(calls.items(), key=lambda c: c[1][0]):
+            print("{0} {1} {2}".format(call_id, messages, status if status is not None else "-"))
+        return
+
+    output = args.output or "{0}.pcap".format(args.call_id)
+    count = extract(args.pcap, args.call_id, output)
+    if not count:
+        os.remove(output)
+        sys.stderr.write("No packets found for {0}\n".format(args.call_id))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
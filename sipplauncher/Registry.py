@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import logging
+import os
+import fcntl
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+LOCK_EXT = "lock"
+# Serializes taking over leases of dead instances
+REGISTRY_LOCK_FILE = ".registry.lock"
+# Prefix of files with the owner, which are linked into place as leases
+TMP_PREFIX = ".claim-"
+
+# Kinds of leased resources.
+# Dummy interfaces aren't leased, as their names contain the instance ID.
+# UA ports aren't leased, as they belong to the instance, which leases their IP.
+KIND_IP = "ip"
+# Egress interfaces, whose root qdisc is replaced for network impairment
+KIND_INTERFACE = "interface"
+KINDS = [KIND_IP, KIND_INTERFACE]
+
+
+class LeaseRegistry(object):
+    """
+    Host-wide registry of resources, leased by running Sipplauncher instances.
+
+    Every instance holds an exclusive flock() on its `<instance_id>.lock` file while it's running.
+    The kernel releases the lock when the process dies, no matter how it dies.
+    Therefore an instance is alive if and only if its lock file is locked.
+
+    A resource is leased by linking `<kind>/<name>` file, which contains the owner's instance ID, into place.
+    The link is created atomically, so other instances never see a lease without its owner.
+    A lease, owned by a dead instance, could be taken over.
+    """
+    def __init__(self, folder, instance_id):
+        """
+        :param folder: folder, shared by all the instances on the host
+        :type folder: str
+
+        :param instance_id: ID of this instance
+        :type instance_id: str
+        """
+        self.__folder = folder
+        self.instance_id = instance_id
+        self.__leases = set()
+        self.__lock = threading.Lock()
+        for kind in KINDS:
+            os.makedirs(os.path.join(folder, kind), exist_ok=True)
+        self.__lock_file = open(self.__get_lock_path(instance_id), "a")
+        try:
+            fcntl.flock(self.__lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.__lock_file.close()
+            raise Exception('Sipplauncher instance "{0}" is already running'.format(instance_id))
+        logger.debug('Registered instance "{0}" at "{1}"'.format(instance_id, folder))
+
+    def __get_lock_path(self, instance_id):
+        return os.path.join(self.__folder, '{0}.{1}'.format(instance_id, LOCK_EXT))
+
+    def __get_lease_path(self, kind, name):
+        return os.path.join(self.__folder, kind, name)
+
+    def is_alive(self, instance_id):
+        """
+        :returns: whether an instance with the given ID is running
+        :rtype: bool
+        """
+        if instance_id == self.instance_id:
+            return True
+        try:
+            with open(self.__get_lock_path(instance_id), "r") as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return True
+                # Closing the file releases our lock
+                return False
+        except FileNotFoundError:
+            return False
+
+    def claim(self, kind, name):
+        """
+        :returns: True if the resource has been leased to us, False if it's leased by another running instance
+        :rtype: bool
+        """
+        path = self.__get_lease_path(kind, name)
+        # The owner is written before the lease appears under its name.
+        # Otherwise a concurrent claimer could read an empty owner, consider it dead and take the lease over.
+        fd, tmp_path = tempfile.mkstemp(prefix=TMP_PREFIX, dir=os.path.dirname(path))
+        with os.fdopen(fd, "w") as f:
+            f.write(self.instance_id)
+        try:
+            return self.__claim(kind, name, path, tmp_path)
+        finally:
+            self.__remove(tmp_path)
+
+    def __claim(self, kind, name, path, tmp_path):
+        for attempt in range(2):
+            try:
+                os.link(tmp_path, path)
+            except FileExistsError:
+                try:
+                    with open(path, "r") as f:
+                        owner = f.read().strip()
+                except FileNotFoundError:
+                    # Released concurrently, retry
+                    continue
+                if owner == self.instance_id or self.is_alive(owner):
+                    return False
+                with self.__registry_lock():
+                    # Another instance might have taken it over while we were checking
+                    try:
+                        with open(path, "r") as f:
+                            if f.read().strip() != owner:
+                                continue
+                    except FileNotFoundError:
+                        continue
+                    logger.debug('Taking over {0} "{1}" from dead instance "{2}"'.format(kind, name, owner))
+                    self.__remove(path)
+                continue
+            with self.__lock:
+                self.__leases.add((kind, name))
+            return True
+        return False
+
+    def release(self, kind, name):
+        with self.__lock:
+            if (kind, name) not in self.__leases:
+                return
+            self.__leases.discard((kind, name))
+        self.__remove(self.__get_lease_path(kind, name))
+
+    def __registry_lock(self):
+        f = open(os.path.join(self.__folder, REGISTRY_LOCK_FILE), "a")
+        fcntl.flock(f, fcntl.LOCK_EX)
+        # Closing the file releases the lock
+        return f
+
+    @staticmethod
+    def __remove(path):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def cleanup_dead(self):
+        """
+        Removes leases and lock files of dead instances.
+        """
+        dead = set()
+        with self.__registry_lock():
+            for kind in KINDS:
+                folder = os.path.join(self.__folder, kind)
+                for name in os.listdir(folder):
+                    path = os.path.join(folder, name)
+                    try:
+                        with open(path, "r") as f:
+                            owner = f.read().strip()
+                    except FileNotFoundError:
+                        continue
+                    if not owner:
+                        # The owner of a claim is being written
+                        continue
+                    # Claims, interrupted by the death of an instance, are left behind as well
+                    if owner in dead or not self.is_alive(owner):
+                        dead.add(owner)
+                        self.__remove(path)
+            for name in os.listdir(self.__folder):
+                instance_id, ext = os.path.splitext(name)
+                if name == REGISTRY_LOCK_FILE or ext != '.' + LOCK_EXT:
+                    continue
+                if not self.is_alive(instance_id):
+                    self.__remove(os.path.join(self.__folder, name))
+        if dead:
+            logger.debug('Removed leases of dead instances: {0}'.format(", ".join(sorted(dead))))
+
+    def close(self):
+        """
+        Releases all our leases and unregisters the instance.
+        """
+        with self.__lock:
+            leases, self.__leases = self.__leases, set()
+        for kind, name in leases:
+            self.__remove(self.__get_lease_path(kind, name))
+        self.__remove(self.__get_lock_path(self.instance_id))
+        self.__lock_file.close()
+        logger.debug('Unregistered instance "{0}"'.format(self.instance_id))
@@ -50,6 +50,7 @@ def run(args):
     # Collect all the tests
     try:
         start = time.time()
+        source_pools_snapshot = args.source_routing.snapshot() if args.source_routing else None
         test_pool = TestPool.collect(args)
     except Exception as err:
         logger.error('Error when collecting tests. {0}'.format(err))
@@ -128,6 +129,11 @@ def run(args):
                 tasks.append(Task(thread, test, count_total))
                 count_total += 1
 
+            # Don't let a burst of finished tests overflow the work folder,
+            # if the archiver lags behind.
+            if args.archiver:
+                args.archiver.throttle()
+
             try:
                 # Pre run hook for each test
                 for task in tasks:
@@ -153,6 +159,8 @@ def run(args):
                 # 3) we regain control and stop sniffing (inside post_run())
                 # 4) last packets (from i.1) arrive at BPF socket with few milliseconds delay - but we don't catch them!
                 # We can't synchronize BPF and TCP/IP socket, so we can only defer stopping sniffing...
+                # This also lets AF_PACKET rings hand over their last blocks for all the tests at once,
+                # so sniffers and the capture engine don't wait for every test in post_run().
                 if is_pcap(args):
                     time.sleep(PCAP_SYNC_TIMEOUT)
 
@@ -221,6 +229,9 @@ def run(args):
             logger.info('FAILED: {0}'.format(count_fail))
         _sep()
         logger.info('Total time elapsed %.0fs' % (elapsed))
+        if args.source_routing:
+            for line in args.source_routing.report(source_pools_snapshot, elapsed):
+                logger.info(line)
 
         # Returning proper exit code if required
         if count_fail:
@@ -32,6 +32,17 @@ class Scenario:
         self.__tracefilename = os.path.splitext(filename)[0]+'_trace.csv'
 
 
+    def get_shard(self, shard):
+        """
+        :param shard: shard index, starting from 1
+        :type shard: int
+
+        :returns: copy of the scenario, which is rendered for the given shard to a separate file
+        :rtype: Scenario
+        """
+        name, ext = os.path.splitext(self.__filename)
+        return Scenario("{0}_shard{1}{2}".format(name, shard, ext), self.__role)
+
     def get_filename(self):
         """
         :returns: filename of scenario
@@ -0,0 +1,681 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import os
+import re
+import time
+import signal
+import socket
+import select
+import resource
+import subprocess
+
+import sipplauncher.utils.Signals
+from .Scenario import Scenario
+from .utils.Signals import (check_signal,
+                            SignalException)
+from .utils.Utils import (is_tls_transport,
+                          which)
+from .utils.Defaults import (DEFAULT_UA_MEDIA_PORT_OFFSET,
+                             DEFAULT_SIP_TLS_PORT)
+
+# SIPp options in the order Pysipp renders them: see pysipp.command.sipp_spec and PysippProcess._add_pysipp_args().
+# Options with an empty value aren't rendered.
+SIPP_OPTIONS = [
+    ("local_host", "-i"),
+    ("local_port", "-p"),
+    ("media_addr", "-mi"),
+    ("media_port", "-mp"),
+    ("transport", "-t"),
+    ("scen_file", "-sf"),
+    ("recv_timeout", "-recv_timeout"),
+    ("default_behaviors", "-default_behaviors"),
+    ("rate", "-r"),
+    ("limit", "-l"),
+    ("call_count", "-m"),
+    ("log_file", "-log_file"),
+    ("info_file", "-inf"),
+    ("screen_file", "-screen_file"),
+    ("tls_cert", "-tls_cert"),
+    ("tls_key", "-tls_key"),
+    ("tls_ca", "-tls_ca"),
+    ("tls_crl", "-tls_crl"),
+    ("tls_version", "-tls_version"),
+    ("max_socket", "-max_socket"),
+    ("trace_file", "-stf"),
+    ("trace_frequency", "-fd"),
+    ("master_no", "-master"),
+    ("slave_no", "-slave"),
+    ("slave_cfg", "-slave_cfg"),
+]
+SIPP_FLAGS = [
+    ("rtp_echo", "-rtp_echo"),
+    ("trace_error", "-trace_err"),
+    ("trace_calldebug", "-trace_calldebug"),
+    ("trace_error_codes", "-trace_error_codes"),
+    ("trace_message", "-trace_msg"),
+    ("trace_log", "-trace_logs"),
+    ("trace_screen", "-trace_screen"),
+    ("trace_stat", "-trace_stat"),
+]
+# Defaults of a Pysipp scenario, see pysipp.agent._scen_defaults_template
+SIPP_DEFAULTS = {
+    "recv_timeout": 5000,
+    "call_count": 1,
+    "rate": 1,
+    "limit": 1,
+}
+# Log files, which Pysipp enables for every agent, see pysipp.agent.UserAgent.enable_logging()
+SIPP_LOG_FILES = ["screen_file", "log_file"]
+
+# The same as the default launch rate of pysipp.launch.PopenRunner
+LAUNCH_INTERVAL = 1. / 300
+# How often the supervisor wakes up to check for a pending signal, in milliseconds
+POLL_INTERVAL_MS = 100
+# The same as the default timeout of pysipp.agent.ScenarioType.__call__(), in seconds
+SIPP_TIMEOUT = 180
+# How long SIPp, which has been stopped with SIGUSR1, is waited for before it's killed, in seconds
+KILL_TIMEOUT = 10
+
+# See pysipp.report.EXITCODES
+SIPP_EXIT_CODES = {
+    0: "All calls were successful",
+    1: "At least one call failed",
+    15: "Process was terminated",
+    97: "Exit on internal command. Calls may have been processed",
+    99: "Normal exit without calls processed",
+    -1: "Fatal error",
+    -2: "Fatal error binding a socket",
+    -10: "Signalled to stop with SIGUSR1",
+    254: "Connection Error: socket already in use",
+    255: "Command or syntax error: check stderr output",
+}
+
+
+class SippFailure(Exception):
+    pass
+
+
+class SippTimeout(Exception):
+    pass
+
+
+def get_run_ids(uas):
+    """
+    :param uas: set of UA
+    :type uas: set(UA)
+
+    :returns: all possible Run IDs among UAs
+    :rtype: list(str)
+    """
+    run_ids = set()
+    for ua in uas:
+        run_ids |= ua.get_part_ids()
+    return sorted(run_ids)
+
+
+def get_runs(uas, args):
+    """
+    :param uas: set of UA
+    :type uas: set(UA)
+
+    :param args: command-line arguments of application
+    :type args: namespace
+
+    :returns: Run IDs to run one after another, with the number of calls for every run, which is split across shards
+    :rtype: list((str, int))
+    """
+    run_ids = get_run_ids(uas)
+    if len(run_ids) == 1:
+        # We can rely on SIPp to repeat calls.
+        return [(run_ids[0], args.sipp_max_calls)]
+    # We can't rely on SIPp to repeat calls.
+    # We should restart all run_ids for each new call.
+    # Every shard makes a single call, so shards make several calls at once.
+    shards = max(ua.shards for ua in uas)
+    return [(run_id, min(shards, args.sipp_max_calls - i))
+            for i in range(0, args.sipp_max_calls, shards)
+            for run_id in run_ids]
+
+
+def get_share(total, shards, shard):
+    """
+    :returns: the share of the total, which the given shard gets, when the total is split across shards
+    :rtype: int
+    """
+    return total // shards + (1 if shard < total % shards else 0)
+
+
+def get_agents(uas, run_id, args, call_count, logger):
+    """
+    Collects SIPp arguments of all UAs, which support given Run ID.
+
+    :param uas: set of UA
+    :type uas: set(UA)
+
+    :param run_id: alphanumeric Run ID
+    :type run_id: str
+
+    :param args: command-line arguments of application
+    :type args: namespace
+
+    :param call_count: number of calls, which is split across shards into `-m` SIPp parameters
+    :type call_count: int
+
+    :param logger: logger of the test
+    :type logger: logging.Logger
+
+    :returns: role and keyword arguments of a Pysipp agent for every UA, in launch order
+    :rtype: list((Scenario.Role, dict))
+    """
+    agents = []
+    for ua in uas:
+        delayed_uac_start = False
+        scen = ua.get_scenario(run_id)
+        if not scen:
+           # This UA doesn't have scenario for this Run ID.
+           # This is not an issue.
+           # Just skip this UA for this Run ID.
+           continue
+        shard_call_count = get_share(call_count, ua.shards, ua.shard)
+        if not shard_call_count and ua.shard:
+            # There are less calls than shards.
+            # The UAs of this shard have no calls in this run.
+            continue
+
+        kwargs = {
+            "logdir": ".", # we already did chdir()
+            "scen_file": scen.get_filename(),
+            # SIPp expects IPv6 remote host in brackets, as it's followed by the port
+            "remote_host": "[{0}]".format(args.dut) if ":" in args.dut else args.dut,
+            "transport": args.sipp_transport,
+            "rate": args.sipp_call_rate / ua.shards,
+            "call_count": shard_call_count,
+            "recv_timeout": args.sipp_recv_timeout,
+            "local_host": ua.ip,
+            "local_port": ua.port,
+            "trace_message": True,
+            "trace_error": True,
+            "trace_calldebug": True,
+            "trace_error_codes": True,
+        }
+
+        # Issue #23: We need to adjust SIPp's "max_socket" argument to pass SIPp's internal check.
+        # We use the same formula as it exists in the SIPp's source code.
+        #
+        # Otherwise SIPp exits with the following error message:
+        # "Maximum number of open sockets (50000) should be less than the maximum number of open files (1024).
+        # Tune this with the `ulimit` command or the -max_socket option.
+        # Maximum number of open sockets (1024) plus number of open calls (1) should be less than the maximum number of open files (1024) to allow for media support."
+        limit = max(1, get_share(args.sipp_concurrent_calls_limit, ua.shards, ua.shard))
+        kwargs["limit"] = limit
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft <= limit:
+            raise Exception("Open files limit {0} is too small. Please increase the limit to at least {1} (ulimit -n {1})".format(soft, limit + 1))
+        kwargs["max_socket"] = soft - limit
+        kwargs["trace_stat"] = True
+        kwargs["trace_file"] = scen.get_tracefile()
+        kwargs["trace_frequency"] = "60"
+
+        if args.sipp_info_file:
+            kwargs["info_file"] = args.sipp_info_file
+
+        if args.default_behaviors:
+            kwargs["default_behaviors"] = args.default_behaviors
+
+        if args.ua_ports_per_ip > 1:
+            # The IP is shared with UAs of other tests, so media ports are taken from the UA's port block
+            kwargs["media_port"] = ua.port + DEFAULT_UA_MEDIA_PORT_OFFSET
+
+        # 3pcc Extended support
+        _3pcc_id = ua.get_3pcc_id()
+        if _3pcc_id is not None:
+            logger.debug('Current ua {0} is using 3pcc extended mode with id {1}'.format(ua.get_scenario, _3pcc_id))
+            kwargs["slave_cfg"] = ua.get_3pcc_file()
+            if _3pcc_id == 'm':
+                kwargs["master_no"] = _3pcc_id
+            else:
+                kwargs["slave_no"] = _3pcc_id
+                delayed_uac_start = True
+
+
+        # TLS
+        if ua.get_tls_cert():
+            kwargs["tls_cert"] = ua.get_tls_cert()
+        if ua.get_tls_key():
+            kwargs["tls_key"] = ua.get_tls_key()
+        if args.sipp_tls_version:
+            kwargs["tls_version"] = args.sipp_tls_version
+        if is_tls_transport(args.sipp_transport):
+            kwargs["remote_port"] = DEFAULT_SIP_TLS_PORT
+        # end TLS
+
+        role = scen.get_role()
+        if role == Scenario.Role.uac:
+            if delayed_uac_start:
+                # It's a uac, but there might be a 3PCC master uac that must be the last one started
+                agents.insert(-1, (role, kwargs))
+            else:
+                agents.append((role, kwargs))
+        elif role == Scenario.Role.uas:
+            agents.insert(0, (role, kwargs))  # servers are always launched first
+        else:
+            assert(False)
+
+    assert(agents) # We shouln't even attempt to run Run ID, on which there are no UAs
+    return agents
+
+
+def get_persistent_uas(uas, args):
+    """
+    Picks UAs, which are kept running across calls of a multi-part test.
+    Such UA has a single UAS scenario, so its SIPp is able to serve all the calls on the same socket.
+
+    :param uas: set of UA
+    :type uas: set(UA)
+
+    :param args: command-line arguments of application
+    :type args: namespace
+
+    :returns: persistent UAs
+    :rtype: list(UA)
+    """
+    if not args.sipp_persistent_uas or len(get_run_ids(uas)) == 1:
+        # SIPp already repeats calls of a single-part test
+        return []
+    return [ua for ua in uas if len(ua.get_part_ids()) == 1 and not ua.is_uac()]
+
+
+def get_persistent_agents(uas, args, logger):
+    """
+    :param uas: persistent UAs, as returned by get_persistent_uas()
+    :type uas: list(UA)
+
+    :returns: the same as get_agents(). Every agent serves its share of `--sipp-max-calls` calls
+    :rtype: list((Scenario.Role, dict))
+    """
+    agents = []
+    for ua in uas:
+        if ua.shard and not get_share(args.sipp_max_calls, ua.shards, ua.shard):
+            # There are less calls than shards
+            continue
+        part_id, = ua.get_part_ids()
+        agents += get_agents([ua], part_id, args, args.sipp_max_calls, logger)
+    return agents
+
+
+def get_persistent_timeout(args):
+    """
+    Persistent UAs exit once they have served all their calls.
+    If a call hasn't reached them, they would wait for it forever, as SIPp `-recv_timeout` applies only to open calls.
+    Therefore they are waited for after the last call only for `-recv_timeout`.
+
+    :param args: command-line arguments of application
+    :type args: namespace
+
+    :returns: seconds
+    :rtype: float
+    """
+    return args.sipp_recv_timeout / 1000
+
+
+def get_name(kwargs):
+    """
+    :returns: name of a Pysipp agent: the scenario filename without extension
+    :rtype: str
+    """
+    return os.path.splitext(os.path.basename(kwargs["scen_file"]))[0]
+
+
+def get_argv(bin_path, kwargs):
+    """
+    Renders the SIPp command line, which Pysipp would run for the agent.
+
+    :param bin_path: path to SIPp executable
+    :type bin_path: str
+
+    :param kwargs: keyword arguments of a Pysipp agent, as returned by get_agents()
+    :type kwargs: dict
+
+    :returns: SIPp command line
+    :rtype: list(str)
+    """
+    values = dict(SIPP_DEFAULTS)
+    values.update(kwargs)
+    # See pysipp.agent.UserAgent.enable_logging() and enable_tracing()
+    name = get_name(kwargs)
+    for log_file in SIPP_LOG_FILES:
+        values.setdefault(log_file, os.path.join(values.get("logdir", "."), "{0}_{1}".format(name, log_file)))
+    values["trace_screen"] = True
+    values["trace_log"] = True
+
+    argv = [bin_path]
+    for key, option in SIPP_OPTIONS:
+        if values.get(key):
+            argv += [option, str(values[key])]
+    for key, flag in SIPP_FLAGS:
+        if values.get(key):
+            argv.append(flag)
+    remote = values["remote_host"]
+    if values.get("remote_port"):
+        remote += ":{0}".format(values["remote_port"])
+    argv.append(remote)
+    return argv
+
+
+def plays_media(folder, kwargs):
+    """ The same as pysipp.agent.UserAgent.plays_media """
+    with open(os.path.join(folder, kwargs["scen_file"]), 'r') as f:
+        return bool(re.search('play_pcap_audio', f.read()))
+
+
+def get_free_port(ip):
+    """ The same as pysipp.netplug.getsockaddr() """
+    family = socket.AF_INET6 if ":" in ip else socket.AF_INET
+    with socket.socket(family, socket.SOCK_DGRAM) as s:
+        s.bind((ip, 0))
+        return s.getsockname()[1]
+
+
+class SippProcess(object):
+    """
+    SIPp process, which runs in its own process group.
+    """
+    def __init__(self, name, argv, folder):
+        """
+        :param name: agent name
+        :type name: str
+
+        :param argv: SIPp command line
+        :type argv: list(str)
+
+        :param folder: working directory: extra SIPp logs and SIPp coredump appear there
+        :type folder: str
+        """
+        self.name = name
+        self.stderr = b""
+        self.returncode = None
+        # The new group is set up with setsid() by subprocess itself, without running Python code in the child:
+        # preexec_fn might deadlock in a child forked from a multithreaded process.
+        self.process = subprocess.Popen(argv,
+                                        cwd=folder,
+                                        stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.PIPE,
+                                        start_new_session=True) # Issue #36: change group to not to propagate signals to subprocess
+        os.set_blocking(self.process.stderr.fileno(), False)
+        # pidfd becomes readable once the process exits.
+        # Without pidfd (Python < 3.9 or Linux < 5.3) the exit is detected by the hangup of stderr, as Pysipp does.
+        self.pidfd = None
+        if hasattr(os, "pidfd_open"):
+            try:
+                self.pidfd = os.pidfd_open(self.process.pid)
+            except OSError:
+                pass
+
+    def fds(self):
+        return [self.process.stderr.fileno()] + ([self.pidfd] if self.pidfd is not None else [])
+
+    def read_stderr(self):
+        """
+        :returns: False on end of file
+        :rtype: bool
+        """
+        while True:
+            try:
+                data = os.read(self.process.stderr.fileno(), 65536)
+            except BlockingIOError:
+                return True
+            if not data:
+                return False
+            self.stderr += data
+
+    def reap(self):
+        self.read_stderr()
+        self.returncode = self.process.wait()
+
+    def signal(self, signum):
+        try:
+            os.killpg(self.process.pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def close(self):
+        self.process.stderr.close()
+        if self.pidfd is not None:
+            os.close(self.pidfd)
+
+
+class SippLauncher(object):
+    """
+    Runs SIPp scenarios of a test without Pysipp and without an extra Python process.
+
+    SIPp command lines are the same as Pysipp renders.
+    SIPp processes are supervised with epoll from the calling thread, so their exit is detected immediately.
+    If any SIPp fails, the rest are stopped with SIGUSR1, as Pysipp does.
+    If SIPp processes of a scenario don't exit within SIPP_TIMEOUT, they are stopped with SIGUSR1 as well,
+    and are killed, if they are still running KILL_TIMEOUT later.
+    """
+    def __init__(self, uas, folder, args, logger):
+        """
+        :param uas: set of UA
+        :type uas: set(UA)
+
+        :param folder: temp folder of a test
+        :type folder: str
+
+        :param args: command-line arguments of application
+        :type args: namespace
+
+        :param logger: logger of the test
+        :type logger: logging.Logger
+        """
+        self.__uas = uas
+        self.__folder = folder
+        self.__args = args
+        self.__logger = logger
+        self.__timeout = SIPP_TIMEOUT
+
+    def __launch(self, bin_path, agents, processes):
+        """
+        Launches SIPp for every agent.
+
+        :param agents: agents in launch order, as returned by get_agents()
+        :type agents: list((Scenario.Role, dict))
+
+        :param processes: launched SIPp processes are appended to it, so they could be cleaned up even if launching fails
+        :type processes: list(SippProcess)
+        """
+        agents = [kwargs for role, kwargs in agents]
+        # See pysipp.pysipp_conf_scen() and pysipp.netplug.pysipp_conf_scen()
+        has_media = len(agents) == 2 and any(plays_media(self.__folder, kwargs) for kwargs in agents)
+        for kwargs in agents:
+            kwargs.setdefault("media_addr", kwargs["local_host"])
+            if not kwargs.get("media_port"):
+                kwargs["media_port"] = get_free_port(kwargs["media_addr"])
+            if has_media and not plays_media(self.__folder, kwargs):
+                kwargs["rtp_echo"] = True
+
+        for kwargs in agents:
+            argv = get_argv(bin_path, kwargs)
+            self.__logger.debug('Launching "{0}"'.format(" ".join(argv)))
+            processes.append(SippProcess(get_name(kwargs), argv, self.__folder))
+            time.sleep(LAUNCH_INTERVAL)
+
+    def __run_scenario(self, bin_path, agents, persistent):
+        """
+        Runs the agents till they exit.
+
+        :param agents: agents in launch order, as returned by get_agents()
+        :type agents: list((Scenario.Role, dict))
+
+        :param persistent: SIPp processes, which keep running across calls. Their failure stops the agents
+        :type persistent: list(SippProcess)
+        """
+        processes = []
+        try:
+            self.__launch(bin_path, agents, processes)
+            if self.__supervise(processes, persistent):
+                self.__report(processes)
+                raise SippTimeout("pids '{0}' failed to complete after '{1}' seconds".format(
+                    [p.process.pid for p in processes], self.__timeout))
+        finally:
+            self.__cleanup(processes)
+        # SIPp, which has been stopped on a signal, isn't a failure
+        check_signal() # throws SignalException if we got signal
+        self.__check(processes + [p for p in persistent if p.returncode is not None])
+
+    def __supervise(self, processes, persistent=(), timeout=None):
+        """
+        Waits for the processes to exit.
+        Persistent processes are watched as well, but aren't waited for.
+
+        :param timeout: seconds, after which the processes are stopped with SIGUSR1, and KILL_TIMEOUT later are killed.
+                        SIPP_TIMEOUT by default
+        :type timeout: float
+
+        :returns: True if the processes have been stopped on timeout
+        :rtype: bool
+        """
+        if timeout is None:
+            timeout = self.__timeout
+        deadline = time.monotonic() + timeout
+        timed_out = False
+        killed = False
+        watched = list(processes) + list(persistent)
+        poller = select.epoll()
+        try:
+            fds = {}
+            for p in watched:
+                if p.returncode is not None:
+                    continue
+                for fd in p.fds():
+                    poller.register(fd, select.EPOLLIN)
+                    fds[fd] = p
+            stopped = False
+            while any(p.returncode is None for p in processes):
+                # Issue #39: This is an interruption point.
+                # SIPp runs in its own process group, so it doesn't get the signal, which user has sent to sipplauncher.
+                # Stop SIPp the same way as Pysipp does on a failure, and let run() react on the signal.
+                if sipplauncher.utils.Signals.last_signal and not stopped:
+                    self.__stop(watched)
+                    stopped = True
+                now = time.monotonic()
+                if now >= deadline and not timed_out:
+                    self.__logger.warning('SIPp failed to complete after {0} seconds'.format(timeout))
+                    self.__stop(processes)
+                    timed_out = True
+                if now >= deadline + KILL_TIMEOUT and not killed:
+                    self.__kill(processes)
+                    killed = True
+                for fd, event in poller.poll(POLL_INTERVAL_MS / 1000):
+                    p = fds[fd]
+                    if fd != p.pidfd:
+                        if p.read_stderr():
+                            continue
+                        poller.unregister(fd)
+                        del fds[fd]
+                        if p.pidfd is not None:
+                            # Exit is reported by pidfd
+                            continue
+                    for pfd in p.fds():
+                        if pfd in fds:
+                            poller.unregister(pfd)
+                            del fds[pfd]
+                    p.reap()
+                    self.__logger.debug('SIPp "{0}" exited with code {1}'.format(p.name, p.returncode))
+                    if p.returncode != 0 and not stopped:
+                        # Stop all other agents if there is a failure
+                        self.__stop(watched)
+                        stopped = True
+        finally:
+            poller.close()
+        return timed_out
+
+    def __stop(self, processes):
+        for p in processes:
+            if p.returncode is None:
+                self.__logger.debug('Stopping SIPp "{0}" with pid {1}'.format(p.name, p.process.pid))
+                p.signal(signal.SIGUSR1)
+
+    def __kill(self, processes):
+        for p in processes:
+            if p.returncode is None:
+                self.__logger.warning('Killing SIPp "{0}" with pid {1}'.format(p.name, p.process.pid))
+                p.signal(signal.SIGKILL)
+
+    @staticmethod
+    def __cleanup(processes):
+        for p in processes:
+            if p.returncode is None:
+                # We are leaving on exception. SIPp runs in its own process group, so it has to be killed explicitly.
+                p.signal(signal.SIGKILL)
+                p.reap()
+            p.close()
+
+    def __check(self, processes):
+        if any(p.returncode != 0 for p in processes):
+            self.__report(processes)
+            raise SippFailure("Some agents failed\n" + "\n".join("'{0}' with exit code {1} -> {2}".format(
+                p.name, p.returncode, SIPP_EXIT_CODES.get(p.returncode, "unknown exit code")) for p in processes))
+
+    def __report(self, processes):
+        """ The same as pysipp.report.emit_logfiles() """
+        for p in processes:
+            self.__logger.warning("stderr for '{0}'\n{1}".format(p.name, p.stderr.decode("utf-8", "replace")))
+            screen_file = os.path.join(self.__folder, "{0}_screen_file".format(p.name))
+            if os.path.isfile(screen_file):
+                with open(screen_file, 'r') as f:
+                    self.__logger.warning("'screen_file' contents for '{0}':\n{1}".format(p.name, f.read()))
+
+    def __run_scenarios(self, bin_path):
+        persistent_uas = get_persistent_uas(self.__uas, self.__args)
+        uas = [ua for ua in self.__uas if ua not in persistent_uas]
+        persistent = []
+        try:
+            self.__launch(bin_path, get_persistent_agents(persistent_uas, self.__args, self.__logger), persistent)
+            for run_id, call_count in get_runs(uas, self.__args):
+                self.__run_scenario(bin_path, get_agents(uas, run_id, self.__args, call_count, self.__logger), persistent)
+            timeout = get_persistent_timeout(self.__args)
+            if self.__supervise(persistent, timeout=timeout):
+                self.__report(persistent)
+                raise SippFailure("Persistent UAS haven't served all the calls within '{0}' seconds after the last call".format(timeout))
+        except (SippFailure, SippTimeout, SignalException):
+            # Persistent SIPp would wait for the rest of the calls forever
+            self.__stop(persistent)
+            self.__supervise(persistent)
+            raise
+        finally:
+            self.__cleanup(persistent)
+        check_signal() # throws SignalException if we got signal
+        self.__check(persistent)
+
+    def run(self):
+        """
+        :returns: exit code, the same as of PysippProcess: 0 on success, 2 if SIPp has failed, 3 on signal, 4 on timeout or unexpected exception
+        :rtype: int
+        """
+        try:
+            self.__run_scenarios(which("sipp"))
+        except SippFailure as e:
+            # Expected exception
+            self.__logger.info(e)
+            return 2
+        except SignalException as e:
+            # Expected exception
+            self.__logger.info("Captured signal {0}".format(e))
+            return 3
+        except SippTimeout as e:
+            # Pysipp raises pysipp.launch.TimeoutError, which is an unexpected exception for PysippJob
+            self.__logger.error(e)
+            return 4
+        except Exception as e:
+            # Unexpected exception
+            self.__logger.error(e, exc_info = True)
+            return 4
+        return 0
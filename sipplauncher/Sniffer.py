@@ -9,27 +9,56 @@
 
 import logging
 import threading
-import os
 import pyroute2
 from scapy.sendrecv import AsyncSniffer
-from scapy.utils import wrpcap
+from scapy.compat import raw
 from . import Network
+from .AfPacketSniffer import AfPacketSniffer
+from .PcapWriter import (PcapWriter,
+                         PROFILE_FULL)
+
+
+def create_sniffer(backend, interface, rotate_bytes=None, rotate_seconds=None, profile=PROFILE_FULL):
+    """
+    :param backend: capture backend, "scapy" or "afpacket"
+    :type backend: str
+
+    :param interface: name of the pcap file, without extension
+    :type interface: str
+
+    :param rotate_bytes: pcap file rotation size, or None
+    :type rotate_bytes: int
+
+    :param rotate_seconds: pcap file rotation period, or None
+    :type rotate_seconds: int
+
+    :param profile: capture profile, one of PcapWriter.PROFILES
+    :type profile: str
+
+    :rtype: SIPpSniffer or AfPacketSniffer
+    """
+    if backend == "afpacket":
+        return AfPacketSniffer(interface, rotate_bytes, rotate_seconds, profile)
+    return SIPpSniffer(interface, rotate_bytes, rotate_seconds, profile)
 
 class SIPpSniffer(object):
     """
     Provides functionality to provide network capturing traffic based on a 
     network interface and capturing filter
     """
-    def __init__(self, interface):
+    def __init__(self, interface, rotate_bytes=None, rotate_seconds=None, profile=PROFILE_FULL):
         self.__interface = interface
-        self.__folder = None
+        self.__rotate_bytes = rotate_bytes
+        self.__rotate_seconds = rotate_seconds
+        self.__profile = profile
+        self.__writer = None
         # Delegate implementation to scapy.AsyncSniffer.
         # We don't inherit from scapy.AsyncSniffer, because scapy.AsyncSniffer requires more arguments on construction,
         # than we are ready to provide on construction of SIPpSniffer.
         self.__impl = None
         logging.debug('Created sniffer for interface {0}'.format(interface))
 
-    def start(self, filter, folder):
+    def start(self, filter, folder, signaling_ports=()):
         logging.debug('Starting sniffer for interface {0} and filter {1}'.format(self.__interface, filter))
         assert(not self.__impl)
 
@@ -48,9 +77,13 @@ class SIPpSniffer(object):
                     started.cond.notify()
                 logging.debug('Started sniffer for interface {0}'.format(self.__interface))
 
-            self.__folder = folder
+            # Packets are written as they are captured, instead of being stored until stop()
+            self.__writer = PcapWriter(folder, self.__interface, self.__rotate_bytes, self.__rotate_seconds,
+                                       self.__profile, signaling_ports)
             self.__impl = AsyncSniffer(filter=filter,
                                        iface=list(ifaces), # scapy waits for list(str), while we have set(str)
+                                       prn=self.__write,
+                                       store=False,
                                        started_callback=started_callback)
             self.__impl.start()
             # Need to wait for sniffing thread actually to start.
@@ -67,7 +100,17 @@ class SIPpSniffer(object):
         else:
             logging.debug('Found no available real interfaces to sniff for dummy interface {0}'.format(self.__interface))
 
-    def stop(self):
+    def __write(self, pkt):
+        # Called in the sniffing thread
+        t = float(pkt.time)
+        sec = int(t)
+        self.__writer.write(sec, int((t - sec) * 1000000), raw(pkt))
+
+    def stop(self, since=None):
+        """
+        :param since: the same as for AfPacketSniffer.stop(). Unused, as scapy hands over every frame as soon as it's captured
+        :type since: float
+        """
         if self.__impl:
             logging.debug('Stopping sniffer for interface {0}'.format(self.__interface))
 
@@ -114,10 +157,9 @@ class SIPpSniffer(object):
                 else:
                     break
 
-            # Issue #58: Sort basing on timestamp
-            time_sorted = sorted(self.__impl.results.res, key=lambda pkt: pkt.time)
-            wrpcap(os.path.join(self.__folder, self.__interface + ".pcap"), time_sorted)
+            # Issue #58: PcapWriter sorts basing on timestamp
+            self.__writer.close()
 
             # restore defaults to be able to start() again
             self.__impl = None
-            self.__folder = None
+            self.__writer = None
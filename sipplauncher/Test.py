@@ -25,21 +25,26 @@ from jinja2 import (Environment,
 from functools import partial
 
 from . import Network
+from . import Netem
 # Need to import whole module, and refer to its functions by fully qualified name,
 # because in unit-tests we're mocking these functions
 # And if we import as aliases, mocking doesn't work.
 import sipplauncher.utils.Utils
 import sipplauncher.utils.Filters
-from sipplauncher.utils.Defaults import (DEFAULT_TEMP_FOLDER,
-                                         DEFAULT_SCENARIO_FILENAME_REGEX,
+from sipplauncher.utils.Defaults import (DEFAULT_SCENARIO_FILENAME_REGEX,
                                          DEFAULT_SCENARIO_PART_FILENAME_REGEX,
                                          DEFAULT_SCRIPT_TIMEOUT,
                                          DEFAULT_DNS_FILE,
-                                         DEFAULT_3PCC_FILE)
+                                         DEFAULT_3PCC_FILE,
+                                         DEFAULT_NETEM_FILE,
+                                         DEFAULT_SIP_PORT,
+                                         DEFAULT_SIP_TLS_PORT)
 from .UA import UA
 from .PysippProcess import PysippProcess
+from .SippLauncher import SippLauncher
 from .Scenario import Scenario
 from .DnsServer import DnsServer
+from .Janitor import write_result_file
 
 scenario_regex = re.compile(DEFAULT_SCENARIO_FILENAME_REGEX)
 scenario_part_regex = re.compile(DEFAULT_SCENARIO_PART_FILENAME_REGEX)
@@ -78,10 +83,15 @@ class SIPpTest(object):
         self._successful = False
         self.__folder = folder
         self.__dns_server = None
+        self.__impairments = []
         self.__3pcc_file = None
         if os.path.exists(os.path.join(self.__folder, DEFAULT_3PCC_FILE)):
             self.__3pcc_file = DEFAULT_3PCC_FILE
         self.__uas = self._get_uas()
+        # Replicas of the UAs for every extra shard
+        self.__shards = []
+        # time.monotonic() when SIPp traffic of the test has ended, or None if the test hasn't been run
+        self.__run_ended = None
 
         logging.debug('Created SIPpTest "{0}"'.format(self.key))
 
@@ -126,6 +136,20 @@ class SIPpTest(object):
     def _get_uac(self):
         return next(filter(lambda x: x.is_uac(), self.__uas), None)
 
+    def __get_all_uas(self):
+        """
+        :returns: UAs together with their replicas of all the shards
+        :rtype: list(UA)
+        """
+        return self.__uas + [ua for shard in self.__shards for ua in shard]
+
+    def __get_shard_count(self, args):
+        if self.__3pcc_file and args.sipp_shards > 1:
+            # 3PCC Extended configuration file binds UAs to fixed addresses, which can't be replicated
+            self._get_logger().debug('{0} is not sharded, as it has {1}'.format(self.key, DEFAULT_3PCC_FILE))
+            return 1
+        return args.sipp_shards
+
     def _set_state(self, state):
         """ Setter for state which checks for valid state transition
 
@@ -155,11 +179,13 @@ class SIPpTest(object):
     def _run_script(self, script, args):
         with sipplauncher.utils.Utils.cd(self.__temp_folder):
             if os.path.exists(script) and not args.dry_run:
+                # The new group is set up with setsid() by subprocess itself, without running Python code in the child:
+                # preexec_fn might deadlock in a child forked from a multithreaded process.
                 p = subprocess.Popen("sh " + script,
                                      shell=True,
                                      stdout=subprocess.PIPE,
                                      stderr=subprocess.PIPE,
-                                     preexec_fn=os.setpgrp) # Issue #36: change group to not to propagate signals to subprocess
+                                     start_new_session=True) # Issue #36: change group to not to propagate signals to subprocess
                 try:
                     stdoutdata, stderrdata = p.communicate(timeout=DEFAULT_SCRIPT_TIMEOUT)
                 except subprocess.TimeoutExpired as e:
@@ -180,10 +206,18 @@ class SIPpTest(object):
     def _get_logger(self):
         return logging.getLogger(__name__ + "." + self.run_id)
 
-    def _create_temp_folder(self):
-        self.__temp_folder = os.path.join(DEFAULT_TEMP_FOLDER, self.key, self.run_id)
-        logging.debug("Copying {0} to {1}".format(self.__folder, self.__temp_folder))
-        shutil.copytree(self.__folder, self.__temp_folder)
+    def _create_temp_folder(self, args):
+        self.__temp_folder = os.path.join(args.work_folder, self.key, self.run_id)
+        if args.temp_folder_mode == "link":
+            # Only templated files are going to be rewritten, therefore only they need a private copy.
+            # Everything else (RTP pcaps, injection CSVs, etc) is shared with the test suite folder.
+            logging.debug("Linking {0} to {1}".format(self.__folder, self.__temp_folder))
+            sipplauncher.utils.Utils.link_tree(self.__folder,
+                                               self.__temp_folder,
+                                               self._get_templated_files(self.__folder))
+        else:
+            logging.debug("Copying {0} to {1}".format(self.__folder, self.__temp_folder))
+            shutil.copytree(self.__folder, self.__temp_folder)
 
     def _init_logger(self):
         # get base logger instance according to options from config
@@ -199,13 +233,37 @@ class SIPpTest(object):
                 handler.set_folder(self.__temp_folder)
                 l.addHandler(handler)
 
-    def _replace_keywords(self, args):
-        """ Loops over files in temp folder and replaces keywords in files.
+    def _get_templated_files(self, folder):
+        """ Collects files, which are processed by the template engine.
 
-        :param args: application args
-        :type args: dict
+        :param folder: folder to look for files in
+        :type folder: str
+
+        :returns: filenames relative to the folder
+        :rtype: set(str)
+        """
+        files = set()
+        for file in glob.glob(os.path.join(folder, "*.sh")):
+            files.add(os.path.basename(file))
+        for ua in self.__uas:
+            files |= ua.get_filenames()
+        if os.path.exists(os.path.join(folder, DEFAULT_DNS_FILE)):
+            files.add(DEFAULT_DNS_FILE)
+        if os.path.exists(os.path.join(folder, DEFAULT_3PCC_FILE)):
+            files.add(DEFAULT_3PCC_FILE)
+        return files
+
+    def __get_keywords(self, args, uas, shard):
         """
+        :param uas: UAs of the shard
+        :type uas: list(UA)
 
+        :param shard: shard index, 0 for the original UAs
+        :type shard: int
+
+        :returns: keywords to render templated files with
+        :rtype: dict
+        """
         # start with mandatory keywords
         kwargs = {
             "dut": {
@@ -215,50 +273,61 @@ class SIPpTest(object):
                 "name": self.key,
                 "run_id": self.run_id,
                 "run_id_number": self.run_id_number,
+                "shard": shard,
             },
             "custom_transport": "", # TODO: remove this
         }
         # add our IP addresses
-        for ua in self.__uas:
+        for ua in uas:
             kwargs[ua.get_name()] = {
                 "host": ua.ip,
+                "port": ua.port,
             }
         # add user-supplied keywords
         if args.keyword_replacement_values:
             kwargs.update(args.keyword_replacement_values)
+        return kwargs
+
+    def __render(self, args, file, target, kwargs):
+        """ Renders the templated file from temp folder to the target file in temp folder. """
+        path = os.path.join(self.__temp_folder, file)
+        with open(path, 'r') as f:
+            content = f.read()
+
+        folders = [self.__temp_folder]
+        if args.template_folder:
+            folders.append(args.template_folder)
+
+        j2_env = Environment(loader=FileSystemLoader(folders),
+                             undefined=StrictUndefined) # to raise exception when jinja is unable to replace undefined keyword
+        # Inject custom filters
+        self._inject_custom_template_filters(j2_env)
+        template = j2_env.get_template(file)
+        rendered_content = template.render(**kwargs)
+
+        # write back file content only if it has actually been replaced
+        if target != file or rendered_content != content:
+            with open(os.path.join(self.__temp_folder, target), 'w') as f:
+                f.write(rendered_content)
 
-        #collect files to perform replacement
-        files = set()
-        for file in glob.glob(os.path.join(self.__temp_folder, "*.sh")):
-            files.add(os.path.basename(file))
-        for ua in self.__uas:
-            files |= ua.get_filenames()
-        if os.path.exists(os.path.join(self.__temp_folder, DEFAULT_DNS_FILE)):
-            files.add(DEFAULT_DNS_FILE)
-        if os.path.exists(os.path.join(self.__temp_folder, DEFAULT_3PCC_FILE)):
-            files.add(DEFAULT_3PCC_FILE)
+    def _replace_keywords(self, args):
+        """ Loops over files in temp folder and replaces keywords in files.
+
+        :param args: application args
+        :type args: dict
+        """
+        # Scenarios of every shard are rendered to separate files with the addresses of the shard's UAs.
+        # This is done before the templates are rewritten in place.
+        for i, shard in enumerate(self.__shards, 1):
+            kwargs = self.__get_keywords(args, shard, i)
+            for ua, replica in zip(self.__uas, shard):
+                for scen, replica_scen in zip(ua.get_scenarios(), replica.get_scenarios()):
+                    self.__render(args, scen.get_filename(), replica_scen.get_filename(), kwargs)
 
         # loop over files and perform replacement
-        for file in files:
-            path = os.path.join(self.__temp_folder, file)
-            with open(path, 'r') as f:
-                content = f.read()
-
-            folders = [self.__temp_folder]
-            if args.template_folder:
-                folders.append(args.template_folder)
-
-            j2_env = Environment(loader=FileSystemLoader(folders),
-                                 undefined=StrictUndefined) # to raise exception when jinja is unable to replace undefined keyword
-            # Inject custom filters
-            self._inject_custom_template_filters(j2_env)
-            template = j2_env.get_template(file)
-            rendered_content = template.render(**kwargs)
-
-            # write back file content only if it has actually been replaced
-            if rendered_content != content:
-                with open(path, 'w') as f:
-                    f.write(rendered_content)
+        kwargs = self.__get_keywords(args, self.__uas, 0)
+        for file in self._get_templated_files(self.__temp_folder):
+            self.__render(args, file, file, kwargs)
 
     def _inject_custom_template_filters(self, j2_env):
         j2_env.filters['b64encode'] = sipplauncher.utils.Filters.base64encode
@@ -266,15 +335,79 @@ class SIPpTest(object):
 
     def __gen_certs_keys(self, args):
         if args.sipplauncher_ca:
-            for ua in self.__uas:
+            for ua in self.__get_all_uas():
                 ua.gen_cert_key(args.sipplauncher_ca, self.__temp_folder)
 
+    def __impair(self, args):
+        """
+        Applies the impairment profile: test's netem file, which takes precedence over the "--netem" arg.
+        """
+        profile = dict(args.netem_profile)
+        netem_file_path = os.path.join(self.__temp_folder, DEFAULT_NETEM_FILE)
+        if os.path.exists(netem_file_path):
+            with open(netem_file_path) as f:
+                profile.update(Netem.parse_profile(f))
+        if not profile or not args.shaper:
+            return
+        if args.ua_ports_per_ip > 1:
+            raise Netem.NetemException('{0} is not compatible with --ua-ports-per-ip arg'.format(DEFAULT_NETEM_FILE))
+        for ua in self.__get_all_uas():
+            params = profile.get(ua.get_name(), profile.get(Netem.ALL_UAS))
+            if not params:
+                continue
+            ifname = Network.get_egress_interface(args.dut, ua.ip, args.source_routing)
+            if not ifname:
+                raise Netem.NetemException('No route to DUT "{0}" to impair UA "{1}"'.format(args.dut, ua.get_name()))
+            self.__impairments.append((args.shaper, args.shaper.add(ifname, ua.ip, params)))
+            self._get_logger().debug('Impaired UA "{0}" with "{1}"'.format(ua.get_name(), " ".join(params)))
+
+    def __remove_impairments(self):
+        impairments, self.__impairments = self.__impairments, []
+        for shaper, token in impairments:
+            shaper.remove(token)
+
+    def _close_logger(self):
+        """ Detaches per-test log files, so the test run folder could be moved away. """
+        l = self._get_logger()
+        for h in list(l.handlers):
+            if isinstance(h, sipplauncher.utils.Log.DynamicFileHandler):
+                l.removeHandler(h)
+                h.close()
+
     def _remove_temp_folder(self, args):
-        if not args.leave_temp:
-            logging.debug("Removing {0}".format(self.__temp_folder))
-            shutil.rmtree(self.__temp_folder)
+        # Log files are closed before the folder is made known to the Janitor or to the Archiver,
+        # so they don't remove or move it away while it's still being written.
+        self._close_logger()
+        if args.latency_analyzer and sipplauncher.utils.Utils.is_pcap(args):
+            # The folder is released once its pcap files have been analyzed.
+            # The test might be running again by then, so the folder and the result are bound now.
+            args.latency_analyzer.submit(self.key, self.__temp_folder, self.network.capture_name,
+                                         partial(SIPpTest.__release_temp_folder, self, args, self.__temp_folder, self.failed()))
+        else:
+            self.__release_temp_folder(args, self.__temp_folder, self.failed())
+
+    def __release_temp_folder(self, args, folder, failed):
+        if not sipplauncher.utils.Utils.is_leave_temp(args, failed):
+            logging.debug("Removing {0}".format(folder))
+            shutil.rmtree(folder)
         else:
-            logging.debug("You can find temp folder at {0}".format(self.__temp_folder))
+            # Make the folder known to the Janitor.
+            # The folder isn't written anymore: capturing has been stopped and log files have been closed.
+            write_result_file(folder, failed, args.instance_id)
+            if args.archiver:
+                logging.debug("Archiving {0}".format(folder))
+                args.archiver.submit(folder)
+            else:
+                logging.debug("You can find temp folder at {0}".format(folder))
+
+    def __get_sip_ports(self, args):
+        """
+        :returns: SIP ports of the UAs and the DUT
+        :rtype: set(int)
+        """
+        # The DUT is addressed at the default port, see PysippProcess
+        dut_port = DEFAULT_SIP_TLS_PORT if sipplauncher.utils.Utils.is_tls_transport(args.sipp_transport) else DEFAULT_SIP_PORT
+        return {ua.port for ua in self.__get_all_uas()} | {dut_port}
 
     def pre_run(self, run_id_prefix, args):
         # We should rollback prior initialization on exception to not to leave test partially initialized.
@@ -292,17 +425,28 @@ class SIPpTest(object):
         self.run_id_number = sipplauncher.utils.Utils.generate_id(n=12, just_digits=True)
         self._set_state(SIPpTest.State.PREPARING)
         self._print_run_state(run_id_prefix)
-        self.network = Network.SIPpNetwork(args.dut, args.network_mask, self.run_id)
+        self.network = Network.SIPpNetwork(args.dut, args.network_mask, self.run_id, args.ip_allocator,
+                                           args.interface_pool, args.registry, args.endpoint_pool,
+                                           args.capture_backend, args.pcap_rotate_bytes, args.pcap_rotate_seconds,
+                                           args.capture_engine, args.capture_profile)
         try:
+            shards = self.__get_shard_count(args)
             for ua in self.__uas:
-                ua.ip = self.network.add_random_ip()
+                ua.shards = shards
+            self.__shards = [[ua.get_shard(i) for ua in self.__uas] for i in range(1, shards)]
+            uas = self.__get_all_uas()
+            for ua, (ip, port) in zip(uas, self.network.add_random_endpoints(len(uas))):
+                ua.ip = ip
+                # UA has a dedicated IP, if the port isn't allocated
+                ua.port = port if port else args.ua_first_port
 
-            self._create_temp_folder()
+            self._create_temp_folder(args)
 
             try:
                 self._init_logger()
                 self._replace_keywords(args)
                 self.__gen_certs_keys(args)
+                self.__impair(args)
 
                 dns_file_path = os.path.join(self.__temp_folder, DEFAULT_DNS_FILE)
                 if os.path.exists(dns_file_path):
@@ -311,7 +455,7 @@ class SIPpTest(object):
 
                 try:
                     if sipplauncher.utils.Utils.is_pcap(args):
-                        self.network.sniffer_start(self.__temp_folder)
+                        self.network.sniffer_start(self.__temp_folder, self.__get_sip_ports(args))
 
                     # Run before.sh after sniffer,
                     # because some day we might want to capture to pcap configuring the DUT...
@@ -328,13 +472,14 @@ class SIPpTest(object):
                 self._remove_temp_folder(args)
                 raise
         except BaseException as e:
+            self.__remove_impairments()
             self.network.shutdown()
             self._set_state(SIPpTest.State.NOT_READY)
             end = time.time()
             elapsed = end - start
             elapsed_str=' - took %.0fs' % (elapsed)
             self._print_run_state(run_id_prefix, extra=elapsed_str)
-            if isinstance(e, (TemplateError, SIPpTest.ScriptRunException)):
+            if isinstance(e, (TemplateError, SIPpTest.ScriptRunException, Netem.NetemException)):
                 # This is the issue in test description.
                 # This is not an internal critical Sipplauncher issue.
                 # It's OK to move to next test.
@@ -367,11 +512,17 @@ class SIPpTest(object):
         else:
             self._set_state(SIPpTest.State.STARTING)
             self._print_run_state(run_id_prefix)
-            p = PysippProcess(self.__uas, self.__temp_folder, args)
-            p.start()
-            p.join()
-            if p.exitcode != 0:
-                raise SIPpTest.PysippProcessException(p.exitcode)
+            if args.sipp_launcher == "native":
+                exitcode = SippLauncher(self.__get_all_uas(), self.__temp_folder, args, self._get_logger()).run()
+            elif args.pysipp_pool:
+                exitcode = args.pysipp_pool.run(self.__get_all_uas(), self.__temp_folder, args)
+            else:
+                p = PysippProcess(self.__get_all_uas(), self.__temp_folder, args)
+                p.start()
+                p.join()
+                exitcode = p.exitcode
+            if exitcode != 0:
+                raise SIPpTest.PysippProcessException(exitcode)
 
         # All good
         self._successful = True
@@ -396,6 +547,7 @@ class SIPpTest(object):
                 self._get_logger().debug(e, exc_info = True)
                 self._set_state(SIPpTest.State.FAIL)
             finally:
+                self.__run_ended = time.monotonic()
                 # Wrap up timing
                 end = time.time()
                 elapsed = end - start
@@ -414,19 +566,25 @@ class SIPpTest(object):
         if uac is not None:
             cps_acum = 0
             cps_hits = 0
-            for uac_scenario in uac.get_scenarios():
-                csvfile_path = os.path.join(self.__temp_folder, uac_scenario.get_tracefile())
-                # When running PysippProcess tests CSV does not exist => skipping CPS calculation
-                if os.path.exists(csvfile_path):
-                    current_cps = 0
-                    with open(csvfile_path, newline='') as csvfile:
-                        reader = csv.DictReader(csvfile, dialect='unix', delimiter=';')
-                        for row in reader:
-                            current_cps = row.get('CallRate(C)', 0)  # We just want to collect the result of the last row
-                    self._get_logger().debug('current CPS for scenario {0} is:{1}'.format(uac_scenario, current_cps))
-
+            # Shards of the uac make calls at the same time, so their CPS values are summed up
+            replicas = [uac] + [shard[self.__uas.index(uac)] for shard in self.__shards]
+            for uac_scenarios in zip(*(replica.get_scenarios() for replica in replicas)):
+                shard_hits = 0
+                for uac_scenario in uac_scenarios:
+                    csvfile_path = os.path.join(self.__temp_folder, uac_scenario.get_tracefile())
+                    # When running PysippProcess tests CSV does not exist => skipping CPS calculation
+                    if os.path.exists(csvfile_path):
+                        current_cps = 0
+                        with open(csvfile_path, newline='') as csvfile:
+                            reader = csv.DictReader(csvfile, dialect='unix', delimiter=';')
+                            for row in reader:
+                                current_cps = row.get('CallRate(C)', 0)  # We just want to collect the result of the last row
+                        self._get_logger().debug('current CPS for scenario {0} is:{1}'.format(uac_scenario, current_cps))
+
+                        shard_hits += 1
+                        cps_acum += float(current_cps)
+                if shard_hits:
                     cps_hits += 1
-                    cps_acum += float(current_cps)
 
             # In case of part scenarios we do the average of all scenarios
             final_cps = 0 if cps_hits == 0 or cps_acum == 0 else round(cps_acum / cps_hits, 2)
@@ -437,10 +595,11 @@ class SIPpTest(object):
     def _get_cleanup_handlers(self, args):
         cleanup_handlers = []
         cleanup_handlers.append(partial(SIPpTest._run_script, self, "after.sh", args))
-        cleanup_handlers.append(partial(Network.SIPpNetwork.sniffer_stop, self.network))
+        cleanup_handlers.append(partial(Network.SIPpNetwork.sniffer_stop, self.network, self.__run_ended))
         if self.__dns_server:
             cleanup_handlers.append(partial(DnsServer.remove, self.__dns_server, self.run_id))
         cleanup_handlers.append(partial(SIPpTest._remove_temp_folder, self, args))
+        cleanup_handlers.append(partial(SIPpTest.__remove_impairments, self))
         cleanup_handlers.append(partial(Network.SIPpNetwork.shutdown, self.network))
         return cleanup_handlers
 
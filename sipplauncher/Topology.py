@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import logging
+import os
+import time
+import threading
+import ipaddress
+from socket import AF_INET, AF_INET6
+import pyroute2
+from pyroute2.netlink.rtnl import (RTMGRP_LINK,
+                                   RTMGRP_IPV4_IFADDR,
+                                   RTMGRP_IPV4_ROUTE,
+                                   RTMGRP_IPV6_IFADDR,
+                                   RTMGRP_IPV6_ROUTE)
+
+logger = logging.getLogger(__name__)
+
+RT_TABLE_MAIN = 254
+FAMILIES = (AF_INET, AF_INET6)
+# How long to wait before dumping again, if the dump has failed, in seconds
+DUMP_RETRY_INTERVAL = 1
+
+
+class Topology(object):
+    """
+    In-process cache of the host's interfaces, IPv4/IPv6 addresses and IPv4/IPv6 gateways.
+
+    The cache is populated with a full netlink dump and is then kept current
+    by RTNLGRP link/addr/route notifications, which are processed by a background thread.
+    Therefore, lookups don't dump kernel tables, and changes made by other software are picked up.
+    If notifications are lost (the socket buffer overflows) or can't be processed, the cache is re-populated with a dump.
+    Lookups wait, until the dump succeeds, so they never get a stale cache.
+
+    Changes, made by Sipplauncher itself, should be also applied with `add_address()`/`remove_link()`.
+    Otherwise the next lookup might happen before the corresponding notification arrives.
+    """
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__pid = None
+        self.__ready = threading.Event()
+        self.__monitor = None
+        self.__thread = None
+        self.__reset()
+
+    def __reset(self):
+        # index -> (ifname, is_up)
+        self.__links = {}
+        # (index, address, prefixlen)
+        self.__addrs = set()
+        # (family, table, dst, dst_len, priority, oif) -> (oif, gateway)
+        self.__routes = {}
+        self.__derived = None
+
+    def __start(self):
+        """
+        Subscribes to notifications and populates the cache.
+        Subscription is done before the dump, so no change is missed in between:
+        notifications, queued while dumping, are applied on top of the dump, and applying them is idempotent.
+        """
+        with self.__lock:
+            if self.__pid == os.getpid():
+                return
+            self.__pid = os.getpid()
+            self.__ready.clear()
+            self.__monitor = pyroute2.IPRoute()
+            self.__monitor.bind(groups=RTMGRP_LINK |
+                                       RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE |
+                                       RTMGRP_IPV6_IFADDR | RTMGRP_IPV6_ROUTE)
+            self.__thread = threading.Thread(target=self.__run, args=(self.__monitor,))
+            # Same reasoning as for SIPpTest threads in Run.run():
+            # we want the thread to exit when main thread ends.
+            self.__thread.setDaemon(True)
+        self.__dump()
+        self.__thread.start()
+
+    def __dump(self):
+        with pyroute2.IPRoute() as ip_route:
+            links = list(ip_route.get_links())
+            addrs = [a for family in FAMILIES for a in ip_route.get_addr(family=family)]
+            routes = [r for family in FAMILIES for r in ip_route.get_routes(family=family)]
+        with self.__lock:
+            self.__reset()
+            for msg in links + addrs + routes:
+                self.__apply(msg)
+        self.__ready.set()
+        logger.debug('Dumped network topology: {0} links, {1} addresses, {2} routes'.format(len(links), len(addrs), len(routes)))
+
+    def __run(self, monitor):
+        while True:
+            try:
+                msgs = monitor.get()
+                with self.__lock:
+                    for msg in msgs:
+                        self.__apply(msg)
+            except Exception as e:
+                # ENOBUFS: the kernel has dropped notifications.
+                # Or a notification couldn't be applied, so the cache might be half-updated.
+                # We don't know what we've missed, therefore start from scratch.
+                logger.debug('Lost network topology notifications: {0}'.format(e))
+                logger.debug(e, exc_info = True)
+                self.__redump()
+
+    def __redump(self):
+        self.__ready.clear()
+        while True:
+            try:
+                self.__dump()
+                return
+            except Exception as e:
+                logger.debug('Unable to dump network topology: {0}'.format(e))
+                logger.debug(e, exc_info = True)
+                time.sleep(DUMP_RETRY_INTERVAL)
+
+    def __apply(self, msg):
+        """
+        Applies a dump entry or a notification to the cache. Must be called with the lock held.
+        """
+        event = msg.get('event')
+        if event in ('RTM_NEWLINK', 'RTM_DELLINK'):
+            index = msg['index']
+            if event == 'RTM_NEWLINK':
+                is_up = msg.get('state') == 'up'
+                self.__links[index] = (msg.get_attr('IFLA_IFNAME'), is_up)
+            else:
+                self.__links.pop(index, None)
+                is_up = False
+            if not is_up:
+                # The kernel silently flushes routes of a link, which goes down or is removed
+                for key in [k for k, v in self.__routes.items() if v[0] == index]:
+                    del self.__routes[key]
+        elif event in ('RTM_NEWADDR', 'RTM_DELADDR'):
+            if msg.get('family') not in FAMILIES:
+                return
+            key = (msg['index'], msg.get_attr('IFA_ADDRESS'), msg['prefixlen'])
+            if event == 'RTM_NEWADDR':
+                self.__addrs.add(key)
+            else:
+                self.__addrs.discard(key)
+        elif event in ('RTM_NEWROUTE', 'RTM_DELROUTE'):
+            family = msg.get('family')
+            if family not in FAMILIES:
+                return
+            table = msg.get_attr('RTA_TABLE') or msg['table']
+            oif = msg.get_attr('RTA_OIF')
+            # The same prefix might be routed via several interfaces.
+            # Default routes of both families have the same empty destination.
+            key = (family, table, msg.get_attr('RTA_DST'), msg['dst_len'], msg.get_attr('RTA_PRIORITY'), oif)
+            if event == 'RTM_NEWROUTE':
+                self.__routes[key] = (oif, msg.get_attr('RTA_GATEWAY'))
+            else:
+                self.__routes.pop(key, None)
+        else:
+            return
+        self.__derived = None
+
+    def __get_derived(self):
+        """
+        :returns: up interface names, local addresses and gateways
+        :rtype: (frozenset(str), frozenset(str), frozenset(str))
+        """
+        if self.__pid != os.getpid():
+            self.__start()
+        self.__ready.wait()
+        with self.__lock:
+            if self.__derived is None:
+                ifaces = frozenset(name for name, is_up in self.__links.values() if is_up)
+                local = frozenset(address for _, address, _ in self.__addrs)
+                gateways = frozenset(gw for _, gw in self.__routes.values() if gw)
+                self.__derived = (ifaces, local, gateways)
+            return self.__derived
+
+    def get_interfaces(self):
+        """
+        :returns: Names of interfaces, which are currently UP
+        :rtype: frozenset(str)
+        """
+        return self.__get_derived()[0]
+
+    def get_local_ip_addresses(self):
+        """
+        :returns: IPv4 and IPv6 addresses, assigned to local interfaces
+        :rtype: frozenset(str)
+        """
+        return self.__get_derived()[1]
+
+    def get_gateways(self):
+        """
+        :returns: IPv4 and IPv6 gateways of all the routes
+        :rtype: frozenset(str)
+        """
+        return self.__get_derived()[2]
+
+    def get_route_interface(self, ip, is_excluded_iface):
+        """
+        Performs the longest prefix match in the main routing table.
+        Policy routing rules are not taken into account.
+
+        :param ip: destination address
+        :type ip: str
+
+        :param is_excluded_iface: callback, which returns True for interfaces, which shouldn't be considered
+        :type is_excluded_iface: callable(str)
+
+        :returns: name of the interface, which routes to the address, or None
+        :rtype: str
+        """
+        if self.__pid != os.getpid():
+            self.__start()
+        self.__ready.wait()
+        ip = ipaddress.ip_address(ip)
+        ip_family = AF_INET6 if ip.version == 6 else AF_INET
+        best, ret = None, None
+        with self.__lock:
+            for (family, table, dst, dst_len, priority, oif), _ in self.__routes.items():
+                if family != ip_family or table != RT_TABLE_MAIN or oif not in self.__links:
+                    continue
+                ifname, is_up = self.__links[oif]
+                if not is_up or is_excluded_iface(ifname):
+                    continue
+                if dst_len and ip not in ipaddress.ip_network('{0}/{1}'.format(dst, dst_len), strict=False):
+                    continue
+                rank = (dst_len, -(priority or 0))
+                if best is None or rank > best:
+                    best, ret = rank, ifname
+        return ret
+
+    def add_address(self, index, address, prefixlen):
+        """
+        Records an address, which we've just assigned.
+        """
+        with self.__lock:
+            self.__addrs.add((index, address, prefixlen))
+            self.__derived = None
+
+    def remove_address(self, index, address, prefixlen):
+        """
+        Records removal of an address, which we've just removed.
+        """
+        with self.__lock:
+            self.__addrs.discard((index, address, prefixlen))
+            self.__derived = None
+
+    def remove_link(self, index):
+        """
+        Records removal of a link, which we've just removed.
+        """
+        with self.__lock:
+            self.__links.pop(index, None)
+            self.__addrs = set(a for a in self.__addrs if a[0] != index)
+            for key in [k for k, v in self.__routes.items() if v[0] == index]:
+                del self.__routes[key]
+            self.__derived = None
+
+
+topology = Topology()
@@ -30,6 +30,11 @@ class UA:
         self.__name = name
         self.__part_id_map = {part_id: scenario}
         self.ip = ""
+        self.port = None
+        # Index of the shard, which the UA belongs to. 0 is the original UA
+        self.shard = 0
+        # Number of shards, which the load of the UA is split across
+        self.shards = 1
         self.__tls_cert = None
         self.__tls_key = None
         self.__3pcc_file = three_pcc_file
@@ -40,6 +45,24 @@ class UA:
     def __hash__(self):
         return hash(self.__name)
 
+    def get_shard(self, shard):
+        """
+        :param shard: shard index, starting from 1
+        :type shard: int
+
+        :returns: replica of the UA with the same name, which runs its share of calls as a separate SIPp instance
+        :rtype: UA
+        """
+        ret = None
+        for part_id, scenario in self.__part_id_map.items():
+            if ret is None:
+                ret = UA(self.__name, part_id, scenario.get_shard(shard), self.__3pcc_file)
+            else:
+                ret.set_scenario(part_id, scenario.get_shard(shard))
+        ret.shard = shard
+        ret.shards = self.shards
+        return ret
+
     def get_name(self):
         """
         :returns: name of UA (for ex. ua0, ua1, etc)
@@ -108,7 +131,8 @@ class UA:
         :param folder: folder to which to generate the files
         :type folder: str
         """
-        filename = os.path.join(os.path.abspath(folder), self.__name)
+        name = "{0}_shard{1}".format(self.__name, self.shard) if self.shard else self.__name
+        filename = os.path.join(os.path.abspath(folder), name)
         self.__tls_cert, self.__tls_key = cert_gen.gen_cert_key(self.ip, filename)
 
     def get_tls_cert(self):
@@ -137,12 +161,14 @@ class UA:
 
     def get_3pcc_id(self):
         result = None
-        if len(self.ip) < 8:
+        if not self.ip:
             raise ScenarioException("Programming error. get_3pcc_id must be called after pre_initialization.")
         if self.get_3pcc_file() is not None:
+            # IPv6 address might be written in brackets
+            patterns = (";" + self.ip + ":", ";[" + self.ip + "]:")
             with open(self.get_3pcc_file()) as cfgfile:
                 for line in cfgfile:
-                    if ";" + self.ip + ":" in line:
+                    if any(p in line for p in patterns):
                         result, _ = line.split(';', 1)
 
         return result
@@ -10,14 +10,30 @@
 import sipplauncher.utils.Init
 from . import Run
 from . import Network
+from . import Netem
 import logging
 import sys
 import os
 import inspect
 from .utils.Signals import SignalException, capture_all_signals, check_signal
-from .utils.Utils import is_tls_transport
+from .utils.Utils import (is_tls_transport,
+                          is_pcap,
+                          mount_tmpfs,
+                          umount)
+from .Archiver import Archiver
+from .Janitor import Janitor
+from .Registry import LeaseRegistry
+from .IPAllocator import IPAllocator
+from .CaptureEngine import CaptureEngine
+from .LatencyAnalyzer import LatencyAnalyzer
+from .PysippProcess import PysippWorkerPool
+from .PcapWriter import PROFILE_SIGNALING
 from .utils.Defaults import (DEFAULT_SSL_KEY_LOG_LIB,
-                             DEFAULT_TLS_PREMASTER_KEYS_FILE)
+                             DEFAULT_TLS_PREMASTER_KEYS_FILE,
+                             DEFAULT_LEASE_FOLDER,
+                             DEFAULT_UA_PORT_BLOCK,
+                             DEFAULT_SIP_PORT,
+                             DEFAULT_SIP_TLS_PORT)
 import multiprocessing
 
 # import warnings
@@ -62,14 +78,26 @@ def my_main_fun():
     if not sys.platform.startswith('linux'):
         raise Exception("Must be using Linux")
 
+    def _shutdown(helper, *helper_args):
+        """Helper to run a cleanup step, so its failure doesn't prevent the next steps.
+        Host-level state (qdiscs, routing rules, mounts) must be restored anyway."""
+        try:
+            helper(*helper_args)
+        except Exception as e:
+            logger.error('Cleanup step {0} has failed: {1}'.format(helper.__name__, e))
+            logger.debug(e, exc_info = True)
+
     def _interfaces_cleaning(args):
         """Helper to perform a cleanup on network interfaces"""
         # Do initial interfaces cleaning
         if args.dry_run:
             logger.debug('Not doing safety network interface cleaning due to dry-run')
+        elif not args.registry:
+            # Without the registry we can't tell interfaces of other running instances from the stale ones
+            logger.debug('Not doing safety network interface cleaning due to missing registry')
         else:
             logger.debug('Safety network interface cleaning')
-            Network.force_cleanup()
+            Network.force_cleanup(args.registry)
 
     def _setup_tls_key_interception(args):
         """
@@ -84,14 +112,178 @@ def my_main_fun():
             else:
                 logging.info("Please install {0} to capture TLS pre-master keys".format(DEFAULT_SSL_KEY_LOG_LIB))
 
+    def _setup_work_folder(args):
+        """
+        Mounts tmpfs at the work folder, if requested.
+
+        :returns: True if tmpfs has been mounted by us and should be unmounted at exit
+        :rtype: bool
+        """
+        if args.work_tmpfs_size:
+            if os.path.ismount(args.work_folder):
+                logging.info("Work folder {0} is already a mount point, using it as is".format(args.work_folder))
+            else:
+                mount_tmpfs(args.work_folder, args.work_tmpfs_size)
+                logging.info("Mounted tmpfs of size {0} at {1}".format(args.work_tmpfs_size, args.work_folder))
+                return True
+        return False
+
+    def _setup_registry(args):
+        """Helper to register this instance in the host-wide lease registry"""
+        if args.dry_run:
+            # Nothing is leased in dry-run, and the registry folder might be not writable without root
+            logger.debug('Not registering instance due to dry-run')
+            return
+        args.registry = LeaseRegistry(DEFAULT_LEASE_FOLDER, args.instance_id)
+        args.registry.cleanup_dead()
+        logging.info("Instance ID: {0}".format(args.instance_id))
+
+    def _shutdown_registry(args):
+        """Helper to release all the leases of this instance"""
+        if args.registry:
+            args.registry.close()
+            args.registry = None
+
+    def _setup_interface_pool(args):
+        """Helper to create the pool of shared dummy interfaces and shared UA endpoints"""
+        if args.interface_pool_size and not args.dry_run:
+            args.interface_pool = Network.InterfacePool(args.interface_pool_size, args.instance_id)
+            if args.ua_ports_per_ip > 1:
+                args.endpoint_pool = Network.EndpointPool(args.interface_pool,
+                                                          args.ip_allocator,
+                                                          args.ua_ports_per_ip,
+                                                          args.ua_first_port,
+                                                          args.registry)
+
+    def _setup_source_routing(args):
+        """Helper to route the traffic of source pools through their interfaces"""
+        if args.source_pools and not args.dry_run:
+            args.source_routing = Network.SourceRouting(args.source_pools, args.ip_allocator)
+            args.source_routing.setup()
+
+    def _shutdown_source_routing(args):
+        """Helper to remove the routing of source pools"""
+        if args.source_routing:
+            args.source_routing.shutdown()
+            args.source_routing = None
+
+    def _setup_shaper(args):
+        """Helper to create the network impairment shaper"""
+        if not args.dry_run:
+            args.shaper = Netem.Shaper(args.registry)
+
+    def _shutdown_shaper(args):
+        """Helper to restore qdiscs of the impaired interfaces"""
+        if args.shaper:
+            args.shaper.shutdown()
+            args.shaper = None
+
+    def _setup_capture_engine(args):
+        """Helper to start the capture, shared by all the tests"""
+        if args.capture_backend == "shared" and is_pcap(args) and not args.dry_run:
+            # The filter matches all the networks, UA addresses are allocated from
+            if args.source_pools:
+                networks = [n for pool_networks, _ in args.source_pools for n in pool_networks]
+            elif args.ip_range:
+                networks = [n for r in args.ip_range for n in IPAllocator.parse_networks(r)]
+            else:
+                networks = IPAllocator.parse_networks('{0}/{1}'.format(args.dut, args.network_mask))
+            filter = " or ".join("net {0}".format(n) for n in networks)
+            if args.capture_profile == PROFILE_SIGNALING:
+                # SIP ports of all the UAs, which could be allocated, and of the DUT
+                dut_port = DEFAULT_SIP_TLS_PORT if is_tls_transport(args.sipp_transport) else DEFAULT_SIP_PORT
+                sip_ports = [args.ua_first_port + i * DEFAULT_UA_PORT_BLOCK for i in range(args.ua_ports_per_ip)] + [dut_port]
+                filter = "({0}) and ({1})".format(filter, Network.get_signaling_filter(sip_ports))
+            args.capture_engine = CaptureEngine(filter,
+                                                args.pcap_rotate_bytes,
+                                                args.pcap_rotate_seconds,
+                                                args.capture_profile)
+
+    def _shutdown_capture_engine(args):
+        """Helper to stop the shared capture"""
+        if args.capture_engine:
+            args.capture_engine.stop()
+            args.capture_engine = None
+
+    def _setup_latency_analyzer(args):
+        """Helper to start background latency analysis of test run pcap files"""
+        if args.latency_analysis and not args.dry_run:
+            args.latency_analyzer = LatencyAnalyzer(args.dut)
+
+    def _setup_pysipp_pool(args):
+        """Helper to start long-lived processes, which run SIPp scenarios"""
+        if args.sipp_worker_pool and not args.dry_run:
+            args.pysipp_pool = PysippWorkerPool(args.sipp_worker_pool)
+
+    def _shutdown_pysipp_pool(args):
+        """Helper to stop the processes, which run SIPp scenarios"""
+        if args.pysipp_pool:
+            args.pysipp_pool.stop()
+            args.pysipp_pool = None
+
+    def _setup_archiver(args):
+        """Helper to start background archiving of test run folders"""
+        if args.archive_folder:
+            args.archiver = Archiver(args.work_folder,
+                                     args.archive_folder,
+                                     args.archive_format,
+                                     args.archive_workers,
+                                     args.instance_id)
+
+    def _setup_janitor(args):
+        """Helper to start background enforcing of test run folders retention limits"""
+        if args.leave_temp_last is not None or args.leave_temp_max_bytes is not None:
+            # Retained test run folders end up in the archive folder, if it's used
+            root = args.archive_folder if args.archive_folder else args.work_folder
+            # The root is shared with other instances, so only test runs of this instance are evicted
+            args.janitor = Janitor(root, args.leave_temp_last, args.leave_temp_max_bytes, instance_id=args.instance_id)
+
+    def _shutdown_latency_analyzer(args):
+        """Helper to wait for the latency analysis of finished tests"""
+        if args.latency_analyzer:
+            # Analyzed test run folders are handed over to the archiver
+            logger.debug('Waiting for latency analysis to finish')
+            args.latency_analyzer.stop()
+            args.latency_analyzer = None
+
+    def _shutdown_archiver(args):
+        """Helper to drain the archiver"""
+        if args.archiver:
+            logger.debug('Waiting for archiving to finish')
+            args.archiver.stop()
+            args.archiver = None
+
+    def _shutdown_janitor(args):
+        """Helper to stop enforcing of test run folders retention limits"""
+        if args.janitor:
+            args.janitor.stop()
+            args.janitor = None
+
+    def _shutdown_work_folder(args, is_tmpfs_mounted):
+        """Helper to release the work folder"""
+        if is_tmpfs_mounted:
+            umount(args.work_folder)
+            logging.info("Unmounted tmpfs at {0}".format(args.work_folder))
+
     # Init ret code - pesimistic
     ret_code = 1
+    is_tmpfs_mounted = False
 
     args = sipplauncher.utils.Init.setup()
     try:
         logging.debug(args)
+        _setup_registry(args)
         _interfaces_cleaning(args)
         _setup_tls_key_interception(args)
+        _setup_interface_pool(args)
+        _setup_source_routing(args)
+        _setup_shaper(args)
+        is_tmpfs_mounted = _setup_work_folder(args)
+        _setup_capture_engine(args)
+        _setup_archiver(args)
+        _setup_janitor(args)
+        _setup_latency_analyzer(args)
+        _setup_pysipp_pool(args)
 
         ret_code = Run.run(args)
         while args.loop and ret_code == 0:
@@ -112,7 +304,18 @@ def my_main_fun():
         logger.info(msg)
         logger.debug(e, exc_info = True)
     finally:
-        _interfaces_cleaning(args)
+        # Every step is run, even if the previous ones have failed
+        _shutdown(_shutdown_pysipp_pool, args)
+        _shutdown(_interfaces_cleaning, args)
+        _shutdown(_shutdown_capture_engine, args)
+        _shutdown(_shutdown_shaper, args)
+        _shutdown(_shutdown_source_routing, args)
+        _shutdown(_shutdown_registry, args)
+        _shutdown(Network.netlink.close)
+        _shutdown(_shutdown_latency_analyzer, args)
+        _shutdown(_shutdown_archiver, args)
+        _shutdown(_shutdown_janitor, args)
+        _shutdown(_shutdown_work_folder, args, is_tmpfs_mounted)
 
     sys.exit(ret_code)
 
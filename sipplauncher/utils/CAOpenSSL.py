@@ -14,9 +14,17 @@ www.luismartingil.com
 '''
 
 import logging
+import os
+import shutil
+import tempfile
+import threading
+import queue
 from OpenSSL import crypto, SSL
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import ec
 from time import gmtime, mktime
-from .Defaults import DEFAULT_CA_CN
+from .Defaults import (DEFAULT_CA_CN,
+                       DEFAULT_TLS_KEY_POOL_SIZE)
 
 BYTES=2048
 TIME_UNIT=24 * 60 * 60
@@ -28,33 +36,131 @@ VALID_YEARS_AFTER=10 # Valid until now + X number of years
 EXT_CERT='crt'
 EXT_KEY='key'
 
+KEY_TYPE_RSA='rsa'
+KEY_TYPE_EC='ec'
+KEY_TYPES=[KEY_TYPE_RSA, KEY_TYPE_EC]
+
+CA_FILENAME='ca'
+
 CA_C="ES" # countryName
 CA_ST='Madrid' # stateOrProvinceName
 CA_L='Madrid' # localityName
 CA_O='ca.sipplauncher' # organizationName
 CA_OU='ca.sipplauncher' # organizationalUnitName
 
+class KeyPool(object):
+    """ Pre-generates private keys in a background thread ahead of demand
+    """
+    def __init__(self, key_type, size):
+        self.__key_type = key_type
+        self.__queue = queue.Queue(maxsize=size)
+        self.__thread = None
+        self.__lock = threading.Lock()
+
+    def __run(self):
+        try:
+            while True:
+                # Blocks while the pool is full
+                self.__queue.put(CAOpenSSL.generate_key(self.__key_type))
+        except BaseException as e:
+            # Hand the exception over to get().
+            # Otherwise callers would wait forever for keys, which are never generated.
+            logging.debug(e, exc_info = True)
+            self.__queue.put(e)
+
+    def get(self):
+        """ Takes a key from the pool, waiting for it to be generated if the pool is empty.
+        The generating thread is started on the first request,
+        so it doesn't consume CPU if TLS certificates are never requested.
+        """
+        with self.__lock:
+            if not self.__thread:
+                self.__thread = threading.Thread(target=self.__run)
+                self.__thread.setDaemon(True)
+                self.__thread.start()
+            thread = self.__thread
+        while True:
+            alive = thread.is_alive()
+            try:
+                # Issue #35: Busy-loop wait.
+                # Otherwise we could wait forever if the thread terminates after another caller has taken its exception.
+                key = self.__queue.get(block=alive, timeout=1)
+            except queue.Empty:
+                if alive:
+                    continue
+                # The generating thread has failed, generate the key by ourselves
+                return CAOpenSSL.generate_key(self.__key_type)
+            if isinstance(key, BaseException):
+                raise key
+            return key
+
+
 class CAOpenSSL(object):
-    def __init__(self, ca_cert_filepath=None, ca_key_filepath=None):
-        if ca_cert_filepath and ca_key_filepath:
-            with open(ca_cert_filepath, 'r') as f:
-                buf = f.read()
-                self.__ca_cert = crypto.load_certificate(crypto.FILETYPE_PEM, buf)
+    def __init__(self, ca_cert_filepath=None, ca_key_filepath=None, key_type=KEY_TYPE_RSA,
+                 cache_folder=None, pool_size=DEFAULT_TLS_KEY_POOL_SIZE):
+        """
+        :param key_type: type of generated private keys, one of KEY_TYPES
+        :type key_type: str
+
+        :param cache_folder: folder to persist generated certificates and keys across runs, None to disable
+        :type cache_folder: str
+
+        :param pool_size: number of private keys to pre-generate in background, 0 to disable
+        :type pool_size: int
+        """
+        assert(key_type in KEY_TYPES)
+        self.__key_type = key_type
+        self.__cache_folder = cache_folder
+        self.__pool = KeyPool(key_type, pool_size) if pool_size > 0 else None
 
-            with open(ca_key_filepath, 'r') as f:
-                buf = f.read()
-                self.__ca_key = crypto.load_privatekey(crypto.FILETYPE_PEM, buf)
+        if ca_cert_filepath and ca_key_filepath:
+            self.__ca_cert, self.__ca_key = self.__load_cert_key_pair(ca_cert_filepath, ca_key_filepath)
+        elif cache_folder and os.path.exists(self.__get_cached_ca_filename(EXT_CERT)):
+            # Reuse auto-generated CA from the previous runs.
+            # Otherwise cached certificates would be signed by unknown CA.
+            self.__ca_cert, self.__ca_key = self.__load_cert_key_pair(self.__get_cached_ca_filename(EXT_CERT),
+                                                                      self.__get_cached_ca_filename(EXT_KEY))
+            logging.info("Using cached TLS CA certificate and key")
         else:
-            self.__ca_cert, self.__ca_key = self.__create_cert_key_pair(DEFAULT_CA_CN)
+            self.__ca_cert, self.__ca_key = self.__create_cert_key_pair(DEFAULT_CA_CN, self.generate_key(KEY_TYPE_RSA))
             self.__ca_cert.add_extensions([
                 crypto.X509Extension(b'basicConstraints', True, b'CA:TRUE'),
                 crypto.X509Extension(b'subjectKeyIdentifier', False, b'hash', subject=self.__ca_cert)
             ])
             logging.info("Auto-generated TLS CA certificate and key")
+            if cache_folder:
+                os.makedirs(cache_folder, exist_ok=True)
+                self.__write_cert_key_pair(self.__ca_cert, self.__ca_key, os.path.join(cache_folder, CA_FILENAME))
+
+        self.__fingerprint = self.__ca_cert.digest(HASH_ALGORITHM).decode("ascii").replace(":", "").lower()
+
+    @staticmethod
+    def __load_cert_key_pair(cert_filepath, key_filepath):
+        with open(cert_filepath, 'r') as f:
+            buf = f.read()
+            cert = crypto.load_certificate(crypto.FILETYPE_PEM, buf)
+
+        with open(key_filepath, 'r') as f:
+            buf = f.read()
+            key = crypto.load_privatekey(crypto.FILETYPE_PEM, buf)
+        return cert, key
+
+    def __get_cached_ca_filename(self, ext):
+        return os.path.join(self.__cache_folder, '{0}.{1}'.format(CA_FILENAME, ext))
+
+    @staticmethod
+    def generate_key(key_type):
+        """ Generates a private key of the given type
+        """
+        if key_type == KEY_TYPE_EC:
+            return crypto.PKey.from_cryptography_key(ec.generate_private_key(ec.SECP256R1(), default_backend()))
+        key = crypto.PKey()
+        key.generate_key(crypto.TYPE_RSA, BYTES)
+        return key
 
     @staticmethod
-    def __create_cert_key_pair(cn):
-        """ Generates a given cert and key using the CN (commonName) param
+    def __create_cert_key_pair(cn, key):
+        """ Generates a given cert using the CN (commonName) param and the given key
         """
         # Generate 509 cert
         cert = crypto.X509()
@@ -68,9 +174,6 @@ class CAOpenSSL(object):
         cert.gmtime_adj_notBefore(- TIME_UNIT * VALID_DAYS_BEFORE)
         cert.gmtime_adj_notAfter(TIME_UNIT * 365 * VALID_YEARS_AFTER)
         cert.set_issuer(cert.get_subject())
-        # Generate key
-        key = crypto.PKey()
-        key.generate_key(crypto.TYPE_RSA, BYTES)
         # Signing certificate using key
         cert.set_pubkey(key)
         cert.sign(key, HASH_ALGORITHM)
@@ -92,11 +195,52 @@ class CAOpenSSL(object):
 
         return cert_filename, key_filename
 
+    def __get_cached_filename(self, cn):
+        """ Cached certificates are keyed by the CA, which signed them, the CN and the key type
+        """
+        return os.path.join(self.__cache_folder, self.__fingerprint, '{0}.{1}'.format(cn, self.__key_type))
+
+    def __load_from_cache(self, cn, filename):
+        cached = self.__get_cached_filename(cn)
+        ret = []
+        for ext in [EXT_CERT, EXT_KEY]:
+            src = '{0}.{1}'.format(cached, ext)
+            if not os.path.exists(src):
+                return None
+            ret.append('{0}.{1}'.format(filename, ext))
+        for ext, dst in zip([EXT_CERT, EXT_KEY], ret):
+            shutil.copyfile('{0}.{1}'.format(cached, ext), dst)
+        logging.debug('Reused cached cert and key for CN "{0}"'.format(cn))
+        return tuple(ret)
+
+    def __save_to_cache(self, cn, cert_filename, key_filename):
+        cached = self.__get_cached_filename(cn)
+        folder = os.path.dirname(cached)
+        os.makedirs(folder, exist_ok=True)
+        # Concurrent sipplauncher instances might share the cache.
+        # Write to temporary files and rename, so a reader never sees a partially written file.
+        # The key is renamed first, because a reader checks for the cert first.
+        for ext, src in [(EXT_KEY, key_filename), (EXT_CERT, cert_filename)]:
+            fd, tmp = tempfile.mkstemp(dir=folder)
+            os.close(fd)
+            shutil.copyfile(src, tmp)
+            os.rename(tmp, '{0}.{1}'.format(cached, ext))
+
     def gen_cert_key(self, cn, filename):
         """ Creates cert and key which are CA-signed
         """
-        server_cert, server_key = self.__create_cert_key_pair(cn)
+        if self.__cache_folder:
+            ret = self.__load_from_cache(cn, filename)
+            if ret:
+                return ret
+
+        key = self.__pool.get() if self.__pool else self.generate_key(self.__key_type)
+        server_cert, server_key = self.__create_cert_key_pair(cn, key)
         # Signing server certificate using ca key
         server_cert.set_issuer(self.__ca_cert.get_subject())
         server_cert.sign(self.__ca_key, HASH_ALGORITHM)
-        return self.__write_cert_key_pair(server_cert, server_key, filename)
+        ret = self.__write_cert_key_pair(server_cert, server_key, filename)
+
+        if self.__cache_folder:
+            self.__save_to_cache(cn, *ret)
+        return ret
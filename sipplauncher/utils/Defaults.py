@@ -30,6 +30,7 @@ log_config_paths = [DEFAULT_LOG_CONFIG_PATH]
 
 DEFAULT_GROUP=1
 DEFAULT_NETWORK_MASK=24
+DEFAULT_NETWORK_MASK_IPV6=64
 DEFAULT_GROUP_PAUSE=0.8
 
 DEFAULT_SCENARIO_FILENAME_REGEX='^(ua[cs])_(ua[0-9]+).xml$'
@@ -37,6 +38,22 @@ DEFAULT_SCENARIO_PART_FILENAME_REGEX='^([a-zA-Z0-9]+)_(ua[cs])_(ua[0-9]+).xml$'
 
 # Issue #9: Create dynamic execution test temp folder for each test execution
 DEFAULT_TEMP_FOLDER="/var/tmp/sipplauncher"
+# Host-wide registry of resources, leased by running instances
+DEFAULT_LEASE_FOLDER = "/var/run/sipplauncher"
+
+# Policy routing of source pools: the first routing table and the priority of rules
+DEFAULT_SOURCE_ROUTING_TABLE = 1000
+DEFAULT_SOURCE_ROUTING_PRIORITY = 1000
+
+# Fraction of the work folder filesystem usage, above which the scheduler waits for archiving
+DEFAULT_WORK_FOLDER_HIGH_WATERMARK = 0.8
+
+# Marks finished test run folder and stores the test result
+DEFAULT_RESULT_FILE = ".sipplauncher-result"
+DEFAULT_JANITOR_PERIOD = 5 # sec
+
+DEFAULT_ARCHIVE_FORMAT = "dir"
+DEFAULT_ARCHIVE_WORKERS = 2
 
 # Issue #37: Add timeout to before/after script running to handle deadlocked scripts
 DEFAULT_SCRIPT_TIMEOUT = 60
@@ -53,10 +70,27 @@ DEFAULT_TESTSUITE_TEMPLATES = "TEMPLATES"
 # Issue #56: Global before.sh/after.sh
 DEFAULT_TESTSUITE_GLOBAL_TEST = "GLOBAL"
 
+# SIPp's default SIP ports
+DEFAULT_SIP_PORT = 5060
+DEFAULT_SIP_TLS_PORT = 5061
+# Every UA endpoint on a shared IP takes a block of ports:
+# SIP port, 3PCC twin socket port and media ports
+DEFAULT_UA_PORT_BLOCK = 8
+DEFAULT_UA_MEDIA_PORT_OFFSET = 2
+
 DEFAULT_CA_CN = "ca.zaleos.net"
+# Number of TLS private keys, which are generated in background ahead of demand
+DEFAULT_TLS_KEY_POOL_SIZE = 8
 
 DEFAULT_SSL_KEY_LOG_LIB = "/usr/local/lib/libsslkeylog.so"
 DEFAULT_TLS_PREMASTER_KEYS_FILE = "tls_libsslkeylog_premaster_keys.txt"
 
 DEFAULT_DNS_FILE = "dns.txt"
 DEFAULT_3PCC_FILE = "3pcc.txt"
+DEFAULT_NETEM_FILE = "netem.txt"
+
+DEFAULT_CAPTURE_BACKEND = "scapy"
+DEFAULT_CAPTURE_PROFILE = "full"
+DEFAULT_DNS_PORT = 53
+DEFAULT_LATENCY_PERCENTILES = [50, 90, 95, 99]
+DEFAULT_SIPP_LAUNCHER = "pysipp"
@@ -8,7 +8,9 @@
 """
 
 import argparse
+import ipaddress
 import json
+import re
 import sys
 import os
 import logging
@@ -20,13 +22,35 @@ from .Defaults import (long_description,
                       DEFAULT_GROUP,
                       DEFAULT_GROUP_PAUSE,
                       DEFAULT_NETWORK_MASK,
+                      DEFAULT_NETWORK_MASK_IPV6,
                       DEFAULT_TESTSUITE,
+                      DEFAULT_TEMP_FOLDER,
+                      DEFAULT_ARCHIVE_FORMAT,
+                      DEFAULT_ARCHIVE_WORKERS,
                       DEFAULT_TESTSUITE_TEMPLATES,
                       DEFAULT_TESTSUITE_GLOBAL_TEST,
-                      DEFAULT_SIPP_INFO_FILE)
-
-from .Utils import (which, is_tls_transport)
-from .CAOpenSSL import CAOpenSSL
+                      DEFAULT_SIPP_INFO_FILE,
+                      DEFAULT_TLS_KEY_POOL_SIZE,
+                      DEFAULT_SIP_PORT,
+                      DEFAULT_SIP_TLS_PORT,
+                      DEFAULT_UA_PORT_BLOCK,
+                      DEFAULT_NETEM_FILE,
+                      DEFAULT_CAPTURE_BACKEND,
+                      DEFAULT_CAPTURE_PROFILE,
+                      DEFAULT_SIPP_LAUNCHER)
+
+from .Utils import (which, is_tls_transport, is_pcap, generate_id)
+from ..IPAllocator import (IPAllocator,
+                           STRATEGY_ROUND_ROBIN,
+                           STRATEGY_LEAST_LOADED)
+from ..PcapWriter import (PROFILES,
+                         HEADERS_SNAPLEN)
+from ..Netem import (parse_profile,
+                     NetemException)
+from ..LatencyAnalyzer import is_supported as is_latency_supported
+from .CAOpenSSL import (CAOpenSSL,
+                        KEY_TYPES,
+                        KEY_TYPE_RSA)
 
 
 def get_stamped_id():
@@ -86,8 +110,26 @@ def generate_parser():
     parser.add_argument("--global-test-folder", help="path to the folder which contains global provisioning or checking scripts. Default: \"<testsuite>/{0}\"".format(DEFAULT_TESTSUITE_GLOBAL_TEST))
     parser.add_argument("--pattern-exclude", action="append", help="regular expression to exclude tests (if used with \"only\" arg, and a test name matches both, the test is excluded)")
     parser.add_argument("--pattern-only", action="append", help="regular expression to specify the only tests which should be run (if used with \"exclude\" arg, and a test name matches both, the test is excluded)")
-    parser.add_argument("--network-mask", type=int, default=DEFAULT_NETWORK_MASK,
-                        help="network mask. Default: \"{0}\"".format(DEFAULT_NETWORK_MASK))
+    parser.add_argument("--network-mask", type=int,
+                        help="network mask. Default: \"{0}\" or \"{1}\" for IPv6 DUT".format(DEFAULT_NETWORK_MASK, DEFAULT_NETWORK_MASK_IPV6))
+    parser.add_argument("--ip-range", action="append",
+                        help="network (CIDR notation) or range (\"<first>-<last>\") to allocate UA IP addresses from. Default: DUT network")
+    parser.add_argument("--instance-id",
+                        help="ID of this instance, up to 3 lowercase letters or digits. It scopes the host resources, used by this instance. Default: random")
+    parser.add_argument("--interface-pool-size", type=int, default=0,
+                        help="number of dummy interfaces, which are created once and shared by tests. 0 creates an interface per test. Default: \"0\"")
+    parser.add_argument("--ua-ports-per-ip", type=int, default=1,
+                        help="number of UAs of different tests, which share an IP, listening on different ports. Requires \"interface-pool-size\" arg. Default: \"1\"")
+    parser.add_argument("--ua-first-port", type=int,
+                        help="SIP port of the first UA on a shared IP. Default: \"{0}\" or \"{1}\" for TLS".format(DEFAULT_SIP_PORT, DEFAULT_SIP_TLS_PORT))
+    parser.add_argument("--ip-range-trusted", action="store_true",
+                        help="IP ranges are reserved for Sipplauncher, so addresses are not ARP-probed before use. Must be used together with \"ip-range\" arg")
+    parser.add_argument("--source-pool", action="append",
+                        help="network (CIDR notation) or range (\"<first>-<last>\") to allocate UA IP addresses from, and the interface, through which their traffic leaves, in the form \"<range>@<interface>\". Could be repeated")
+    parser.add_argument("--source-pool-strategy", choices=[STRATEGY_ROUND_ROBIN, STRATEGY_LEAST_LOADED], default=STRATEGY_ROUND_ROBIN,
+                        help="how UAs are spread across source pools. Default: \"{0}\"".format(STRATEGY_ROUND_ROBIN))
+    parser.add_argument("--netem",
+                        help="netem parameters to impair the traffic of all the UAs with, for ex. \"delay 100ms 20ms loss 1%%\". Test's \"{0}\" file takes precedence".format(DEFAULT_NETEM_FILE))
     parser.add_argument("--group", type=int, default=DEFAULT_GROUP,
                         help="number of SIPp tests to be run at the same time. Default: \"{0}\"".format(DEFAULT_GROUP))
     parser.add_argument("--group-pause", type=int, default=DEFAULT_GROUP_PAUSE,
@@ -99,19 +141,53 @@ def generate_parser():
     parser.add_argument("--dry-run", help="dry run, simulates an execution", action="store_true")
     parser.add_argument("--fail-expected", help="ok if the execution fails", action="store_true")
     parser.add_argument("--leave-temp", help="Leave temporary directories in which tests are executed", action="store_true")
+    parser.add_argument("--leave-temp-failed", help="Leave temporary directories of failed tests only", action="store_true")
+    parser.add_argument("--leave-temp-last", type=int, help="Leave at most the given number of temporary directories of passed tests, removing the oldest ones. Must be used together with \"leave-temp\" arg")
+    parser.add_argument("--leave-temp-max-bytes", type=int, help="Remove the oldest temporary directories of passed tests when all the left temporary directories occupy more than the given number of bytes. Must be used together with \"leave-temp\" arg")
+    parser.add_argument("--work-folder", default=DEFAULT_TEMP_FOLDER,
+                        help="path to the folder, where test run folders are created. Default: \"{0}\"".format(DEFAULT_TEMP_FOLDER))
+    parser.add_argument("--work-tmpfs-size", help="mount tmpfs of the given size (for ex. \"512M\") at the work folder")
+    parser.add_argument("--archive-folder", help="path to the folder, to which test run folders are moved in background after a test has finished. Must be used together with \"leave-temp\" arg")
+    parser.add_argument("--archive-format", choices=["dir", "tar.gz", "tar.zst"], default=DEFAULT_ARCHIVE_FORMAT,
+                        help="how to store test run folders in the archive folder: \"dir\" moves folders as is, others compress them into a single indexed archive file. Default: \"{0}\"".format(DEFAULT_ARCHIVE_FORMAT))
+    parser.add_argument("--archive-workers", type=int, default=DEFAULT_ARCHIVE_WORKERS,
+                        help="number of background archiving threads. Default: \"{0}\"".format(DEFAULT_ARCHIVE_WORKERS))
+    parser.add_argument("--temp-folder-mode", choices=["copy", "link"], default="copy",
+                        help="How to populate a test run folder: \"copy\" copies the whole test folder, \"link\" copies only templated files and hardlinks the rest. Default: \"copy\"")
     parser.add_argument("--keyword-replacement-values", type=json.loads, help="Custom keyword values in JSON object format to be used to replace values in scripts and SIPp scenarios (sed-like)")
     parser.add_argument("--no-pcap", help="Disable capturing to pcap files", action="store_true")
+    parser.add_argument("--capture-backend", choices=["scapy", "afpacket", "shared"], default=DEFAULT_CAPTURE_BACKEND,
+                        help="how to capture to pcap files: \"scapy\" sniffs in the launcher process, \"afpacket\" reads an AF_PACKET ring in a separate process per test, \"shared\" reads a single AF_PACKET ring for all the tests. Default: \"{0}\"".format(DEFAULT_CAPTURE_BACKEND))
+    parser.add_argument("--capture-profile", choices=PROFILES, default=DEFAULT_CAPTURE_PROFILE,
+                        help="what to capture to pcap files: \"full\" captures all the packets, \"signaling\" captures SIP and DNS packets only, \"headers\" captures SIP and DNS packets and only the first {0} bytes of media packets. Default: \"{1}\"".format(HEADERS_SNAPLEN, DEFAULT_CAPTURE_PROFILE))
+    parser.add_argument("--latency-analysis", action="store_true",
+                        help="measure the latency of the DUT responses from pcap files of finished tests in background. Requires numpy package")
+    parser.add_argument("--pcap-rotate-bytes", type=int, help="start a new pcap file of a test run, when the current one exceeds the given number of bytes")
+    parser.add_argument("--pcap-rotate-seconds", type=int, help="start a new pcap file of a test run, when the current one spans the given number of seconds")
     parser.add_argument("--tls-ca-root-cert", help="TLS CA root certificate file (.pem format). Must be used together with \"tls-ca-root-key\" arg", type=valid_file_path)
     parser.add_argument("--tls-ca-root-key", help="TLS CA root key file (.pem format). Must be used together with \"tls-ca-root-key\" arg", type=valid_file_path)
+    parser.add_argument("--tls-key-type", choices=KEY_TYPES, default=KEY_TYPE_RSA,
+                        help="type of generated TLS private keys: \"rsa\" is RSA 2048, \"ec\" is ECDSA P-256. Default: \"{0}\"".format(KEY_TYPE_RSA))
+    parser.add_argument("--tls-key-pool-size", type=int, default=DEFAULT_TLS_KEY_POOL_SIZE,
+                        help="number of TLS private keys to pre-generate in background. 0 disables pre-generation. Default: \"{0}\"".format(DEFAULT_TLS_KEY_POOL_SIZE))
+    parser.add_argument("--tls-cert-cache", help="path to the folder, where generated TLS certificates and keys are cached across runs")
 
     # SIPp args
     parser.add_argument("--sipp-transport", help="SIPp -t param. Default is 'l1' if TLS is requested, otherwise 'u1'", choices=['u1', 'un', 'ui', 't1', 'tn', 'l1', 'ln'])
     parser.add_argument("--sipp-info-file", help="SIPp -inf param", type=valid_abs_file_path)
     parser.add_argument("--sipp-call-rate", help="Calls per seconds, SIPp -r param. Be aware, that '--sipp-concurrent-calls-limit' could be hit before call rate", type=float, default=1.0)
     parser.add_argument("--sipp-max-calls", help="Amount of calls to perform. SIPp -m param", type=int, default=1)
+    parser.add_argument("--sipp-shards", type=int, default=1,
+                        help="split calls, call rate and concurrent calls limit of a test across the given number of SIPp instances per UA. Every shard of UAs gets its own endpoints. Default: \"1\"")
+    parser.add_argument("--sipp-persistent-uas", action="store_true",
+                        help="keep UAS of multi-part tests running across calls, instead of relaunching them for every call. Only UAS, which have a scenario in a single part, are kept running")
     parser.add_argument("--sipp-recv-timeout", help="SIPp -recv_timeout param", type=int, default=5000)
     parser.add_argument("--sipp-tls-version", help="SIPp -tls_version param", choices=['1.0', '1.1', '1.2'], default=None)
     parser.add_argument("--sipp-concurrent-calls-limit", help="Maximum number of simultaneous calls. SIPp -l param.", type=int, default=1)
+    parser.add_argument("--sipp-worker-pool", type=int, default=0,
+                        help="run SIPp scenarios in a pool of long-lived worker processes, starting the given number of workers beforehand. 0 starts a new process for every test. Default: \"0\"")
+    parser.add_argument("--sipp-launcher", choices=["pysipp", "native"], default=DEFAULT_SIPP_LAUNCHER,
+                        help="how to run SIPp: \"pysipp\" runs SIPp through Pysipp in a separate process, \"native\" runs SIPp directly from the launcher process. Default: \"{0}\"".format(DEFAULT_SIPP_LAUNCHER))
     parser.add_argument("--default_behaviors", help="Set the default behaviors that SIPp will use. Possible values are: all, none, bye, abortunexp, pingreply", default=None)
 
     return parser
@@ -145,6 +221,57 @@ def check_and_patch_args(args):
 
     if not args.dut:
         _exit_with_error('Please provide device under test (--dut arg)\n')
+    try:
+        dut_version = ipaddress.ip_address(args.dut).version
+    except ValueError as e:
+        _exit_with_error('Invalid DUT address: {0}'.format(e))
+    max_mask = 128 if dut_version == 6 else 32
+    if args.network_mask is None:
+        args.network_mask = DEFAULT_NETWORK_MASK_IPV6 if dut_version == 6 else DEFAULT_NETWORK_MASK
+    elif not 0 < args.network_mask <= max_mask:
+        _exit_with_error('--network-mask should be in range 1-{0}'.format(max_mask))
+
+    # check IP allocation arguments
+    if args.ip_range_trusted and not (args.ip_range or args.source_pool):
+        _exit_with_error('--ip-range-trusted requires --ip-range or --source-pool arg')
+    if args.ip_range and args.source_pool:
+        _exit_with_error('--ip-range is not compatible with --source-pool arg')
+    # networks and interface of every source pool
+    args.source_pools = []
+    try:
+        if args.source_pool:
+            ranges = []
+            for pool in args.source_pool:
+                value, sep, ifname = pool.rpartition('@')
+                if not sep or not value or not ifname:
+                    raise ValueError('Source pool "{0}" should be in the form "<range>@<interface>"'.format(pool))
+                ranges.append(IPAllocator.parse_range(value, args.network_mask, args.ip_range_trusted))
+                args.source_pools.append((IPAllocator.parse_networks(value), ifname))
+        elif args.ip_range:
+            ranges = [IPAllocator.parse_range(r, args.network_mask, args.ip_range_trusted) for r in args.ip_range]
+        else:
+            ranges = [IPAllocator.parse_range('{0}/{1}'.format(args.dut, args.network_mask), args.network_mask)]
+    except ValueError as e:
+        _exit_with_error('Invalid IP range: {0}'.format(e))
+    if any(r.version != dut_version for r in ranges):
+        _exit_with_error('--ip-range and --source-pool should be of the same IP version as the DUT')
+    if args.source_pool:
+        args.ip_allocator = IPAllocator(ranges, args.source_pool_strategy)
+    else:
+        args.ip_allocator = IPAllocator(ranges)
+    # Source pools routing is set up on startup, if requested
+    args.source_routing = None
+
+    if args.interface_pool_size < 0:
+        _exit_with_error('--interface-pool-size should be non-negative')
+    args.interface_pool = None
+
+    if args.instance_id:
+        if not re.match(r'^[a-z0-9]{1,3}$', args.instance_id):
+            _exit_with_error('--instance-id should be up to 3 lowercase letters or digits')
+    else:
+        args.instance_id = generate_id(n=3)
+    args.registry = None
 
     if args.template_folder:
         _check_is_dir(args.template_folder)
@@ -160,6 +287,37 @@ def check_and_patch_args(args):
         if os.path.isdir(global_test_folder):
             args.global_test_folder = global_test_folder
 
+    if args.archive_folder and not (args.leave_temp or args.leave_temp_failed):
+        _exit_with_error('--archive-folder requires --leave-temp or --leave-temp-failed arg')
+    if args.archive_workers < 1:
+        _exit_with_error('--archive-workers should be positive')
+    if args.work_tmpfs_size and (args.leave_temp or args.leave_temp_failed) and not args.archive_folder:
+        # Otherwise test run folders are lost when tmpfs is unmounted at exit
+        _exit_with_error('--work-tmpfs-size together with --leave-temp requires --archive-folder arg')
+    if args.leave_temp_last is not None or args.leave_temp_max_bytes is not None:
+        if not args.leave_temp:
+            _exit_with_error('--leave-temp-last and --leave-temp-max-bytes require --leave-temp arg')
+        if (args.leave_temp_last is not None and args.leave_temp_last < 0) or \
+           (args.leave_temp_max_bytes is not None and args.leave_temp_max_bytes < 0):
+            _exit_with_error('--leave-temp-last and --leave-temp-max-bytes should not be negative')
+        if args.archive_folder and args.archive_format != "dir":
+            _exit_with_error('--leave-temp-last and --leave-temp-max-bytes are not compatible with --archive-format {0}'.format(args.archive_format))
+    if args.latency_analysis and not is_pcap(args):
+        _exit_with_error('--latency-analysis requires pcap capturing: --leave-temp or --leave-temp-failed arg without --no-pcap arg')
+    if args.latency_analysis and not is_latency_supported():
+        # Checked here, before the host networking is set up on startup
+        _exit_with_error('--latency-analysis requires numpy package')
+    if args.pcap_rotate_bytes is not None and args.pcap_rotate_bytes <= 0:
+        _exit_with_error('--pcap-rotate-bytes should be positive')
+    if args.pcap_rotate_seconds is not None and args.pcap_rotate_seconds <= 0:
+        _exit_with_error('--pcap-rotate-seconds should be positive')
+    # Shared capture engine and latency analyzer are instantiated on startup, if requested
+    args.capture_engine = None
+    args.latency_analyzer = None
+    # Archiver and Janitor are instantiated on startup, if requested
+    args.archiver = None
+    args.janitor = None
+
     if not args.sipp_info_file:
         info_file = os.path.join(args.testsuite, DEFAULT_SIPP_INFO_FILE)
         if os.path.isfile(info_file):
@@ -169,20 +327,64 @@ def check_and_patch_args(args):
         args.sipp_transport = "l1" if args.tls_ca_root_cert else "u1"
         logging.info("Auto-selected transport: {0}".format(args.sipp_transport))
 
+    if args.sipp_shards < 1:
+        _exit_with_error('--sipp-shards should be positive')
+
+    if args.sipp_worker_pool < 0:
+        _exit_with_error('--sipp-worker-pool should not be negative')
+    if args.sipp_worker_pool and args.sipp_launcher != "pysipp":
+        _exit_with_error('--sipp-worker-pool is not compatible with --sipp-launcher {0}'.format(args.sipp_launcher))
+    # Pysipp worker pool is instantiated on startup, if requested
+    args.pysipp_pool = None
+
+    # check UA endpoint arguments
+    if args.ua_ports_per_ip < 1:
+        _exit_with_error('--ua-ports-per-ip should be positive')
+    if args.ua_ports_per_ip > 1 and not args.interface_pool_size:
+        _exit_with_error('--ua-ports-per-ip requires --interface-pool-size arg')
+    if args.ua_first_port is None:
+        args.ua_first_port = DEFAULT_SIP_TLS_PORT if is_tls_transport(args.sipp_transport) else DEFAULT_SIP_PORT
+    elif args.ua_ports_per_ip == 1:
+        _exit_with_error('--ua-first-port requires --ua-ports-per-ip arg')
+    if not 0 < args.ua_first_port <= 65536 - args.ua_ports_per_ip * DEFAULT_UA_PORT_BLOCK:
+        _exit_with_error('--ua-first-port and --ua-ports-per-ip exceed the range of ports')
+    # Endpoint pool is instantiated on startup, if requested
+    args.endpoint_pool = None
+
+    # check network impairment arguments
+    args.netem_profile = {}
+    if args.netem:
+        try:
+            args.netem_profile = parse_profile([args.netem])
+        except (ValueError, NetemException) as e:
+            _exit_with_error('Invalid --netem: {0}'.format(e))
+        if args.ua_ports_per_ip > 1:
+            # Impairment is keyed by UA address, which is shared in this case
+            _exit_with_error('--netem is not compatible with --ua-ports-per-ip arg')
+    # Shaper is instantiated on startup
+    args.shaper = None
+
     # check TLS arguments
     args.sipplauncher_ca = None
+    if args.tls_key_pool_size < 0:
+        _exit_with_error('--tls-key-pool-size should be non-negative')
     if args.tls_ca_root_cert:
         if not args.tls_ca_root_key:
             _exit_with_error('--tls-ca-root-cert requires tls-ca-root-key arg')
         elif not is_tls_transport(args.sipp_transport):
             _exit_with_error('--sipp-transport {0} is not compatible with --tls-ca-root-cert arg'.format(args.sipp_transport))
-        args.sipplauncher_ca = CAOpenSSL(args.tls_ca_root_cert, args.tls_ca_root_key)
+        args.sipplauncher_ca = CAOpenSSL(args.tls_ca_root_cert, args.tls_ca_root_key, args.tls_key_type,
+                                         args.tls_cert_cache, args.tls_key_pool_size)
     elif args.tls_ca_root_key:
         _exit_with_error('--tls-ca-root-key requires tls-ca-root-cert arg')
     elif args.sipp_tls_version:
         _exit_with_error('--sipp-tls-version requires --tls-ca-root-cert arg')
     elif is_tls_transport(args.sipp_transport):
-        args.sipplauncher_ca = CAOpenSSL()
+        args.sipplauncher_ca = CAOpenSSL(key_type=args.tls_key_type,
+                                         cache_folder=args.tls_cert_cache,
+                                         pool_size=args.tls_key_pool_size)
+    elif args.tls_cert_cache:
+        _exit_with_error('--tls-cert-cache requires TLS transport')
 
 
 def setup():
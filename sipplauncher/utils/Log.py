@@ -39,6 +39,17 @@ class DynamicFileHandler(logging.FileHandler):
         self.baseFilename = os.path.abspath(os.path.join(folder, os.path.basename(self.baseFilename)))
         self.stream = self._open()
 
+    def unset_folder(self):
+        """ Closes the current log file, so the handler could be pointed to another folder. """
+        self.acquire()
+        try:
+            if self.stream:
+                self.flush()
+                self.stream.close()
+                self.stream = None
+        finally:
+            self.release()
+
     def emit(self, record):
         if self.stream:
             super().emit(record)
@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 
 import os
+import shutil
+import subprocess
 import fcntl
 import termios
 import struct
@@ -190,6 +192,95 @@ def check_file_struct(fs_path, root):
     return True
 
 
+# Files, which SIPp only reads, and which tests aren't expected to modify, for ex. RTP pcaps for play_pcap_audio.
+# They are hardlinked by link_tree(), if they can't be cloned.
+LINKED_EXTENSIONS = (".pcap",)
+
+# FICLONE ioctl from linux/fs.h
+FICLONE = 0x40049409
+
+
+def clone_file(src, dst):
+    """ Copies the file @src to @dst as a copy-on-write clone (reflink), if the filesystem supports it.
+    The clone shares data blocks with @src until either of them is modified, so a write to one isn't seen in the other.
+
+    :returns: False if the file can't be cloned, for ex. on ext4, tmpfs or across filesystems. @dst is not created then
+    :rtype: bool
+    """
+    with open(src, "rb") as fsrc:
+        with open(dst, "wb") as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            except OSError:
+                cloned = False
+            else:
+                cloned = True
+    if not cloned:
+        os.unlink(dst)
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+
+def link_tree(src, dst, copy_files):
+    """ Replicates the @src folder structure at @dst without copying the content of files, if possible.
+    Files are cloned (see clone_file()), so a write to the file in @dst isn't seen in @src.
+    If cloning is not possible, files with LINKED_EXTENSIONS are hardlinked, and the rest is copied.
+    If hardlinking is not possible either (for ex. @src and @dst reside on different filesystems), a file is copied.
+    Files from @copy_files are always copied, because they are going to be rewritten in @dst.
+    Symlinked folders are replicated the same way, as shutil.copytree() copies their content too.
+
+    :param src: Path of the source folder
+    :type src: str
+
+    :param dst: Path of the destination folder, must not exist
+    :type dst: str
+
+    :param copy_files: Paths relative to @src of files, which should be copied
+    :type copy_files: set(str)
+    """
+    for dirpath, dirnames, filenames in os.walk(src, followlinks=True):
+        rel_dirpath = os.path.relpath(dirpath, src)
+        dst_dirpath = os.path.normpath(os.path.join(dst, rel_dirpath))
+        os.makedirs(dst_dirpath)
+
+        for f in filenames:
+            src_path = os.path.join(dirpath, f)
+            dst_path = os.path.join(dst_dirpath, f)
+            if os.path.normpath(os.path.join(rel_dirpath, f)) not in copy_files:
+                if clone_file(src_path, dst_path):
+                    continue
+                if f.endswith(LINKED_EXTENSIONS):
+                    try:
+                        os.link(src_path, dst_path)
+                        continue
+                    except OSError:
+                        pass
+            shutil.copy2(src_path, dst_path)
+
+
+def mount_tmpfs(path, size):
+    """ Mounts tmpfs at the given path.
+
+    :param path: Path of a mount point, created if doesn't exist
+    :type path: str
+
+    :param size: tmpfs size, as accepted by mount(8), for ex. "512M"
+    :type size: str
+    """
+    os.makedirs(path, exist_ok=True)
+    subprocess.check_call(["mount", "-t", "tmpfs", "-o", "size={0}".format(size), "tmpfs", path])
+
+
+def umount(path):
+    """ Unmounts filesystem from the given path.
+
+    :param path: Path of a mount point
+    :type path: str
+    """
+    subprocess.check_call(["umount", path])
+
+
 def get_terminal_size():
     """ Returns the terminal size, modified from
     http://stackoverflow.com/a/3010495/851428
@@ -241,9 +332,20 @@ def is_tls_transport(transport):
     return transport in ["l1", "ln"]
 
 
+def is_leave_temp(args, failed):
+    """
+    :param failed: whether the test has failed
+    :type failed: bool
+
+    :return: True if test run folder should be left after the test has finished, False otherwise
+    :rtype: bool
+    """
+    return args.leave_temp or (args.leave_temp_failed and failed)
+
+
 def is_pcap(args):
     """
     :return: True if pcap capturing should be activate, False otherwise
     :rtype: bool
     """
-    return args.leave_temp and not args.no_pcap
+    return (args.leave_temp or args.leave_temp_failed) and not args.no_pcap
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import pytest
+import tempfile
+import os
+import io
+import gzip
+import json
+import tarfile
+import shutil
+
+from sipplauncher.utils.Utils import (gen_file_struct,
+                                      check_file_struct,
+                                      link_tree)
+from sipplauncher.Archiver import (Archiver,
+                                   ArchiveException,
+                                   read_index,
+                                   extract,
+                                   _get_safe_members)
+
+TEST_NAME = "my_test_name"
+
+def test_move():
+    """Testing finished test run folders are moved to the archive folder
+    """
+    mock_fs = {
+        TEST_NAME: {
+            "run1": {
+                "sipplauncher.log": "log",
+                "sipp-run1.pcap": "pcap",
+            },
+            "run2": {
+                "sipplauncher.log": "log",
+            },
+        },
+    }
+
+    dirpath = tempfile.mkdtemp(prefix="sipplauncher_test_Archiver_")
+    work_folder = os.path.join(dirpath, "work")
+    archive_folder = os.path.join(dirpath, "archive")
+    os.makedirs(work_folder)
+    gen_file_struct(work_folder, mock_fs)
+
+    archiver = Archiver(work_folder, archive_folder)
+    archiver.submit(os.path.join(work_folder, TEST_NAME, "run1"))
+    archiver.submit(os.path.join(work_folder, TEST_NAME, "run2"))
+    archiver.stop()
+
+    assert(check_file_struct(archive_folder, mock_fs))
+    assert(not os.listdir(work_folder))
+
+    shutil.rmtree(dirpath)
+
+
+def test_compress():
+    """Testing test run folders are compressed into a single archive and extracted one by one
+    """
+    run1 = {
+        "sipplauncher.log": "log1",
+        "sipp-run1.pcap": "pcap1",
+    }
+    run2 = {
+        "sipplauncher.log": "log2",
+    }
+    mock_fs = {
+        TEST_NAME: {
+            "run1": run1,
+            "run2": run2,
+        },
+    }
+
+    dirpath = tempfile.mkdtemp(prefix="sipplauncher_test_Archiver_")
+    work_folder = os.path.join(dirpath, "work")
+    archive_folder = os.path.join(dirpath, "archive")
+    output_folder = os.path.join(dirpath, "output")
+    os.makedirs(work_folder)
+    gen_file_struct(work_folder, mock_fs)
+
+    archiver = Archiver(work_folder, archive_folder, "tar.gz", workers=2)
+    archiver.submit(os.path.join(work_folder, TEST_NAME, "run1"))
+    archiver.submit(os.path.join(work_folder, TEST_NAME, "run2"))
+    archiver.stop()
+
+    assert(not os.listdir(work_folder))
+    entries = read_index(archiver.archive_path)
+    assert(sorted(e["run_id"] for e in entries) == ["run1", "run2"])
+
+    assert(extract(archiver.archive_path, TEST_NAME, "run2", output_folder) == 1)
+    assert(check_file_struct(output_folder, {TEST_NAME: {"run2": run2}}))
+    assert(not os.path.exists(os.path.join(output_folder, TEST_NAME, "run1")))
+
+    shutil.rmtree(dirpath)
+
+
+def test_compress_links():
+    """Testing test run folders with links to the test suite are archived with the content of the linked files
+    """
+    suite = {
+        "uac_ua0.xml": "scenario",
+        "audio.pcap": "rtp",
+        "users.csv": "alice",
+    }
+
+    dirpath = tempfile.mkdtemp(prefix="sipplauncher_test_Archiver_")
+    suite_folder = os.path.join(dirpath, "suite", TEST_NAME)
+    work_folder = os.path.join(dirpath, "work")
+    archive_folder = os.path.join(dirpath, "archive")
+    output_folder = os.path.join(dirpath, "output")
+    os.makedirs(suite_folder)
+    gen_file_struct(suite_folder, suite)
+    run_folder = os.path.join(work_folder, TEST_NAME, "run1")
+    link_tree(suite_folder, run_folder, {"uac_ua0.xml"})
+    # Absolute symlink into the test suite, for ex. created by a script
+    os.symlink(os.path.join(suite_folder, "users.csv"), os.path.join(run_folder, "users_link.csv"))
+
+    archiver = Archiver(work_folder, archive_folder, "tar.gz")
+    archiver.submit(run_folder)
+    archiver.stop()
+    shutil.rmtree(os.path.join(dirpath, "suite"))
+
+    assert(extract(archiver.archive_path, TEST_NAME, "run1", output_folder) == 1)
+    suite["users_link.csv"] = "alice"
+    assert(check_file_struct(output_folder, {TEST_NAME: {"run1": suite}}))
+    for name in suite:
+        assert(not os.path.islink(os.path.join(output_folder, TEST_NAME, "run1", name)))
+
+    shutil.rmtree(dirpath)
+
+
+def test_instances():
+    """Testing several instances don't write to the same archive
+    """
+    dirpath = tempfile.mkdtemp(prefix="sipplauncher_test_Archiver_")
+    archivers = [Archiver(dirpath, dirpath, "tar.gz", instance_id=instance_id) for instance_id in ["a", "b"]]
+    assert(archivers[0].archive_path != archivers[1].archive_path)
+    assert(archivers[0].archive_path.endswith("-a.tar.gz"))
+    for archiver in archivers:
+        archiver.stop()
+    shutil.rmtree(dirpath)
+
+
+def get_tar(names):
+    """
+    :returns: gzipped tar stream with the given member names
+    :rtype: bytes
+    """
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb") as stream:
+        with tarfile.open(fileobj=stream, mode="w|") as tar:
+            for name in names:
+                info = tarfile.TarInfo(name)
+                info.size = 1
+                tar.addfile(info, io.BytesIO(b"x"))
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize(
+    "names", [
+        ["../evil"],
+        [TEST_NAME + "/run1/../../../evil"],
+    ]
+)
+def test_extract_outside(names):
+    """Testing members outside of the output folder are not extracted
+    """
+    dirpath = tempfile.mkdtemp(prefix="sipplauncher_test_Archiver_")
+    output_folder = os.path.join(dirpath, "output", "nested")
+    os.makedirs(output_folder)
+    data = get_tar(names)
+    archive_path = os.path.join(dirpath, "sipplauncher.tar.gz")
+    with open(archive_path, "wb") as f:
+        f.write(data)
+    with open(archive_path + ".index", "w") as f:
+        f.write(json.dumps({"test": TEST_NAME, "run_id": "run1", "offset": 0, "length": len(data)}) + "\n")
+
+    with pytest.raises(Exception):
+        extract(archive_path, TEST_NAME, "run1", output_folder)
+    # The same check is done on Python versions without tarfile filters
+    with tarfile.open(fileobj=gzip.GzipFile(fileobj=io.BytesIO(data), mode="rb"), mode="r|") as tar:
+        with pytest.raises(ArchiveException):
+            tar.extractall(output_folder, members=_get_safe_members(tar, output_folder))
+    assert(not os.path.exists(os.path.join(dirpath, "output", "evil")))
+    assert(not os.path.exists(os.path.join(dirpath, "evil")))
+
+    shutil.rmtree(dirpath)
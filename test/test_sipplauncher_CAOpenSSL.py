@@ -9,8 +9,13 @@
 
 import pytest
 import tempfile
+import os
+import shutil
 from OpenSSL import crypto
-from sipplauncher.utils.CAOpenSSL import CAOpenSSL
+from sipplauncher.utils.CAOpenSSL import (CAOpenSSL,
+                                          KeyPool,
+                                          KEY_TYPES,
+                                          KEY_TYPE_EC)
 from sipplauncher.utils.Utils import (cd,
                                       gen_file_struct)
 
@@ -83,3 +88,44 @@ def test():
         ca = CAOpenSSL("ca_cert.pem", "ca_key.pem")
         cert, key = ca.gen_cert_key(CN, "cert")
         verify_cert(cert, "ca_cert.pem")
+
+
+@pytest.mark.parametrize("key_type", KEY_TYPES)
+def test_cache(key_type):
+    """Testing SSL cert caching
+    """
+    dirpath = tempfile.mkdtemp(prefix="sipplauncher_test_CAOpenSSL_")
+    cache = os.path.join(dirpath, "cache")
+
+    with cd(dirpath):
+        ca = CAOpenSSL(key_type=key_type, cache_folder=cache, pool_size=1)
+        cert, key = ca.gen_cert_key(CN, "cert1")
+        # Auto-generated CA should be persisted and reused
+        ca = CAOpenSSL(key_type=key_type, cache_folder=cache, pool_size=1)
+        cached_cert, cached_key = ca.gen_cert_key(CN, "cert2")
+
+        for a, b in [(cert, cached_cert), (key, cached_key)]:
+            with open(a, "r") as f1, open(b, "r") as f2:
+                assert(f1.read() == f2.read())
+
+        with open(key, "r") as f:
+            pkey = crypto.load_privatekey(crypto.FILETYPE_PEM, f.read())
+        assert(pkey.type() == (crypto.TYPE_EC if key_type == KEY_TYPE_EC else crypto.TYPE_RSA))
+
+    shutil.rmtree(dirpath)
+
+def test_key_pool_failure(monkeypatch):
+    """Testing failure of key generation is propagated from the background thread
+    """
+    def fail(key_type):
+        raise Exception("no entropy")
+    generate_key = CAOpenSSL.generate_key
+    monkeypatch.setattr(CAOpenSSL, "generate_key", staticmethod(fail))
+    pool = KeyPool(KEY_TYPE_EC, 2)
+    with pytest.raises(Exception, match="no entropy"):
+        pool.get()
+    # The thread is dead, so keys are generated on demand
+    with pytest.raises(Exception, match="no entropy"):
+        pool.get()
+    monkeypatch.setattr(CAOpenSSL, "generate_key", generate_key)
+    assert(isinstance(pool.get(), crypto.PKey))
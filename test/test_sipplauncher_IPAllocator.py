@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import pytest
+import time
+import ipaddress
+
+import sipplauncher.IPAllocator
+from sipplauncher.IPAllocator import (IPAllocator,
+                                      IPNotAvailable,
+                                      STRATEGY_ROUND_ROBIN,
+                                      STRATEGY_LEAST_LOADED)
+
+@pytest.mark.parametrize(
+    "ranges,trusted,expected", [
+        (["10.0.0.0/24"], False, ["10.0.0.{0}".format(i) for i in range(1, 255)]),
+        (["10.0.0.0/24"], True, ["10.0.0.{0}".format(i) for i in range(1, 255)]),
+        (["10.0.0.0/31"], False, ["10.0.0.0", "10.0.0.1"]),
+        (["10.0.0.10-10.0.0.12", "10.0.1.1/32"], False, ["10.0.0.10", "10.0.0.11", "10.0.0.12", "10.0.1.1"]),
+    ]
+)
+def test_allocate(ranges, trusted, expected):
+    """Testing that every address is handed out exactly once
+    """
+    allocator = IPAllocator([IPAllocator.parse_range(r, 24, trusted) for r in ranges])
+    taken = set(expected[::3])
+    probed = []
+
+    def probe(ips):
+        probed.extend(ips)
+        return taken.intersection(ips)
+
+    leased = []
+    with pytest.raises(IPNotAvailable):
+        while True:
+            ip, prefixlen = allocator.allocate(lambda ip: False, probe)
+            leased.append(str(ip))
+
+    if trusted:
+        assert(not probed)
+        assert(sorted(leased, key=ipaddress.IPv4Address) == expected)
+    else:
+        # Every address is probed in a batch, free ones are re-checked before leasing
+        assert(sorted(set(probed), key=ipaddress.IPv4Address) == expected)
+        assert(len(probed) == len(expected) + len(leased))
+        assert(sorted(leased, key=ipaddress.IPv4Address) == [ip for ip in expected if ip not in taken])
+
+    # Released addresses are reused without probing
+    probed.clear()
+    for ip in leased:
+        allocator.release(ipaddress.IPv4Address(ip))
+    for ip in leased:
+        allocator.allocate(lambda ip: False, probe)
+    assert(not probed)
+
+def test_excluded():
+    """Testing that excluded addresses are not handed out
+    """
+    allocator = IPAllocator([IPAllocator.parse_range("10.0.0.0/30", 24)])
+    ip, prefixlen = allocator.allocate(lambda ip: ip == "10.0.0.1", lambda ips: set())
+    assert(str(ip) == "10.0.0.2")
+    assert(prefixlen == 30)
+    with pytest.raises(IPNotAvailable):
+        allocator.allocate(lambda ip: ip == "10.0.0.1", lambda ips: set())
+
+def test_ipv6():
+    """Testing that IPv6 addresses are picked at random without probing
+    """
+    allocator = IPAllocator([IPAllocator.parse_range("2001:db8::/64", 64)])
+    assert(allocator.version == 6)
+
+    def probe(ips):
+        assert(False)
+
+    leased = set()
+    for i in range(100):
+        ip, prefixlen = allocator.allocate(lambda ip: False, probe)
+        assert(ip in ipaddress.IPv6Network("2001:db8::/64"))
+        assert(prefixlen == 64)
+        leased.add(ip)
+    assert(len(leased) == 100)
+
+    # Small range is exhausted
+    allocator = IPAllocator([IPAllocator.parse_range("2001:db8::1-2001:db8::2", 64)])
+    ips = set(allocator.allocate(lambda ip: False, probe)[0] for i in range(2))
+    assert(ips == {ipaddress.IPv6Address("2001:db8::1"), ipaddress.IPv6Address("2001:db8::2")})
+    with pytest.raises(IPNotAvailable):
+        allocator.allocate(lambda ip: False, probe)
+    allocator.release(ipaddress.IPv6Address("2001:db8::1"))
+    ip, prefixlen = allocator.allocate(lambda ip: False, probe)
+    assert(ip == ipaddress.IPv6Address("2001:db8::1"))
+
+@pytest.mark.parametrize(
+    "strategy", [
+        STRATEGY_ROUND_ROBIN,
+        STRATEGY_LEAST_LOADED,
+    ]
+)
+def test_strategy(strategy):
+    """Testing that addresses are spread across ranges
+    """
+    allocator = IPAllocator([IPAllocator.parse_range(r, 24, True) for r in ["10.0.1.0/24", "10.0.2.0/24", "10.0.3.0/24"]], strategy)
+    ips = [allocator.allocate(lambda ip: False, lambda ips: set())[0] for i in range(6)]
+    assert(allocator.get_stats() == [(2, 2), (2, 2), (2, 2)])
+
+    # Freed range is preferred by the least loaded strategy
+    allocator.release(ips[0])
+    allocator.release(ips[3])
+    ip, prefixlen = allocator.allocate(lambda ip: False, lambda ips: set())
+    if strategy == STRATEGY_LEAST_LOADED:
+        assert(ip in ipaddress.IPv4Network("10.0.1.0/24"))
+        assert(allocator.get_stats() == [(1, 3), (2, 2), (2, 2)])
+    else:
+        assert(allocator.get_stats()[0][1] == 3)
+
+@pytest.mark.parametrize(
+    "value", [
+        "10.0.1.0/24",
+        "2001:db8::/64",
+    ]
+)
+def test_load(value):
+    """Testing that only leased addresses count towards the load of a range
+    """
+    allocator = IPAllocator([IPAllocator.parse_range(value, 24, True)])
+    ip, prefixlen = allocator.allocate(lambda ip: False, lambda ips: set())
+    other, prefixlen = allocator.allocate(lambda ip: False, lambda ips: set())
+    assert(allocator.get_stats() == [(2, 2)])
+    allocator.release(ip)
+    allocator.release(ip)
+    assert(allocator.get_stats() == [(1, 2)])
+    allocator.discard(other)
+    allocator.discard(other)
+    # The address has never been leased
+    allocator.discard(ip)
+    assert(allocator.get_stats() == [(0, 2)])
+
+def test_parse_networks():
+    """Testing that source pool networks cover the range
+    """
+    assert(IPAllocator.parse_networks("10.0.0.0/24") == [ipaddress.IPv4Network("10.0.0.0/24")])
+    assert(IPAllocator.parse_networks("10.0.0.4-10.0.0.8") == [ipaddress.IPv4Network("10.0.0.4/30"),
+                                                                ipaddress.IPv4Network("10.0.0.8/32")])
+
+@pytest.mark.parametrize(
+    "value", [
+        "10.0.0.0/30",
+        "10.0.0.1-10.0.0.2",
+        "2001:db8::1-2001:db8::2",
+    ]
+)
+def test_retry(monkeypatch, value):
+    """Testing that excluded and used addresses are handed out, once they are available again
+    """
+    monkeypatch.setattr(sipplauncher.IPAllocator, "RETRY_INTERVAL", 0.1)
+    allocator = IPAllocator([IPAllocator.parse_range(value, 24)])
+    r = IPAllocator.parse_range(value, 24)
+    first, last = (str(ipaddress.ip_address(r.first + i)) for i in (0, 1))
+    # The first address is assigned elsewhere, the second one is leased by another instance
+    excluded = {first}
+    ip, prefixlen = allocator.allocate(lambda ip: ip in excluded, lambda ips: set())
+    assert(str(ip) == last)
+    allocator.discard(ip)
+    with pytest.raises(IPNotAvailable):
+        allocator.allocate(lambda ip: ip in excluded, lambda ips: set())
+
+    excluded.clear()
+    time.sleep(0.2)
+    leased = {str(allocator.allocate(lambda ip: ip in excluded, lambda ips: set())[0]) for i in range(2)}
+    assert(leased == {first, last})
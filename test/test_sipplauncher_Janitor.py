@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import pytest
+import tempfile
+import os
+import shutil
+import time
+
+from sipplauncher.utils.Utils import gen_file_struct
+from sipplauncher.Janitor import (Janitor,
+                                  write_result_file)
+
+TEST_NAME = "my_test_name"
+RUN_SIZE = 100
+
+@pytest.mark.parametrize(
+    "results,keep_last,max_bytes,expected", [
+        # no limits
+        (
+            [True, False, False],
+            None,
+            None,
+            ["run0", "run1", "run2"],
+        ),
+        # keep last passed
+        (
+            [False, True, False, False],
+            1,
+            None,
+            ["run1", "run3"],
+        ),
+        # size cap evicts the oldest passed first
+        (
+            [False, False, True, False],
+            None,
+            RUN_SIZE * 2 + RUN_SIZE // 2,
+            ["run2", "run3"],
+        ),
+        # failed runs are never evicted, even if the cap is exceeded
+        (
+            [True, True, False],
+            None,
+            RUN_SIZE,
+            ["run0", "run1"],
+        ),
+        # still running test is not touched
+        (
+            [None, False, False],
+            0,
+            None,
+            ["run0"],
+        ),
+    ]
+)
+def test(results, keep_last, max_bytes, expected):
+    """Testing Janitor retention limits
+    """
+    dirpath = tempfile.mkdtemp(prefix="sipplauncher_test_Janitor_")
+    for i, failed in enumerate(results):
+        folder = os.path.join(dirpath, TEST_NAME, "run{0}".format(i))
+        os.makedirs(folder)
+        gen_file_struct(folder, {"sipplauncher.log": "x" * RUN_SIZE})
+        if failed is not None:
+            write_result_file(folder, failed)
+            # Make sure completion times differ
+            t = time.time() - 100 + i
+            os.utime(os.path.join(folder, ".sipplauncher-result"), (t, t))
+
+    # Don't let the background thread interfere: make it sleep for long
+    janitor = Janitor(dirpath, keep_last, max_bytes, period=3600)
+    janitor.cleanup()
+
+    left = sorted(os.listdir(os.path.join(dirpath, TEST_NAME))) if os.path.isdir(os.path.join(dirpath, TEST_NAME)) else []
+    assert(left == expected)
+
+    janitor.stop()
+    shutil.rmtree(dirpath)
+
+def test_instances():
+    """Testing Janitor doesn't evict test runs of other instances, which share the same root
+    """
+    dirpath = tempfile.mkdtemp(prefix="sipplauncher_test_Janitor_")
+    for i, instance_id in enumerate(["a", "b", "a", "b"]):
+        folder = os.path.join(dirpath, TEST_NAME, "run{0}".format(i))
+        os.makedirs(folder)
+        write_result_file(folder, False, instance_id)
+        t = time.time() - 100 + i
+        os.utime(os.path.join(folder, ".sipplauncher-result"), (t, t))
+
+    janitor = Janitor(dirpath, 0, None, period=3600, instance_id="a")
+    janitor.cleanup()
+
+    assert(sorted(os.listdir(os.path.join(dirpath, TEST_NAME))) == ["run1", "run3"])
+
+    janitor.stop()
+    shutil.rmtree(dirpath)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import pytest
+import tempfile
+import os
+import csv
+import struct
+import ipaddress
+import threading
+
+from sipplauncher.PcapWriter import (PcapWriter,
+                                     get_rotated_paths)
+from sipplauncher.LatencyAnalyzer import (LatencyAnalyzer,
+                                          LATENCY_FILE,
+                                          MAX_PENDING_PER_WORKER,
+                                          collect_latencies,
+                                          get_percentiles,
+                                          get_histogram_edges,
+                                          get_histogram,
+                                          get_histogram_percentiles)
+
+DUT_IP = "10.0.0.1"
+UA_IP = "10.0.0.2"
+TEST_NAME = "my_test_name"
+PCAP_NAME = "sipp-test"
+
+def sip(src, dst, start_line, call_id, cseq):
+    payload = "{0}\r\nCall-ID: {1}\r\nCSeq: {2}\r\n\r\n".format(start_line, call_id, cseq).encode()
+    udp = struct.pack("!HHHH", 5060, 5060, 8 + len(payload), 0) + payload
+    return (b"\x00" * 12 + b"\x08\x00" +
+            struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(udp), 0, 0, 64, 17, 0,
+                        ipaddress.ip_address(src).packed, ipaddress.ip_address(dst).packed) +
+            udp)
+
+# (time in ms, frame)
+CALL = [
+    (0, sip(UA_IP, DUT_IP, "INVITE sip:bob@10.0.0.1 SIP/2.0", "call-a", "1 INVITE")),
+    # retransmission
+    (500, sip(UA_IP, DUT_IP, "INVITE sip:bob@10.0.0.1 SIP/2.0", "call-a", "1 INVITE")),
+    (510, sip(DUT_IP, UA_IP, "SIP/2.0 100 Trying", "call-a", "1 INVITE")),
+    (520, sip(DUT_IP, UA_IP, "SIP/2.0 180 Ringing", "call-a", "1 INVITE")),
+    (600, sip(DUT_IP, UA_IP, "SIP/2.0 200 OK", "call-a", "1 INVITE")),
+    # retransmission
+    (1100, sip(DUT_IP, UA_IP, "SIP/2.0 200 OK", "call-a", "1 INVITE")),
+    (1200, sip(UA_IP, DUT_IP, "ACK sip:bob@10.0.0.1 SIP/2.0", "call-a", "1 ACK")),
+    # request from the DUT is not a DUT latency
+    (2000, sip(DUT_IP, UA_IP, "BYE sip:alice@10.0.0.2 SIP/2.0", "call-a", "1 BYE")),
+    (2005, sip(UA_IP, DUT_IP, "SIP/2.0 200 OK", "call-a", "1 BYE")),
+    (3000, sip(UA_IP, DUT_IP, "BYE sip:bob@10.0.0.1 SIP/2.0", "call-a", "2 BYE")),
+    (3030, sip(DUT_IP, UA_IP, "SIP/2.0 200 OK", "call-a", "2 BYE")),
+]
+
+def write_call(folder, rotate_seconds=None):
+    writer = PcapWriter(folder, PCAP_NAME, rotate_seconds=rotate_seconds)
+    for ms, frame in CALL:
+        writer.write(ms // 1000, ms % 1000 * 1000, frame)
+    writer.close()
+
+def test_collect():
+    """Testing requests to the DUT are paired with the first DUT responses of every status code
+    """
+    pytest.importorskip("numpy")
+    folder = tempfile.mkdtemp(prefix="sipplauncher_test_LatencyAnalyzer_")
+    write_call(folder, rotate_seconds=1)
+    paths = [os.path.join(folder, name) for name in ["sipp-test.pcap", "sipp-test_1.pcap", "sipp-test_2.pcap"]]
+    assert(get_rotated_paths(folder, PCAP_NAME) == paths)
+    ret = collect_latencies(paths, DUT_IP)
+    latencies = {k: [round(float(v), 3) for v in values] for k, values in ret.items()}
+    assert(latencies == {
+        "INVITE 100": [0.51],
+        "INVITE 180": [0.52],
+        "INVITE 200": [0.6],
+        "BYE 200": [0.03],
+    })
+
+def test_analyze():
+    """Testing latency percentiles are written to the test run folder, and the folder is released afterwards
+    """
+    pytest.importorskip("numpy")
+    work_folder = tempfile.mkdtemp(prefix="sipplauncher_test_LatencyAnalyzer_")
+    folders = [os.path.join(work_folder, TEST_NAME, run_id) for run_id in ["run1", "run2"]]
+    released = []
+    analyzer = LatencyAnalyzer(DUT_IP, workers=2)
+    for folder in folders:
+        os.makedirs(folder)
+        write_call(folder)
+        # Media files of the test are not analyzed
+        with open(os.path.join(folder, "g711a.pcap"), "wb") as f:
+            f.write(b"garbage")
+        analyzer.submit(TEST_NAME, folder, PCAP_NAME, lambda folder=folder: released.append(folder))
+    analyzer.stop()
+    assert(sorted(released) == folders)
+    for folder in folders:
+        with open(os.path.join(folder, LATENCY_FILE), newline='') as f:
+            rows = {row["transaction"]: row for row in csv.DictReader(f)}
+        assert(sorted(rows) == ["BYE 200", "INVITE 100", "INVITE 180", "INVITE 200"])
+        assert(rows["INVITE 200"]["count"] == "1")
+        assert(float(rows["INVITE 200"]["p50_ms"]) == 600.0)
+
+def test_submit_pending(monkeypatch):
+    """Testing submit() blocks while too many test runs are pending analysis, so their folders don't pile up
+    """
+    pytest.importorskip("numpy")
+    analyzing = threading.Event()
+    monkeypatch.setattr(LatencyAnalyzer, "_analyze", lambda self, test_name, folder, pcap_name: analyzing.wait())
+    released = []
+    analyzer = LatencyAnalyzer(DUT_IP, workers=1)
+    # The first test run is being analyzed, the rest are pending
+    for i in range(1 + MAX_PENDING_PER_WORKER):
+        analyzer.submit(TEST_NAME, str(i), PCAP_NAME, lambda: released.append(True))
+    thread = threading.Thread(target=analyzer.submit, args=(TEST_NAME, "last", PCAP_NAME))
+    thread.start()
+    thread.join(0.5)
+    assert(thread.is_alive())
+    analyzing.set()
+    thread.join()
+    analyzer.stop()
+    assert(len(released) == 1 + MAX_PENDING_PER_WORKER)
+
+def test_collect_calls():
+    """Testing transactions of several interleaved calls are paired separately
+    """
+    pytest.importorskip("numpy")
+    folder = tempfile.mkdtemp(prefix="sipplauncher_test_LatencyAnalyzer_")
+    writer = PcapWriter(folder, PCAP_NAME)
+    for i in range(10):
+        call_id = "call-{0}".format(i)
+        writer.write(i, 0, sip(UA_IP, DUT_IP, "INVITE sip:bob@10.0.0.1 SIP/2.0", call_id, "1 INVITE"))
+        writer.write(i, 1000 * (i + 1), sip(DUT_IP, UA_IP, "SIP/2.0 200 OK", call_id, "1 INVITE"))
+    # Response without a request is not paired
+    writer.write(20, 0, sip(DUT_IP, UA_IP, "SIP/2.0 200 OK", "call-x", "1 INVITE"))
+    writer.close()
+    ret = collect_latencies(get_rotated_paths(folder, PCAP_NAME), DUT_IP)
+    assert(list(ret) == ["INVITE 200"])
+    assert([round(float(v), 3) for v in ret["INVITE 200"]] == [round(0.001 * (i + 1), 3) for i in range(10)])
+
+@pytest.mark.parametrize(
+    "latencies", [
+        [0.0021],
+        [0.001 * i for i in range(1, 1001)],
+        [0.05] * 10 + [2.5] * 90,
+    ]
+)
+def test_histogram(latencies):
+    """Testing percentiles from a histogram are within a bin width of the exact ones
+    """
+    numpy = pytest.importorskip("numpy")
+    latencies = numpy.array(latencies)
+    edges = get_histogram_edges()
+    counts = get_histogram(latencies, edges)
+    # Histograms of several runs are added up
+    counts = counts + get_histogram(latencies, edges)
+    assert(counts.sum() == 2 * len(latencies))
+    for estimated, exact in zip(get_histogram_percentiles(counts, edges), get_percentiles(latencies)):
+        assert(abs(estimated - exact) <= exact * 0.025)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import pytest
+import tempfile
+import shutil
+
+import sipplauncher.Netem
+from sipplauncher.Netem import (parse_profile,
+                                Shaper,
+                                NetemException,
+                                ALL_UAS)
+from sipplauncher.Registry import LeaseRegistry
+
+@pytest.mark.parametrize(
+    "lines,expected", [
+        (
+            ["delay 100ms 20ms loss 1%"],
+            {ALL_UAS: ["delay", "100ms", "20ms", "loss", "1%"]},
+        ),
+        (
+            ["# WAN profile", "", "rate 1mbit", "ua2 delay 300ms"],
+            {ALL_UAS: ["rate", "1mbit"], "ua2": ["delay", "300ms"]},
+        ),
+        (
+            ["delay 10ms", "delay 20ms"],
+            {ALL_UAS: ["delay", "20ms"]},
+        ),
+        (
+            ["ua1"],
+            NetemException(),
+        ),
+    ]
+)
+def test_parse_profile(lines, expected):
+    """Testing parsing of impairment profiles
+    """
+    if isinstance(expected, BaseException):
+        with pytest.raises(type(expected)):
+            parse_profile(lines)
+    else:
+        assert(parse_profile(lines) == expected)
+
+def test_shared_interface(monkeypatch):
+    """Testing only one running instance impairs the traffic on an interface
+    """
+    commands = []
+    monkeypatch.setattr(sipplauncher.Netem, "_tc", lambda *argv: commands.append(argv))
+    dirpath = tempfile.mkdtemp(prefix="sipplauncher_test_Netem_")
+    a = LeaseRegistry(dirpath, "a")
+    b = LeaseRegistry(dirpath, "b")
+    shaper_a = Shaper(a)
+    shaper_b = Shaper(b)
+
+    token = shaper_a.add("eth0", "10.0.0.1", ["delay", "100ms"])
+    assert(commands[0] == ("qdisc", "replace", "dev", "eth0", "root", "handle", "1:", "htb"))
+    with pytest.raises(NetemException):
+        shaper_b.add("eth0", "10.0.0.2", ["delay", "100ms"])
+    # Other interfaces are not affected
+    shaper_b.add("eth1", "10.0.0.2", ["delay", "100ms"])
+
+    # The interface is released, when its root qdisc is removed
+    shaper_a.remove(token)
+    shaper_a.shutdown()
+    assert(("qdisc", "del", "dev", "eth0", "root") in commands)
+    shaper_b.add("eth0", "10.0.0.2", ["delay", "100ms"])
+    shaper_b.shutdown()
+
+    a.close()
+    b.close()
+    shutil.rmtree(dirpath)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import pytest
+import tempfile
+import os
+import struct
+import ipaddress
+
+from sipplauncher.PcapWriter import (PcapWriter,
+                                     classify,
+                                     parse_sip,
+                                     read_index,
+                                     extract,
+                                     REORDER_WINDOW_USEC,
+                                     PROFILE_FULL,
+                                     PROFILE_SIGNALING,
+                                     PROFILE_HEADERS,
+                                     HEADERS_SNAPLEN)
+
+ETH = b"\x00" * 12
+
+def ipv4(src, dst, protocol, payload, flags_fragment=0):
+    return (ETH + b"\x08\x00" +
+            struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(payload), 0, flags_fragment, 64, protocol, 0,
+                        ipaddress.ip_address(src).packed, ipaddress.ip_address(dst).packed) +
+            payload)
+
+def ipv6(src, dst, protocol, payload):
+    return (ETH + b"\x86\xdd" +
+            struct.pack("!IHBB16s16s", 0x60000000, len(payload), protocol, 64,
+                        ipaddress.ip_address(src).packed, ipaddress.ip_address(dst).packed) +
+            payload)
+
+def udp(sport, dport, payload=b""):
+    return struct.pack("!HHHH", sport, dport, 8 + len(payload), 0) + payload
+
+UDP = udp(5060, 5070)
+
+def read_pcap(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    assert(struct.unpack_from("<I", data)[0] == 0xa1b2c3d4)
+    offset = 24
+    ret = []
+    while offset < len(data):
+        sec, usec, incl_len, orig_len = struct.unpack_from("<IIII", data, offset)
+        offset += 16
+        ret.append((sec * 1000000 + usec, data[offset:offset + incl_len], orig_len))
+        offset += incl_len
+    return ret
+
+def test_reorder():
+    """Testing that packets, which arrive slightly out of order, are written in timestamp order
+    """
+    folder = tempfile.mkdtemp(prefix="sipplauncher_test_PcapWriter_")
+    writer = PcapWriter(folder, "sipp-test")
+    timestamps = [10, 30, 20, 40, 35, 50 + REORDER_WINDOW_USEC, 45, 60 + REORDER_WINDOW_USEC * 2]
+    for ts in timestamps:
+        writer.write(ts // 1000000, ts % 1000000, str(ts).encode())
+    writer.close()
+    records = read_pcap(os.path.join(folder, "sipp-test.pcap"))
+    assert([ts for ts, data, length in records] == sorted(timestamps))
+    assert(all(data == str(ts).encode() for ts, data, length in records))
+    assert(writer.packets == len(timestamps))
+
+@pytest.mark.parametrize(
+    "rotate_bytes,rotate_seconds,expected", [
+        (None, None, [10]),
+        # 24 bytes of file header, 16 + 100 bytes per packet
+        (24 + 116 * 3, None, [3, 3, 3, 1]),
+        (None, 4, [4, 4, 2]),
+    ]
+)
+def test_rotate(rotate_bytes, rotate_seconds, expected):
+    """Testing rotation of pcap files by size and by time
+    """
+    folder = tempfile.mkdtemp(prefix="sipplauncher_test_PcapWriter_")
+    writer = PcapWriter(folder, "sipp-test", rotate_bytes, rotate_seconds)
+    for sec in range(10):
+        writer.write(sec, 0, b"x" * 100)
+    writer.close()
+    names = ["sipp-test.pcap"] + ["sipp-test_{0}.pcap".format(i) for i in range(1, len(expected))]
+    assert(sorted(f for f in os.listdir(folder) if f.endswith(".pcap")) == sorted(names))
+    assert([len(read_pcap(os.path.join(folder, name))) for name in names] == expected)
+
+@pytest.mark.parametrize(
+    "frame,expected", [
+        (ipv4("10.0.0.1", "10.0.0.2", 17, UDP), ("10.0.0.1", "10.0.0.2", 5060, 5070)),
+        # ICMP has no ports
+        (ipv4("10.0.0.1", "10.0.0.2", 1, b"\x03\x03\x00\x00"), ("10.0.0.1", "10.0.0.2", None, None)),
+        # not the first fragment
+        (ipv4("10.0.0.1", "10.0.0.2", 17, UDP, flags_fragment=100), ("10.0.0.1", "10.0.0.2", None, None)),
+        # VLAN tagged
+        (ETH + b"\x81\x00\x00\x05" + ipv4("10.0.0.1", "10.0.0.2", 6, UDP)[12:], ("10.0.0.1", "10.0.0.2", 5060, 5070)),
+        (ipv6("2001:db8::1", "2001:db8::2", 17, UDP), ("2001:db8::1", "2001:db8::2", 5060, 5070)),
+        # ARP
+        (ETH + b"\x08\x06" + b"\x00" * 28, None),
+        # truncated
+        (ipv4("10.0.0.1", "10.0.0.2", 17, UDP)[:30], None),
+    ]
+)
+def test_classify(frame, expected):
+    """Testing extraction of addresses and ports from captured frames
+    """
+    ret = classify(frame)
+    if expected is None:
+        assert(ret is None)
+    else:
+        src, dst, sport, dport = expected
+        assert(ret == (ipaddress.ip_address(src).packed, ipaddress.ip_address(dst).packed, sport, dport))
+
+SIP = ipv4("10.0.0.1", "10.0.0.2", 17, udp(5060, 5060, b"x" * 500))
+DNS = ipv4("10.0.0.1", "10.0.0.3", 17, udp(40000, 53, b"x" * 50))
+RTP = ipv4("10.0.0.1", "10.0.0.2", 17, udp(6000, 6002, b"x" * 160))
+FRAGMENT = ipv4("10.0.0.1", "10.0.0.2", 17, b"x" * 500, flags_fragment=100)
+
+@pytest.mark.parametrize(
+    "profile,expected", [
+        (PROFILE_FULL, [SIP, DNS, RTP, FRAGMENT]),
+        (PROFILE_SIGNALING, [SIP, DNS, FRAGMENT]),
+        (PROFILE_HEADERS, [SIP, DNS, RTP[:HEADERS_SNAPLEN], FRAGMENT]),
+    ]
+)
+def test_profile(profile, expected):
+    """Testing that media packets are dropped or truncated according to the capture profile
+    """
+    folder = tempfile.mkdtemp(prefix="sipplauncher_test_PcapWriter_")
+    writer = PcapWriter(folder, "sipp-test", profile=profile, signaling_ports=[5060, 53])
+    frames = [SIP, DNS, RTP, FRAGMENT]
+    for i, frame in enumerate(frames):
+        writer.write(i, 0, frame)
+    writer.close()
+    records = read_pcap(os.path.join(folder, "sipp-test.pcap"))
+    assert([data for ts, data, length in records] == expected)
+    # Original lengths are kept
+    assert([length for ts, data, length in records] == [len(f) for f in frames if any(f.startswith(e) for e in expected)])
+
+@pytest.mark.parametrize(
+    "payload,expected", [
+        (b"INVITE sip:bob@10.0.0.2 SIP/2.0\r\nCall-ID: 1-abc@10.0.0.1\r\nCSeq: 1 INVITE\r\n\r\nv=0", ("1-abc@10.0.0.1", 1, "INVITE", None)),
+        (b"SIP/2.0 180 Ringing\r\ncall-id:1-abc@10.0.0.1\r\nCSeq: 1 INVITE\r\n\r\n", ("1-abc@10.0.0.1", 1, "INVITE", 180)),
+        # compact header form
+        (b"BYE sip:bob@10.0.0.2 SIP/2.0\r\ni: 1-abc@10.0.0.1\r\n\r\n", ("1-abc@10.0.0.1", None, "BYE", None)),
+        # no Call-ID
+        (b"OPTIONS sip:bob@10.0.0.2 SIP/2.0\r\nCSeq: 1 OPTIONS\r\n\r\n", None),
+        # RTP
+        (b"\x80\x00\x00\x01" + b"x" * 160, None),
+    ]
+)
+def test_parse_sip(payload, expected):
+    """Testing extraction of Call-ID, method and status code from SIP messages
+    """
+    assert(parse_sip(payload) == expected)
+
+def sip(call_id, start_line, sport=5060, dport=5060):
+    payload = "{0}\r\nCall-ID: {1}\r\nCSeq: 1 INVITE\r\n\r\n".format(start_line, call_id).encode()
+    return ipv4("10.0.0.1", "10.0.0.2", 17, udp(sport, dport, payload))
+
+def test_index():
+    """Testing that SIP messages are indexed by Call-ID, and packets of a single call are extracted from rotated pcap files
+    """
+    folder = tempfile.mkdtemp(prefix="sipplauncher_test_PcapWriter_")
+    writer = PcapWriter(folder, "sipp-test", rotate_seconds=2, signaling_ports=[5060, 53])
+    frames = [
+        sip("call-a", "INVITE sip:bob@10.0.0.2 SIP/2.0"),
+        sip("call-b", "INVITE sip:bob@10.0.0.2 SIP/2.0"),
+        RTP,
+        sip("call-a", "SIP/2.0 200 OK"),
+        sip("call-b", "SIP/2.0 486 Busy Here"),
+        # not a signaling port
+        sip("call-a", "SIP/2.0 200 OK", 6000, 6002),
+    ]
+    for i, frame in enumerate(frames):
+        writer.write(i, 0, frame)
+    writer.close()
+    pcaps = [os.path.join(folder, name) for name in ["sipp-test.pcap", "sipp-test_1.pcap", "sipp-test_2.pcap"]]
+    entries = [e for pcap in pcaps for e in read_index(pcap)]
+    assert([(e["call_id"], e["method"], e["status"]) for e in entries] ==
+           [("call-a", "INVITE", None), ("call-b", "INVITE", None), ("call-a", "INVITE", 200), ("call-b", "INVITE", 486)])
+    output = os.path.join(folder, "call-a.pcap")
+    assert(extract(pcaps, "call-a", output) == 2)
+    assert([data for ts, data, length in read_pcap(output)] == [frames[0], frames[3]])
+    assert(extract(pcaps, "call-c", output) == 0)
@@ -15,13 +15,20 @@ import shutil
 import logging
 import jinja2
 import shlex
+import stat
+import threading
 import pysipp
 from multiprocessing import Queue
 
+import sipplauncher.PysippProcess
+import sipplauncher.utils.Signals
 from sipplauncher.utils.Utils import gen_file_struct
 from sipplauncher.utils.Init import (generate_parser,
                                      check_and_patch_args)
 from sipplauncher.Test import SIPpTest
+from sipplauncher.Scenario import Scenario
+from sipplauncher.UA import UA
+from sipplauncher.PysippProcess import PysippWorkerPool
 
 DUT_IP = "1.1.1.1"
 TEST_NAME = "my_test_name"
@@ -231,3 +238,138 @@ def test(mocker, mock_fs, args, expected):
     assert(res == expected)
 
     shutil.rmtree(dirpath)
+
+# Logs its launch and the pid of the worker, which has launched it, to "launches" file.
+# Fails for "fail" scenarios, kills the worker for "die" scenarios, succeeds after a second for "slow" scenarios,
+# succeeds immediately otherwise.
+FAKE_SIPP = """#!/bin/sh
+while [ $# -gt 0 ]; do
+    [ "$1" = "-sf" ] && scen="$2"
+    shift
+done
+echo "$scen $PPID" >> launches
+case "$(cat $scen)" in
+    fail) exit 1;;
+    die) kill -9 $PPID;;
+    slow) sleep 1;;
+esac
+exit 0
+"""
+
+@pytest.fixture
+def pool(monkeypatch):
+    bin_folder = tempfile.mkdtemp(prefix="sipplauncher_test_PysippWorkerPool_bin_")
+    sipp = os.path.join(bin_folder, "sipp")
+    with open(sipp, "w") as f:
+        f.write(FAKE_SIPP)
+    os.chmod(sipp, os.stat(sipp).st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", bin_folder + os.pathsep + os.environ["PATH"])
+
+    # Workers are forked from the test process.
+    # There is no log config in the test environment, so the pysipp logger is taken as is.
+    monkeypatch.setattr(sipplauncher.PysippProcess, "_init_logging", pysipp.utils.get_logger)
+    logging.getLogger("pysipp").propagate = 0
+
+    pool = PysippWorkerPool(1)
+    yield pool
+    pool.stop()
+    shutil.rmtree(bin_folder)
+
+def run_job(pool, scenario):
+    """
+    :returns: exit code and pid of the worker, which has run the job
+    :rtype: (int, int)
+    """
+    folder = tempfile.mkdtemp(prefix="sipplauncher_test_PysippWorkerPool_")
+    gen_file_struct(folder, {"uac_ua0.xml": scenario})
+    ua = UA("ua0", "", Scenario("uac_ua0.xml", Scenario.Role.uac), None)
+    ua.ip = "127.0.0.1"
+    ua.port = 5060
+    parsed_args = generate_parser().parse_args(shlex.split("--dut {0}".format(DUT_IP)))
+    parsed_args.sipp_info_file = None
+    ret = pool.run({ua}, folder, parsed_args)
+    with open(os.path.join(folder, "launches")) as f:
+        (scen, pid), = [line.split() for line in f.read().splitlines()]
+    shutil.rmtree(folder)
+    return ret, int(pid)
+
+def run_jobs(pool, scenarios):
+    """
+    Runs the jobs at once.
+
+    :returns: the same as run_job() for every job
+    :rtype: list((int, int))
+    """
+    results = [None] * len(scenarios)
+    def run(i):
+        results[i] = run_job(pool, scenarios[i])
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(scenarios))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+@pytest.mark.parametrize(
+    "scenario,expected", [
+        ("ok", 0),
+        ("fail", 2),
+    ]
+)
+def test_pool_run(pool, scenario, expected):
+    """Testing the exit code of a job is sent back from the worker, and the worker is reused
+    """
+    ret, pid = run_job(pool, scenario)
+    assert(ret == expected)
+    assert(run_job(pool, "ok") == (0, pid))
+
+def test_pool_grow(pool):
+    """Testing one more worker is started, when all the workers are busy, and is kept in the pool
+    """
+    results = run_jobs(pool, ["slow", "slow"])
+    assert([ret for ret, pid in results] == [0, 0])
+    pids = {pid for ret, pid in results}
+    assert(len(pids) == 2)
+    results = run_jobs(pool, ["slow", "slow"])
+    assert({pid for ret, pid in results} == pids)
+
+def test_pool_worker_died(pool):
+    """Testing the exit code of a worker, which has died in the middle of a job, is returned, and the worker is dropped
+    """
+    ret, pid = run_job(pool, "die")
+    assert(ret == -9)
+    ret, new_pid = run_job(pool, "ok")
+    assert(ret == 0)
+    assert(new_pid != pid)
+
+def test_pool_cwd(pool):
+    """Testing the worker returns to its directory after a job, instead of staying in the removed test folder
+    """
+    ret, pid = run_job(pool, "ok")
+    assert(ret == 0)
+    assert(os.readlink("/proc/{0}/cwd".format(pid)) == os.getcwd())
+
+def test_pool_worker_signal(pool, monkeypatch):
+    """Testing the worker, which has caught a signal, is dropped, so the signal doesn't fail the next jobs
+    """
+    # The worker, which is started now, inherits the signal
+    monkeypatch.setattr(sipplauncher.utils.Signals, "last_signal", sipplauncher.utils.Signals.SignalDesc("SIGINT", 2))
+    signal_pool = PysippWorkerPool(1)
+    monkeypatch.setattr(sipplauncher.utils.Signals, "last_signal", None)
+    try:
+        ret, pid = run_job(signal_pool, "ok")
+        assert(ret == 3)
+        ret, new_pid = run_job(signal_pool, "ok")
+        assert(ret == 0)
+        assert(new_pid != pid)
+    finally:
+        signal_pool.stop()
+
+def test_pool_stop(pool):
+    """Testing all the workers exit on stop
+    """
+    pids = {pid for ret, pid in run_jobs(pool, ["slow", "slow"])}
+    pool.stop()
+    for pid in pids:
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import pytest
+import tempfile
+import shutil
+import os
+import multiprocessing
+
+from sipplauncher.Registry import (LeaseRegistry,
+                                   KIND_IP)
+
+IP = "10.0.0.1"
+IP2 = "10.0.0.2"
+
+def _register_and_die(folder, instance_id):
+    # Simulate a crash: leases and the lock file are left behind
+    registry = LeaseRegistry(folder, instance_id)
+    registry.claim(KIND_IP, IP)
+    os._exit(0)
+
+def _claim(folder, instance_id, start, conn):
+    registry = LeaseRegistry(folder, instance_id)
+    start.wait()
+    conn.send(registry.claim(KIND_IP, IP))
+    # Stay alive until all the claimers are done
+    conn.recv()
+    registry.close()
+
+def test_claim():
+    """Testing leases of running instances
+    """
+    dirpath = tempfile.mkdtemp(prefix="sipplauncher_test_Registry_")
+    a = LeaseRegistry(dirpath, "a")
+    b = LeaseRegistry(dirpath, "b")
+
+    with pytest.raises(Exception):
+        LeaseRegistry(dirpath, "a")
+
+    assert(a.claim(KIND_IP, IP))
+    assert(not a.claim(KIND_IP, IP))
+    assert(not b.claim(KIND_IP, IP))
+    assert(b.claim(KIND_IP, IP2))
+
+    a.release(KIND_IP, IP)
+    assert(b.claim(KIND_IP, IP))
+
+    # Closing releases all the leases
+    b.close()
+    assert(not a.is_alive("b"))
+    assert(a.claim(KIND_IP, IP))
+    a.close()
+    shutil.rmtree(dirpath)
+
+def test_dead():
+    """Testing takeover of leases of dead instances
+    """
+    dirpath = tempfile.mkdtemp(prefix="sipplauncher_test_Registry_")
+    p = multiprocessing.get_context("fork").Process(target=_register_and_die, args=(dirpath, "d"))
+    p.start()
+    p.join()
+
+    a = LeaseRegistry(dirpath, "a")
+    assert(not a.is_alive("d"))
+    assert(os.path.exists(os.path.join(dirpath, KIND_IP, IP)))
+    a.cleanup_dead()
+    assert(not os.path.exists(os.path.join(dirpath, KIND_IP, IP)))
+    assert(not os.path.exists(os.path.join(dirpath, "d.lock")))
+
+    p = multiprocessing.get_context("fork").Process(target=_register_and_die, args=(dirpath, "d"))
+    p.start()
+    p.join()
+    assert(a.claim(KIND_IP, IP))
+    a.close()
+    shutil.rmtree(dirpath)
+
+def test_concurrent_claim():
+    """Testing a resource is leased to a single instance out of many concurrent claimers
+    """
+    dirpath = tempfile.mkdtemp(prefix="sipplauncher_test_Registry_")
+    ctx = multiprocessing.get_context("fork")
+    for i in range(10):
+        start = ctx.Event()
+        claimers = []
+        for j in range(4):
+            conn, child_conn = ctx.Pipe()
+            p = ctx.Process(target=_claim, args=(dirpath, "c{0}".format(j), start, child_conn))
+            p.start()
+            claimers.append((p, conn))
+        start.set()
+        assert(sum(conn.recv() for p, conn in claimers) == 1)
+        for p, conn in claimers:
+            conn.send(None)
+            p.join()
+        assert(os.listdir(os.path.join(dirpath, KIND_IP)) == [])
+    shutil.rmtree(dirpath)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import pytest
+import tempfile
+import os
+import stat
+import time
+import shlex
+import shutil
+import logging
+
+from sipplauncher.utils.Utils import gen_file_struct
+from sipplauncher.utils.Init import generate_parser
+from sipplauncher.Scenario import Scenario
+from sipplauncher.UA import UA
+import sipplauncher.SippLauncher
+from sipplauncher.SippLauncher import (SippLauncher,
+                                       get_agents,
+                                       get_argv)
+
+DUT_IP = "1.1.1.1"
+UA_IP = "127.0.0.1"
+
+# Logs its launch to "launches" file.
+# Fails for "fail" scenarios, succeeds for "ok" scenarios, ignores SIGUSR1 for "hang" scenarios,
+# runs until it's stopped otherwise.
+FAKE_SIPP = """#!/bin/sh
+while [ $# -gt 0 ]; do
+    [ "$1" = "-sf" ] && scen="$2"
+    [ "$1" = "-m" ] && calls="$2"
+    shift
+done
+echo "$scen $calls" >> launches
+case "$(cat $scen)" in
+    fail) echo "failed" >&2; exit 1;;
+    ok) exit 0;;
+    hang) trap '' USR1;;
+esac
+exec sleep 30
+"""
+
+def get_args(args):
+    parsed_args = generate_parser().parse_args(shlex.split(args))
+    parsed_args.sipp_info_file = None
+    return parsed_args
+
+def get_uas(filenames, shards=1):
+    uas = {}
+    for filename in sorted(filenames):
+        # [<part ID>_]<role>_<UA name>.xml
+        fields = os.path.splitext(filename)[0].split("_")
+        part_id = fields[0] if len(fields) == 3 else ""
+        role, name = fields[-2:]
+        scen = Scenario(filename, Scenario.Role[role])
+        if name in uas:
+            uas[name].set_scenario(part_id, scen)
+        else:
+            uas[name] = UA(name, part_id, scen, None)
+    uas = sorted(uas.values(), key = lambda x: x.get_name())
+    for ua in uas:
+        ua.shards = shards
+    uas += [ua.get_shard(shard) for shard in range(1, shards) for ua in uas]
+    for i, ua in enumerate(uas):
+        ua.ip = UA_IP
+        ua.port = 5060 + i
+    return uas
+
+@pytest.mark.parametrize(
+    "args,expected", [
+        (
+            "--dut {0} --sipp-transport u1".format(DUT_IP),
+            "-i 127.0.0.1 -p 5060 -t u1 -sf uac_ua0.xml -recv_timeout 5000 -r 1.0 -l 1 -m 1 "
+            "-log_file ./uac_ua0_log_file -screen_file ./uac_ua0_screen_file "
+            "-max_socket {0} -stf uac_ua0_trace.csv -fd 60 "
+            "-trace_err -trace_calldebug -trace_error_codes -trace_msg -trace_logs -trace_screen -trace_stat "
+            "1.1.1.1",
+        ),
+        (
+            "--dut {0} --sipp-transport l1 --sipp-tls-version 1.2 --sipp-max-calls 3".format("::1"),
+            "-i 127.0.0.1 -p 5060 -t l1 -sf uac_ua0.xml -recv_timeout 5000 -r 1.0 -l 1 -m 3 "
+            "-log_file ./uac_ua0_log_file -screen_file ./uac_ua0_screen_file "
+            "-tls_version 1.2 -max_socket {0} -stf uac_ua0_trace.csv -fd 60 "
+            "-trace_err -trace_calldebug -trace_error_codes -trace_msg -trace_logs -trace_screen -trace_stat "
+            "[::1]:5061",
+        ),
+    ]
+)
+def test_argv(args, expected):
+    """Testing SIPp command line is the same as Pysipp renders
+    """
+    import resource
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    parsed_args = get_args(args)
+    (role, kwargs), = get_agents(get_uas(["uac_ua0.xml"]), "", parsed_args, parsed_args.sipp_max_calls, logging.getLogger())
+    assert(role == Scenario.Role.uac)
+    assert(get_argv("sipp", kwargs) == ["sipp"] + shlex.split(expected.format(soft - 1)))
+
+def test_shards():
+    """Testing calls, call rate and concurrent calls limit are split across shards
+    """
+    parsed_args = get_args("--dut {0} --sipp-max-calls 3 --sipp-call-rate 10 --sipp-concurrent-calls-limit 3 --sipp-shards 2".format(DUT_IP))
+    agents = get_agents(get_uas(["uac_ua0.xml"], shards=2), "", parsed_args, parsed_args.sipp_max_calls, logging.getLogger())
+    assert([(kwargs["scen_file"], kwargs["trace_file"], kwargs["local_port"], kwargs["rate"], kwargs["call_count"], kwargs["limit"])
+            for role, kwargs in agents] == [
+        ("uac_ua0.xml", "uac_ua0_trace.csv", 5060, 5.0, 2, 2),
+        ("uac_ua0_shard1.xml", "uac_ua0_shard1_trace.csv", 5061, 5.0, 1, 1),
+    ])
+
+def run(monkeypatch, mock_fs, args):
+    """
+    :returns: exit code and SIPp launches
+    :rtype: (int, list(str))
+    """
+    folder = tempfile.mkdtemp(prefix="sipplauncher_test_SippLauncher_")
+    gen_file_struct(folder, mock_fs)
+    bin_folder = tempfile.mkdtemp(prefix="sipplauncher_test_SippLauncher_bin_")
+    sipp = os.path.join(bin_folder, "sipp")
+    with open(sipp, "w") as f:
+        f.write(FAKE_SIPP)
+    os.chmod(sipp, os.stat(sipp).st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", bin_folder + os.pathsep + os.environ["PATH"])
+
+    parsed_args = get_args("--dut {0} {1}".format(DUT_IP, args))
+    uas = get_uas([filename for filename in mock_fs if "shard" not in filename], parsed_args.sipp_shards)
+    ret = SippLauncher(uas, folder, parsed_args, logging.getLogger()).run()
+    with open(os.path.join(folder, "launches")) as f:
+        launches = f.read().splitlines()
+    shutil.rmtree(folder)
+    shutil.rmtree(bin_folder)
+    return ret, launches
+
+@pytest.mark.parametrize(
+    "mock_fs,expected", [
+        (
+            {
+                "uas_ua0.xml": "ok",
+                "uac_ua1.xml": "ok",
+            },
+            0,
+        ),
+        # the failure of UAC stops UAS, which would run for 30 seconds otherwise
+        (
+            {
+                "uas_ua0.xml": "wait",
+                "uac_ua1.xml": "fail",
+            },
+            2,
+        ),
+    ]
+)
+def test_run(monkeypatch, mock_fs, expected):
+    """Testing SIPp processes are supervised till the first failure
+    """
+    start = time.monotonic()
+    ret, launches = run(monkeypatch, mock_fs, "")
+    assert(ret == expected)
+    assert(launches == ["uas_ua0.xml 1", "uac_ua1.xml 1"])
+    assert(time.monotonic() - start < 10)
+
+@pytest.mark.parametrize(
+    "mock_fs", [
+        {
+            "uas_ua0.xml": "wait",
+            "uac_ua1.xml": "wait",
+        },
+        # SIPp, which doesn't exit on SIGUSR1, is killed
+        {
+            "uas_ua0.xml": "hang",
+            "uac_ua1.xml": "wait",
+        },
+    ]
+)
+def test_timeout(monkeypatch, mock_fs):
+    """Testing SIPp processes are stopped on timeout with the same exit code as Pysipp gives
+    """
+    monkeypatch.setattr(sipplauncher.SippLauncher, "SIPP_TIMEOUT", 1)
+    monkeypatch.setattr(sipplauncher.SippLauncher, "KILL_TIMEOUT", 1)
+    start = time.monotonic()
+    ret, launches = run(monkeypatch, mock_fs, "")
+    assert(ret == 4)
+    assert(launches == ["uas_ua0.xml 1", "uac_ua1.xml 1"])
+    assert(time.monotonic() - start < 10)
+
+@pytest.mark.parametrize(
+    "mock_fs,args,expected", [
+        # UAS is relaunched for every call
+        (
+            {
+                "0_uas_ua0.xml": "ok",
+                "0_uac_ua1.xml": "ok",
+                "1_uac_ua1.xml": "ok",
+            },
+            "--sipp-max-calls 2",
+            (0, ["0_uas_ua0.xml 1", "0_uac_ua1.xml 1", "1_uac_ua1.xml 1"] * 2),
+        ),
+        # UAS is launched once for all the calls
+        (
+            {
+                "0_uas_ua0.xml": "ok",
+                "0_uac_ua1.xml": "ok",
+                "1_uac_ua1.xml": "ok",
+            },
+            "--sipp-max-calls 2 --sipp-persistent-uas",
+            (0, ["0_uas_ua0.xml 2"] + ["0_uac_ua1.xml 1", "1_uac_ua1.xml 1"] * 2),
+        ),
+        # UAS, which has scenarios in several parts, can't be persistent
+        (
+            {
+                "0_uas_ua0.xml": "ok",
+                "1_uas_ua0.xml": "ok",
+                "0_uac_ua1.xml": "ok",
+                "1_uac_ua1.xml": "ok",
+            },
+            "--sipp-max-calls 2 --sipp-persistent-uas",
+            (0, ["0_uas_ua0.xml 1", "0_uac_ua1.xml 1", "1_uas_ua0.xml 1", "1_uac_ua1.xml 1"] * 2),
+        ),
+        # the failure of UAC stops persistent UAS, which would run for 30 seconds otherwise
+        (
+            {
+                "0_uas_ua0.xml": "wait",
+                "0_uac_ua1.xml": "ok",
+                "1_uac_ua1.xml": "fail",
+            },
+            "--sipp-max-calls 2 --sipp-persistent-uas",
+            (2, ["0_uas_ua0.xml 2", "0_uac_ua1.xml 1", "1_uac_ua1.xml 1"]),
+        ),
+        # persistent UAS, which hasn't got all the calls, is stopped -recv_timeout after the last call
+        (
+            {
+                "0_uas_ua0.xml": "wait",
+                "0_uac_ua1.xml": "ok",
+                "1_uac_ua1.xml": "ok",
+            },
+            "--sipp-max-calls 2 --sipp-persistent-uas --sipp-recv-timeout 500",
+            (2, ["0_uas_ua0.xml 2"] + ["0_uac_ua1.xml 1", "1_uac_ua1.xml 1"] * 2),
+        ),
+    ]
+)
+def test_persistent_uas(monkeypatch, mock_fs, args, expected):
+    """Testing UAS of multi-part tests are kept running across calls
+    """
+    start = time.monotonic()
+    assert(run(monkeypatch, mock_fs, args) == expected)
+    assert(time.monotonic() - start < 10)
+
+@pytest.mark.parametrize(
+    "mock_fs,args,expected", [
+        # less calls than shards
+        (
+            {
+                "uas_ua0.xml": "ok",
+                "uac_ua1.xml": "ok",
+                "uas_ua0_shard1.xml": "ok",
+                "uac_ua1_shard1.xml": "ok",
+                "uas_ua0_shard2.xml": "ok",
+                "uac_ua1_shard2.xml": "ok",
+            },
+            "--sipp-max-calls 2 --sipp-shards 3",
+            (0, ["uas_ua0_shard1.xml 1", "uas_ua0.xml 1", "uac_ua1.xml 1", "uac_ua1_shard1.xml 1"]),
+        ),
+        # every shard makes a single call of a multi-part test at once
+        (
+            {
+                "0_uas_ua0.xml": "ok",
+                "0_uac_ua1.xml": "ok",
+                "1_uac_ua1.xml": "ok",
+                "0_uas_ua0_shard1.xml": "ok",
+                "0_uac_ua1_shard1.xml": "ok",
+                "1_uac_ua1_shard1.xml": "ok",
+            },
+            "--sipp-max-calls 3 --sipp-shards 2",
+            (0, ["0_uas_ua0_shard1.xml 1", "0_uas_ua0.xml 1", "0_uac_ua1.xml 1", "0_uac_ua1_shard1.xml 1",
+                 "1_uac_ua1.xml 1", "1_uac_ua1_shard1.xml 1",
+                 "0_uas_ua0.xml 1", "0_uac_ua1.xml 1",
+                 "1_uac_ua1.xml 1"]),
+        ),
+        # the failure of a shard stops other shards
+        (
+            {
+                "uas_ua0.xml": "wait",
+                "uac_ua1.xml": "wait",
+                "uas_ua0_shard1.xml": "wait",
+                "uac_ua1_shard1.xml": "fail",
+            },
+            "--sipp-max-calls 4 --sipp-shards 2",
+            (2, ["uas_ua0_shard1.xml 2", "uas_ua0.xml 2", "uac_ua1.xml 2", "uac_ua1_shard1.xml 2"]),
+        ),
+    ]
+)
+def test_run_shards(monkeypatch, mock_fs, args, expected):
+    """Testing every shard of UAs is run as separate SIPp instances
+    """
+    assert(run(monkeypatch, mock_fs, args) == expected)
@@ -112,6 +112,17 @@ TEST_NAME = "my_test_name"
             "--dut {0}".format(DUT_IP),
             SIPpTest.State.SUCCESS,
         ),
+        (
+            {
+                TEST_NAME: {
+                    "uac_ua0.xml": None,
+                    "before.sh": "exit 0",
+                    "after.sh": "exit 0",
+                },
+            },
+            "--dut {0} --temp-folder-mode link".format(DUT_IP),
+            SIPpTest.State.SUCCESS,
+        ),
         (
             {
                 TEST_NAME: {
@@ -58,6 +58,22 @@ TEST_RUN_ID = sipplauncher.utils.Utils.generate_id(n=6, just_letters=True)
                 "dummy.txt": "{{placeholder1}}",
             },
         ),
+        # UA port test
+        (
+            {
+                TEST_NAME: {
+                    "uac_ua0.xml": "{{ua1.host}}:{{ua1.port}}",
+                    "uas_ua1.xml": "{{ua0.host}}:{{ua0.port}}",
+                    DEFAULT_DNS_FILE: "_sip._udp.example.com.  SRV  [10, 60, {{ua1.port}}, \"ep1.example.com.\"]",
+                },
+            },
+            "--dut {0}".format(DUT_IP),
+            {
+                "uac_ua0.xml": "10.22.22.101:5060",
+                "uas_ua1.xml": "10.22.22.100:5060",
+                DEFAULT_DNS_FILE: "_sip._udp.example.com.  SRV  [10, 60, 5060, \"ep1.example.com.\"]",
+            },
+        ),
         # custom filter test
         (
             {
@@ -280,7 +296,7 @@ def test(mocker, mock_fs, args, expected):
     # The latter generates IP consecutively from UA_IP list.
     # Therefore IP allocation happens not randomly, but in known order.
     # Knowing generated IP addresses beforehand allows us to unit-test the functionality.
-    mocker.patch('sipplauncher.Network.SIPpNetwork.add_random_ip', new=lambda x: next(ip_gen))
+    mocker.patch('sipplauncher.Network.SIPpNetwork.add_random_ips', new=lambda x, count: [next(ip_gen) for i in range(count)])
     mocker.patch('sipplauncher.utils.Utils.generate_id', return_value=TEST_RUN_ID)
 
     parser = generate_parser()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+
+.. moduleauthor:: Zaleos <admin@zaleos.net>
+
+"""
+
+import queue
+import pyroute2
+from socket import AF_INET, AF_INET6
+import sipplauncher.Topology
+from sipplauncher.Topology import Topology
+
+def test_dump():
+    """Testing if cached topology matches the kernel tables
+    """
+    topology = Topology()
+    with pyroute2.IPRoute() as ip_route:
+        ifaces = set(link.get_attr("IFLA_IFNAME") for link in ip_route.get_links() if link["state"] == "up")
+        ips = set(addr.get_attr("IFA_ADDRESS") for family in (AF_INET, AF_INET6) for addr in ip_route.get_addr(family=family))
+        gateways = set(route.get_attr("RTA_GATEWAY") for family in (AF_INET, AF_INET6) for route in ip_route.get_routes(family=family)) - {None}
+    assert(topology.get_interfaces() == ifaces)
+    assert(topology.get_local_ip_addresses() == ips)
+    assert(topology.get_gateways() == gateways)
+
+def test_add_remove():
+    """Testing if our own changes are visible immediately
+    """
+    topology = Topology()
+    topology.get_interfaces()
+    topology.add_address(-1, "192.0.2.254", 32)
+    assert("192.0.2.254" in topology.get_local_ip_addresses())
+    topology.remove_link(-1)
+    assert("192.0.2.254" not in topology.get_local_ip_addresses())
+
+def test_route_interface():
+    """Testing the longest prefix match
+    """
+    topology = Topology()
+    with pyroute2.IPRoute() as ip_route:
+        for route in ip_route.get_routes(family=AF_INET, table=254):
+            gateway = route.get_attr("RTA_GATEWAY")
+            if gateway:
+                ifname = ip_route.get_links(route.get_attr("RTA_OIF"))[0].get_attr("IFLA_IFNAME")
+                assert(topology.get_route_interface(gateway, lambda ifname: False) == ifname)
+                assert(topology.get_route_interface(gateway, lambda name: name == ifname) != ifname)
+
+def test_monitor_failure(monkeypatch):
+    """Testing the cache is re-populated, if a notification can't be processed, and the dump is retried
+    """
+    notifications = queue.Queue()
+    dumps = queue.Queue()
+    # The first dump succeeds, the next one fails
+    results = [True, False]
+
+    class FakeIPRoute(object):
+        def __enter__(self):
+            return self
+        def __exit__(self, *args):
+            pass
+        def bind(self, groups):
+            pass
+        def get(self):
+            return notifications.get()
+        def get_links(self):
+            if not (results.pop(0) if results else True):
+                raise OSError("dump failed")
+            dumps.put(True)
+            return []
+        def get_addr(self, family):
+            return []
+        def get_routes(self, family):
+            return []
+
+    monkeypatch.setattr(pyroute2, "IPRoute", FakeIPRoute)
+    monkeypatch.setattr(sipplauncher.Topology, "DUMP_RETRY_INTERVAL", 0.01)
+    topology = Topology()
+    assert(topology.get_interfaces() == frozenset())
+    dumps.get(timeout=5)
+
+    # The notification can't be applied
+    notifications.put([None])
+    dumps.get(timeout=5)
+    assert(not results)
+    # The monitor thread keeps processing notifications
+    notifications.put([None])
+    dumps.get(timeout=5)
+    assert(topology.get_interfaces() == frozenset())
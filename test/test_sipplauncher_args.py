@@ -18,6 +18,7 @@ from sipplauncher.utils.Utils import (cd,
 from sipplauncher.utils.Init import (generate_parser,
                                      check_and_patch_args)
 from sipplauncher.utils.Defaults import DEFAULT_TESTSUITE
+import sipplauncher.LatencyAnalyzer
 
 DUT_IP = "1.1.1.1"
 
@@ -69,6 +70,144 @@ dzgzpq2UrIxvZ8Q=
             "--dut {0} --testsuite nonexistent".format(DUT_IP),
             SystemExit(),
         ),
+        # IPv6 DUT
+        (
+            {},
+            "--dut 2001:db8::1 --testsuite {0}".format(os.path.abspath(DEFAULT_TESTSUITE)),
+            None,
+        ),
+        # IP range of another IP version
+        (
+            {},
+            "--dut 2001:db8::1 --testsuite {0} --ip-range 10.0.0.0/24".format(os.path.abspath(DEFAULT_TESTSUITE)),
+            SystemExit(),
+        ),
+        # source pools
+        (
+            {},
+            "--dut {0} --testsuite {1} --source-pool 10.0.1.0/24@eth1 --source-pool 10.0.2.1-10.0.2.100@eth2".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            None,
+        ),
+        # source pool without interface
+        (
+            {},
+            "--dut {0} --testsuite {1} --source-pool 10.0.1.0/24".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            SystemExit(),
+        ),
+        # source pools together with IP ranges
+        (
+            {},
+            "--dut {0} --testsuite {1} --source-pool 10.0.1.0/24@eth1 --ip-range 10.0.2.0/24".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            SystemExit(),
+        ),
+        # network impairment
+        (
+            {},
+            "--dut {0} --testsuite {1} --netem 'delay 100ms 20ms loss 1%'".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            None,
+        ),
+        # network impairment of shared IPs
+        (
+            {},
+            "--dut {0} --testsuite {1} --netem 'delay 100ms' --interface-pool-size 2 --ua-ports-per-ip 4".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            SystemExit(),
+        ),
+        # capture backend
+        (
+            {},
+            "--dut {0} --testsuite {1} --capture-backend afpacket".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            None,
+        ),
+        # shared capture backend
+        (
+            {},
+            "--dut {0} --testsuite {1} --capture-backend shared --pcap-rotate-seconds 60".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            None,
+        ),
+        # signaling-only capture
+        (
+            {},
+            "--dut {0} --testsuite {1} --capture-backend shared --capture-profile signaling".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            None,
+        ),
+        # unknown capture profile
+        (
+            {},
+            "--dut {0} --testsuite {1} --capture-profile rtp".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            SystemExit(),
+        ),
+        # no archive workers
+        (
+            {},
+            "--dut {0} --testsuite {1} --leave-temp --archive-folder /tmp --archive-workers 0".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            SystemExit(),
+        ),
+        # retention limits
+        (
+            {},
+            "--dut {0} --testsuite {1} --leave-temp --leave-temp-last 10 --leave-temp-max-bytes 1000000".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            None,
+        ),
+        # negative retention limit
+        (
+            {},
+            "--dut {0} --testsuite {1} --leave-temp --leave-temp-last -1".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            SystemExit(),
+        ),
+        # negative retention size limit
+        (
+            {},
+            "--dut {0} --testsuite {1} --leave-temp --leave-temp-max-bytes -1".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            SystemExit(),
+        ),
+        # latency analysis without pcap
+        (
+            {},
+            "--dut {0} --testsuite {1} --leave-temp --no-pcap --latency-analysis".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            SystemExit(),
+        ),
+        # SIPp worker pool
+        (
+            {},
+            "--dut {0} --testsuite {1} --group 4 --sipp-worker-pool 4".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            None,
+        ),
+        # negative SIPp worker pool
+        (
+            {},
+            "--dut {0} --testsuite {1} --sipp-worker-pool -1".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            SystemExit(),
+        ),
+        # persistent UAS
+        (
+            {},
+            "--dut {0} --testsuite {1} --sipp-max-calls 10 --sipp-persistent-uas".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            None,
+        ),
+        # SIPp shards
+        (
+            {},
+            "--dut {0} --testsuite {1} --sipp-max-calls 10 --sipp-shards 4".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            None,
+        ),
+        # zero SIPp shards
+        (
+            {},
+            "--dut {0} --testsuite {1} --sipp-shards 0".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            SystemExit(),
+        ),
+        # native SIPp launcher
+        (
+            {},
+            "--dut {0} --testsuite {1} --sipp-launcher native".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            None,
+        ),
+        # SIPp worker pool with native SIPp launcher
+        (
+            {},
+            "--dut {0} --testsuite {1} --sipp-launcher native --sipp-worker-pool 4".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE)),
+            SystemExit(),
+        ),
         # auto-generate TLS certificate and key
         (
             {},
@@ -147,3 +286,21 @@ def test(mock_fs, args, expected):
         else:
             parsed_args = parser.parse_args(shlex.split(args))
             check_and_patch_args(parsed_args)
+
+@pytest.mark.parametrize(
+    "numpy,expected", [
+        (object(), None),
+        (None, SystemExit()),
+    ]
+)
+def test_latency_analysis(monkeypatch, numpy, expected):
+    """Testing --latency-analysis is rejected on startup, if numpy package isn't installed
+    """
+    monkeypatch.setattr(sipplauncher.LatencyAnalyzer, "numpy", numpy)
+    parsed_args = generate_parser().parse_args(shlex.split(
+        "--dut {0} --testsuite {1} --leave-temp --latency-analysis".format(DUT_IP, os.path.abspath(DEFAULT_TESTSUITE))))
+    if isinstance(expected, BaseException):
+        with pytest.raises(type(expected)):
+            check_and_patch_args(parsed_args)
+    else:
+        check_and_patch_args(parsed_args)
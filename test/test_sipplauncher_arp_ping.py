@@ -7,7 +7,10 @@
 
 """
 
-from sipplauncher.Network import SIPpNetwork
+import ipaddress
+
+from sipplauncher.Network import arp_prober
+from sipplauncher.Topology import topology
 
 # Issue #64: ARP ping of localhost might work in some cases.
 # And it won't work in another cases.
@@ -18,15 +21,16 @@ from sipplauncher.Network import SIPpNetwork
 #def test_arp_ping_localhost():
 #    """Testing if localhost is ARP-pingable
 #    """
-#    assert(not SIPpNetwork._SIPpNetwork__arp_ping("127.0.0.1"))
+#    assert(not arp_prober.probe(["127.0.0.1"]))
 
 def test_arp_ping_fake_ip():
     """Testing if fake IP is ARP-pingable
     """
-    assert(not SIPpNetwork._SIPpNetwork__arp_ping("1.1.1.1"))
+    assert(not arp_prober.probe(["1.1.1.1"]))
 
 def test_arp_ping_gateways():
-    """Testing if gateways are ARP-pingable
+    """Testing if IPv4 gateways are ARP-pingable
     """
-    for gw in SIPpNetwork._SIPpNetwork__get_gateways():
-        assert(SIPpNetwork._SIPpNetwork__arp_ping(gw))
+    # IPv6 gateways are resolved with NDP, not ARP
+    gateways = [g for g in topology.get_gateways() if ipaddress.ip_address(g).version == 4]
+    assert(arp_prober.probe(gateways) == set(gateways))
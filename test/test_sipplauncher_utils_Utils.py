@@ -205,3 +205,40 @@ def test_check_file_struct():
     pytest.raises(Exception, tmp)
 
     shutil.rmtree(dirpath)
+
+
+def test_link_tree():
+    """Testing link_tree() replicates the folder, and a write in the replica doesn't reach the original folder
+    """
+    mock_fs = {
+        'uac_ua0.xml': '{{ua0.host}}',
+        'audio.pcap': 'rtp',
+        'users.csv': 'alice',
+        'media': {
+            'video.pcap': 'rtp',
+        },
+    }
+
+    dirpath = tempfile.mkdtemp(prefix="sipplauncher_test_utils_Utils_")
+    src = os.path.join(dirpath, 'src')
+    dst = os.path.join(dirpath, 'dst')
+    os.makedirs(src)
+    sipplauncher.utils.Utils.gen_file_struct(src, mock_fs)
+    os.symlink(os.path.join(src, 'media'), os.path.join(src, 'media_link'))
+
+    sipplauncher.utils.Utils.link_tree(src, dst, {'uac_ua0.xml'})
+
+    mock_fs['media_link'] = mock_fs['media']
+    assert sipplauncher.utils.Utils.check_file_struct(dst, mock_fs)
+    # Symlinked folder is replicated, as shutil.copytree() does
+    assert(not os.path.islink(os.path.join(dst, 'media_link')))
+    assert(not os.path.samefile(os.path.join(src, 'uac_ua0.xml'), os.path.join(dst, 'uac_ua0.xml')))
+    assert(not os.path.samefile(os.path.join(src, 'users.csv'), os.path.join(dst, 'users.csv')))
+    assert(not os.path.islink(os.path.join(dst, 'audio.pcap')))
+
+    with open(os.path.join(dst, 'users.csv'), 'w') as f:
+        f.write('bob')
+    with open(os.path.join(src, 'users.csv')) as f:
+        assert(f.read() == 'alice')
+
+    shutil.rmtree(dirpath)